@@ -0,0 +1,201 @@
+from collections import deque
+import asyncio
+import json
+import os
+import re
+import time
+
+# Route classes in priority order: when a slot frees up, queued interactive requests go first
+ROUTE_CLASSES = ("interactive", "read", "bulk")
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "1") == "1"
+# Requests running at once across all classes, per worker; keep it below the threadpool size (40)
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "24"))
+ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "1"))
+_DEFAULTS = {
+    # class: (concurrency, queue depth, queue timeout seconds)
+    "interactive": (16, 64, 5.0),
+    "read": (12, 128, 10.0),
+    "bulk": (2, 8, 30.0),
+}
+LIMITS = {
+    route_class: {
+        "concurrency": int(os.getenv(f"ADMISSION_{route_class.upper()}_CONCURRENCY", str(concurrency))),
+        "queue_depth": int(os.getenv(f"ADMISSION_{route_class.upper()}_QUEUE", str(queue_depth))),
+        "queue_timeout": float(os.getenv(f"ADMISSION_{route_class.upper()}_TIMEOUT", str(timeout))),
+    }
+    for route_class, (concurrency, queue_depth, timeout) in _DEFAULTS.items()
+}
+WAIT_SAMPLES = 1000  # Recent queue waits kept per class for the percentiles
+
+# Probes, metrics and the change feed long-poll (it waits on the event loop, not in a thread)
+EXEMPT_PREFIXES = ("/health", "/ready", "/metrics", "/changes", "/docs", "/openapi.json", "/redoc")
+# Imports, exports, reconciliation and stock-take runs; "*" matches one path segment.
+# Extra routes can be added as "METHOD /path" pairs in ADMISSION_BULK_ROUTES (comma separated).
+BULK_ROUTES = [
+    "POST /stock/items/bulk",
+    "POST /stock/import-csv",
+    "GET /stock/export-csv",
+    "POST /transactions/exports",  # The export runs as a background task, still inside the slot
+    "GET /transactions/exports/*/download",
+    "POST /purchase-orders/matches/reconcile",
+    "POST /stock-takes/",
+    "POST /stock-takes/*/counts",
+    "POST /stock-takes/*/close",
+] + [route.strip() for route in os.getenv("ADMISSION_BULK_ROUTES", "").split(",") if route.strip()]
+
+def _compile(route: str):
+    method, path = route.split(None, 1)
+    pattern = "/".join("[^/]+" if part == "*" else re.escape(part) for part in path.split("/"))
+    return method.upper(), re.compile(pattern + "$")
+
+_BULK_PATTERNS = [_compile(route) for route in BULK_ROUTES]
+
+def classify(method: str, path: str):
+    """Route class of a request, or None when it bypasses admission control"""
+    if path.startswith(EXEMPT_PREFIXES) or method == "OPTIONS":
+        return None
+    for bulk_method, pattern in _BULK_PATTERNS:
+        if method == bulk_method and pattern.match(path):
+            return "bulk"
+    return "read" if method in ("GET", "HEAD") else "interactive"
+
+class Overloaded(Exception):
+    def __init__(self, route_class: str, reason: str):
+        super().__init__(f"Server is busy ({route_class} {reason}); retry shortly")
+        self.route_class = route_class
+        self.reason = reason
+
+class AdmissionController:
+    """Per-class concurrency limits and bounded FIFO queues under one shared cap. Runs on a
+    single event loop, so the bookkeeping needs no locks."""
+
+    def __init__(self, max_concurrency: int = ADMISSION_MAX_CONCURRENCY, limits=None):
+        self.max_concurrency = max_concurrency
+        self.limits = limits or LIMITS
+        self.running = {route_class: 0 for route_class in ROUTE_CLASSES}
+        self.queues = {route_class: deque() for route_class in ROUTE_CLASSES}
+        self.counters = {
+            route_class: {"admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_timeout": 0}
+            for route_class in ROUTE_CLASSES
+        }
+        self.waits = {route_class: deque(maxlen=WAIT_SAMPLES) for route_class in ROUTE_CLASSES}
+        self.max_wait = {route_class: 0.0 for route_class in ROUTE_CLASSES}
+
+    def _can_start(self, route_class: str):
+        return (
+            self.running[route_class] < self.limits[route_class]["concurrency"]
+            and sum(self.running.values()) < self.max_concurrency
+        )
+
+    def _start(self, route_class: str, waited: float):
+        self.running[route_class] += 1
+        self.counters[route_class]["admitted"] += 1
+        self.waits[route_class].append(waited)
+        self.max_wait[route_class] = max(self.max_wait[route_class], waited)
+
+    async def acquire(self, route_class: str):
+        """Wait for a slot; returns the seconds spent queued or raises Overloaded"""
+        queue = self.queues[route_class]
+        if not queue and self._can_start(route_class):
+            self._start(route_class, 0.0)
+            return 0.0
+        limits = self.limits[route_class]
+        if len(queue) >= limits["queue_depth"]:
+            self.counters[route_class]["rejected_queue_full"] += 1
+            raise Overloaded(route_class, "queue full")
+
+        started = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        self.counters[route_class]["queued"] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=limits["queue_timeout"])
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                queue.remove(waiter)
+                self.counters[route_class]["rejected_timeout"] += 1
+                raise Overloaded(route_class, "queue timeout")
+        except BaseException:
+            # Client went away while queued: give back a slot that was handed over meanwhile
+            if waiter.done():
+                self.release(route_class)
+            else:
+                queue.remove(waiter)
+                waiter.cancel()
+            raise
+        waited = time.monotonic() - started
+        self.waits[route_class].append(waited)
+        self.max_wait[route_class] = max(self.max_wait[route_class], waited)
+        return waited
+
+    def release(self, route_class: str):
+        self.running[route_class] -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Hand free slots to queued requests, highest priority class first"""
+        for route_class in ROUTE_CLASSES:
+            queue = self.queues[route_class]
+            while queue and self._can_start(route_class):
+                waiter = queue.popleft()
+                if waiter.done():
+                    continue
+                # Counted as running now so a newcomer cannot take the slot before the waiter wakes
+                self.running[route_class] += 1
+                self.counters[route_class]["admitted"] += 1
+                waiter.set_result(None)
+
+    def stats(self):
+        classes = {}
+        for route_class in ROUTE_CLASSES:
+            waits = sorted(self.waits[route_class])
+            classes[route_class] = {
+                **self.limits[route_class],
+                "running": self.running[route_class],
+                "waiting": len(self.queues[route_class]),
+                **self.counters[route_class],
+                "wait_ms_p50": round(waits[len(waits) // 2] * 1000, 2) if waits else 0.0,
+                "wait_ms_p95": round(waits[int(len(waits) * 0.95)] * 1000, 2) if waits else 0.0,
+                "wait_ms_max": round(self.max_wait[route_class] * 1000, 2),
+            }
+        return {"enabled": ADMISSION_CONTROL, "max_concurrency": self.max_concurrency, "classes": classes}
+
+admission = AdmissionController()
+
+class AdmissionMiddleware:
+    """Queues or rejects (429 with Retry-After) requests beyond their route class's limits, and
+    reports the queue wait in a Server-Timing header"""
+
+    def __init__(self, app, controller: AdmissionController = admission):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        route_class = classify(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if route_class is None:
+            return await self.app(scope, receive, send)
+        try:
+            waited = await self.controller.acquire(route_class)
+        except Overloaded as e:
+            return await self._reject(send, e)
+
+        timing = f"queue;desc={route_class};dur={waited * 1000:.1f}".encode()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                message = dict(message, headers=list(message.get("headers", [])) + [(b"server-timing", timing)])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            self.controller.release(route_class)
+
+    async def _reject(self, send, error: Overloaded):
+        body = json.dumps({"detail": str(error)}).encode()
+        await send({"type": "http.response.start", "status": 429, "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(ADMISSION_RETRY_AFTER_SECONDS).encode()),
+        ]})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,91 @@
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import func, select, insert, delete, literal, DateTime
+from typing import Optional
+from datetime import datetime, timedelta
+from . import models
+import os
+import time
+import pytz
+
+# Transactions older than this many days are moved to the archive table
+ARCHIVE_AFTER_DAYS = int(os.getenv("LEDGER_ARCHIVE_DAYS", "365"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("LEDGER_ARCHIVE_BATCH_SIZE", "1000"))
+
+LEDGER_COLUMNS = ["id", "item_id", "quantity", "action", "purchase_order_id", "requirement_id", "created_at"]
+
+def archive_cutoff(days: int = None):
+    days = ARCHIVE_AFTER_DAYS if days is None else days
+    return datetime.now(pytz.timezone('Asia/Kolkata')) - timedelta(days=days)
+
+def archive_transactions(db: Session, older_than: datetime = None, batch_size: int = None, pause: float = 0.0, max_batches: int = None):
+    """Move transactions created before older_than into the archive, one short DB transaction per batch"""
+    older_than = older_than or archive_cutoff()
+    batch_size = batch_size or ARCHIVE_BATCH_SIZE
+    hot = models.Transaction.__table__
+    cold = models.ArchivedTransaction.__table__
+
+    moved = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        # Oldest rows first: with the primary key walk this stops after batch_size matches
+        ids = [row[0] for row in db.execute(
+            select(hot.c.id).where(hot.c.created_at < older_than).order_by(hot.c.id).limit(batch_size)
+        )]
+        if not ids:
+            break
+
+        archived_at = literal(datetime.now(pytz.timezone('Asia/Kolkata')), DateTime(timezone=True))
+        db.execute(insert(cold).from_select(
+            LEDGER_COLUMNS + ["archived_at"],
+            select(*[hot.c[name] for name in LEDGER_COLUMNS], archived_at).where(hot.c.id.in_(ids))
+        ))
+        db.execute(delete(hot).where(hot.c.id.in_(ids)))
+        db.commit()  # Release the write lock between batches
+
+        moved += len(ids)
+        batches += 1
+        if pause:
+            time.sleep(pause)
+    return moved
+
+def archive_boundary(db: Session):
+    """Newest created_at in the archive, or None when nothing has been archived"""
+    return db.query(func.max(models.ArchivedTransaction.created_at)).scalar()
+
+def _ledger_query(db: Session, model, start_date=None, end_date=None, item_id=None):
+    query = db.query(model).options(
+        joinedload(model.item).joinedload(models.Item.stock),
+        joinedload(model.purchase_order),
+        joinedload(model.requirement)
+    )
+    if start_date:
+        query = query.filter(model.created_at >= start_date)
+    if end_date:
+        query = query.filter(model.created_at <= end_date)
+    if item_id:
+        query = query.filter(model.item_id == item_id)
+    return query
+
+def get_ledger(db: Session, skip: int = 0, limit: int = 100, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, item_id: Optional[int] = None):
+    """Transactions newest first; reaches into the archive only when the date range needs it"""
+    hot = _ledger_query(db, models.Transaction, start_date, end_date, item_id).order_by(
+        models.Transaction.created_at.desc()
+    )
+    include_archive = False
+    if start_date is not None:
+        boundary = archive_boundary(db)
+        include_archive = boundary is not None and _naive(start_date) <= _naive(boundary)
+    if not include_archive:
+        return hot.offset(skip).limit(limit).all()
+
+    # Merge the newest skip+limit rows of each store
+    window = skip + limit
+    cold = _ledger_query(db, models.ArchivedTransaction, start_date, end_date, item_id).order_by(
+        models.ArchivedTransaction.created_at.desc()
+    )
+    rows = hot.limit(window).all() + cold.limit(window).all()
+    rows.sort(key=lambda row: _naive(row.created_at), reverse=True)
+    return rows[skip:skip + limit]
+
+def _naive(value: datetime):
+    return value.replace(tzinfo=None) if value.tzinfo else value
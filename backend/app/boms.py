@@ -0,0 +1,131 @@
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import func, insert, select
+from typing import Dict, List, Optional
+from . import models, schemas, outbox, crud
+
+class BomError(Exception):
+    pass
+
+def get_templates(db: Session, skip: int = 0, limit: int = 100):
+    return db.query(models.BomTemplate).options(selectinload(models.BomTemplate.lines)).order_by(
+        models.BomTemplate.name
+    ).offset(skip).limit(limit).all()
+
+def get_template(db: Session, template_id: int):
+    return db.query(models.BomTemplate).filter(models.BomTemplate.id == template_id).first()
+
+def get_template_by_name(db: Session, name: str):
+    return db.query(models.BomTemplate).filter(func.lower(models.BomTemplate.name) == name.strip().lower()).first()
+
+def _load_lines(db: Session, template_ids):
+    """{template_id: [(item_id, sub_template_id, quantity)]} for the templates and everything nested below them,
+    read one BOM level per query"""
+    lines, pending = {}, set(template_ids)
+    while pending:
+        rows = db.execute(select(
+            models.BomTemplateLine.template_id, models.BomTemplateLine.item_id,
+            models.BomTemplateLine.sub_template_id, models.BomTemplateLine.quantity
+        ).where(models.BomTemplateLine.template_id.in_(sorted(pending)))).all()
+        for template_id in pending:
+            lines.setdefault(template_id, [])
+        for template_id, item_id, sub_template_id, quantity in rows:
+            lines[template_id].append((item_id, sub_template_id, quantity))
+        pending = {row[2] for row in rows if row[2] is not None} - set(lines)
+    return lines
+
+def _flatten(template_id: int, lines, memo: Dict[int, Dict[int, int]], path=()):
+    """Parts needed for one unit of template_id; each sub-assembly is flattened once and reused"""
+    if template_id in memo:
+        return memo[template_id]
+    if template_id in path:
+        raise BomError(f"BOM template {template_id} contains itself")
+    totals: Dict[int, int] = {}
+    for item_id, sub_template_id, quantity in lines.get(template_id, ()):
+        if sub_template_id is None:
+            totals[item_id] = totals.get(item_id, 0) + quantity
+            continue
+        for part_id, part_quantity in _flatten(sub_template_id, lines, memo, path + (template_id,)).items():
+            totals[part_id] = totals.get(part_id, 0) + part_quantity * quantity
+    memo[template_id] = totals
+    return totals
+
+def explode(db: Session, template_id: int, multiplier: int = 1):
+    """{item_id: total quantity} for `multiplier` units of a template, nested sub-assemblies included"""
+    lines = _load_lines(db, [template_id])
+    return {item_id: quantity * multiplier for item_id, quantity in sorted(_flatten(template_id, lines, {}).items())}
+
+def _check_lines(db: Session, lines: List[schemas.BomLineCreate], template_id: Optional[int] = None):
+    for line in lines:
+        if (line.item_id is None) == (line.sub_template_id is None):
+            raise BomError("Each line needs exactly one of item_id and sub_template_id")
+        if line.quantity <= 0:
+            raise BomError("Line quantities must be positive")
+        if template_id is not None and line.sub_template_id == template_id:
+            raise BomError(f"BOM template {template_id} contains itself")
+
+    item_ids = {line.item_id for line in lines if line.item_id is not None}
+    found = {row[0] for row in db.execute(select(models.Item.id).where(models.Item.id.in_(item_ids)))} if item_ids else set()
+    if item_ids - found:
+        raise BomError(f"Items not found: {', '.join(str(item_id) for item_id in sorted(item_ids - found))}")
+    sub_ids = {line.sub_template_id for line in lines if line.sub_template_id is not None}
+    found = {row[0] for row in db.execute(select(models.BomTemplate.id).where(models.BomTemplate.id.in_(sub_ids)))} if sub_ids else set()
+    if sub_ids - found:
+        raise BomError(f"BOM templates not found: {', '.join(str(sub_id) for sub_id in sorted(sub_ids - found))}")
+
+def _replace_lines(db: Session, template: models.BomTemplate, lines: List[schemas.BomLineCreate]):
+    template.lines = [
+        models.BomTemplateLine(item_id=line.item_id, sub_template_id=line.sub_template_id, quantity=line.quantity)
+        for line in lines
+    ]
+    db.flush()
+    # A sub-template that (indirectly) contains this template would make the explosion endless
+    _flatten(template.id, _load_lines(db, [template.id]), {})
+
+def create_template(db: Session, template: schemas.BomTemplateCreate):
+    _check_lines(db, template.lines)
+    db_template = models.BomTemplate(name=template.name.strip(), description=template.description)
+    db.add(db_template)
+    _replace_lines(db, db_template, template.lines)
+    db.commit()
+    db.refresh(db_template)
+    return db_template
+
+def update_template(db: Session, template_id: int, template: schemas.BomTemplateCreate):
+    db_template = get_template(db, template_id)
+    if db_template is None:
+        return None
+    _check_lines(db, template.lines, template_id=template_id)
+    db_template.name = template.name.strip()
+    db_template.description = template.description
+    try:
+        _replace_lines(db, db_template, template.lines)
+    except BomError:
+        db.rollback()
+        raise
+    db.commit()
+    db.refresh(db_template)
+    return db_template
+
+def create_requirement_from_template(db: Session, request: schemas.RequirementFromTemplate):
+    """A requirement holding the exploded parts of `multiplier` units of a template, with the
+    lines inserted in one bulk statement and their quantities reserved in the same transaction"""
+    parts = explode(db, request.template_id, request.multiplier)
+    if not parts:
+        raise BomError("BOM template has no parts")
+
+    db_requirement = models.Requirement(project_name=request.project_name, description=request.description)
+    db.add(db_requirement)
+    db.flush()
+    db.execute(insert(models.RequirementItem), [
+        {"requirement_id": db_requirement.id, "item_id": item_id, "quantity_needed": quantity, "quantity_issued": 0, "ordered": False}
+        for item_id, quantity in parts.items()
+    ])
+    line_ids = db.execute(select(models.RequirementItem.id).where(
+        models.RequirementItem.requirement_id == db_requirement.id
+    )).scalars().all()
+    outbox.record_changes(db, "requirement_items", line_ids, op="insert")
+    crud.adjust_reservations(db, parts)
+
+    db.commit()
+    db.refresh(db_requirement)
+    return db_requirement
@@ -0,0 +1,240 @@
+from sqlalchemy import event, inspect, select, update
+from sqlalchemy.orm import Session, joinedload
+from collections import OrderedDict
+from itertools import chain
+from typing import Iterable, Optional
+from . import models, schemas
+from .database import dialect_insert
+import os
+import threading
+import time
+
+ITEM_CACHE_SIZE = int(os.getenv("ITEM_CACHE_SIZE", "10000"))
+ITEM_CACHE_WARM = os.getenv("ITEM_CACHE_WARM", "0") == "1"
+# How often a worker looks at cache_versions for writes made by other workers
+VERSION_CHECK_SECONDS = float(os.getenv("ITEM_CACHE_VERSION_CHECK_SECONDS", "1.0"))
+# Items are spread over this many version rows so one write only evicts its own bucket
+VERSION_BUCKETS = 64
+
+def _bucket(item_id: int):
+    return item_id % VERSION_BUCKETS
+
+class ItemCache:
+    """Bounded LRU of item snapshots (schemas.Item, including stock) keyed by id, with a code -> id index"""
+
+    def __init__(self, capacity: int = ITEM_CACHE_SIZE):
+        self.capacity = capacity
+        self._items = OrderedDict()
+        self._ids_by_code = {}
+        self._versions = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # Cross-worker invalidation
+    def _sync_versions(self, db: Session):
+        now = time.monotonic()
+        if now - self._checked_at < VERSION_CHECK_SECONDS:
+            return
+        table = models.CacheVersion.__table__
+        rows = db.execute(select(table.c.name, table.c.version).where(table.c.name.like("items:%"))).all()
+        versions = {name: version for name, version in rows}
+        with self._lock:
+            if self._versions is None:
+                self._clear()
+            else:
+                changed = {
+                    int(name.split(":")[1])
+                    for name, version in versions.items()
+                    if self._versions.get(name) != version
+                }
+                if changed:
+                    self._drop([item_id for item_id in self._items if _bucket(item_id) in changed])
+            self._versions = versions
+            self._checked_at = now
+
+    # Local bookkeeping (callers hold the lock)
+    def _store(self, snapshot: schemas.Item):
+        self._drop([snapshot.id])
+        self._items[snapshot.id] = snapshot
+        self._ids_by_code[snapshot.code] = snapshot.id
+        while len(self._items) > self.capacity:
+            _, evicted = self._items.popitem(last=False)
+            self._ids_by_code.pop(evicted.code, None)
+            self.evictions += 1
+
+    def _drop(self, item_ids: Iterable[int]):
+        for item_id in item_ids:
+            snapshot = self._items.pop(item_id, None)
+            if snapshot is not None:
+                self._ids_by_code.pop(snapshot.code, None)
+                self.invalidations += 1
+
+    def _clear(self):
+        self._items.clear()
+        self._ids_by_code.clear()
+
+    def _load(self, db: Session, *criteria):
+        items = db.query(models.Item).options(joinedload(models.Item.stock)).filter(*criteria).all()
+        snapshots = [schemas.Item.model_validate(item) for item in items]
+        with self._lock:
+            for snapshot in snapshots:
+                self._store(snapshot)
+        return snapshots
+
+    # Public API
+    def get_item(self, db: Session, item_id: int) -> Optional[schemas.Item]:
+        self._sync_versions(db)
+        with self._lock:
+            snapshot = self._items.get(item_id)
+            if snapshot is not None:
+                self._items.move_to_end(item_id)
+                self.hits += 1
+                return snapshot
+            self.misses += 1
+        loaded = self._load(db, models.Item.id == item_id)
+        return loaded[0] if loaded else None
+
+    def get_item_by_code(self, db: Session, code: str) -> Optional[schemas.Item]:
+        self._sync_versions(db)
+        with self._lock:
+            item_id = self._ids_by_code.get(code)
+            if item_id is not None:
+                self._items.move_to_end(item_id)
+                self.hits += 1
+                return self._items[item_id]
+            self.misses += 1
+        loaded = self._load(db, models.Item.code == code)
+        return loaded[0] if loaded else None
+
+    def invalidate(self, item_ids: Iterable[int]):
+        with self._lock:
+            self._drop(list(item_ids))
+
+    def warm(self, db: Session):
+        """Preload up to capacity items (most recent first)"""
+        items = db.query(models.Item).options(joinedload(models.Item.stock)).order_by(
+            models.Item.id.desc()
+        ).limit(self.capacity).all()
+        with self._lock:
+            for item in reversed(items):
+                self._store(schemas.Item.model_validate(item))
+        return len(items)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+item_cache = ItemCache()
+
+CODE_VERSION_NAME = "item_codes"
+
+class CodeIndex:
+    """code -> item id, filled lazily and kept apart from the item cache: that one drops an item on
+    every stock movement, while a code only goes stale when an item is recoded or deleted"""
+
+    def __init__(self):
+        self._ids = {}
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _sync_version(self, db: Session):
+        now = time.monotonic()
+        if now - self._checked_at < VERSION_CHECK_SECONDS:
+            return
+        table = models.CacheVersion.__table__
+        version = db.execute(select(table.c.version).where(table.c.name == CODE_VERSION_NAME)).scalar()
+        with self._lock:
+            if version != self._version:
+                self._ids.clear()
+                self._version = version
+            self._checked_at = now
+
+    def resolve(self, db: Session, codes: Iterable[str]):
+        """{code: item_id} for the known codes; codes not in memory are looked up in one query"""
+        self._sync_version(db)
+        codes = set(codes)
+        with self._lock:
+            found = {code: self._ids[code] for code in codes if code in self._ids}
+        missing = codes - found.keys()
+        if missing:
+            loaded = dict(db.execute(select(models.Item.code, models.Item.id).where(models.Item.code.in_(missing))).all())
+            with self._lock:
+                self._ids.update(loaded)
+            found.update(loaded)
+        return found
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+code_index = CodeIndex()
+
+def _bump(db: Session, names):
+    table = models.CacheVersion.__table__
+    stmt = dialect_insert(table)
+    if stmt is not None:
+        stmt = stmt.on_conflict_do_update(index_elements=["name"], set_={"version": table.c.version + 1})
+        db.connection().execute(stmt, [{"name": name, "version": 1} for name in names])
+        return
+    for name in names:
+        if db.connection().execute(update(table).where(table.c.name == name).values(version=table.c.version + 1)).rowcount == 0:
+            db.connection().execute(table.insert().values(name=name, version=1))
+
+def bump_versions(db: Session, item_ids: Iterable[int]):
+    """Advance the version of each touched bucket, inside the caller's transaction"""
+    names = sorted({f"items:{_bucket(item_id)}" for item_id in item_ids})
+    if names:
+        _bump(db, names)
+
+def mark_dirty(db: Session, item_ids: Iterable[int]):
+    """For writes that bypass the ORM (bulk statements): bump versions now, evict locally on commit"""
+    item_ids = set(item_ids)
+    bump_versions(db, item_ids)
+    db.info.setdefault("item_cache_dirty", set()).update(item_ids)
+
+# Write-through invalidation for every ORM write to items and stock
+@event.listens_for(Session, "after_flush")
+def _collect_dirty_items(session, flush_context):
+    touched = set()
+    recoded = False
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, models.Item) and obj.id is not None:
+            touched.add(obj.id)
+            if obj in session.deleted or (obj in session.dirty and inspect(obj).attrs.code.history.has_changes()):
+                recoded = True
+        elif isinstance(obj, models.Stock) and obj.item_id is not None:
+            touched.add(obj.item_id)
+    if touched:
+        bump_versions(session, touched)
+        session.info.setdefault("item_cache_dirty", set()).update(touched)
+    if recoded:
+        _bump(session, [CODE_VERSION_NAME])
+        session.info["item_codes_changed"] = True
+
+@event.listens_for(Session, "after_commit")
+def _evict_committed_items(session):
+    dirty = session.info.pop("item_cache_dirty", None)
+    if dirty:
+        item_cache.invalidate(dirty)
+    if session.info.pop("item_codes_changed", None):
+        code_index.clear()
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_items(session):
+    dirty = session.info.pop("item_cache_dirty", None)
+    if dirty:
+        item_cache.invalidate(dirty)
+    session.info.pop("item_codes_changed", None)
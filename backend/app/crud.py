@@ -1,8 +1,12 @@
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, and_
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import func, and_, case, select, update, text
 from typing import List, Optional
-from datetime import datetime
-from . import models, schemas
+from datetime import datetime, time
+from . import models, schemas, rollups, valuation, archive, numbering, suppliers, matching, sync
+from . import cache  # Registers item cache invalidation on every session
+from . import outbox  # Registers the change feed on every session
+from .database import dialect_insert
+import pytz
 from passlib.context import CryptContext
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -68,9 +72,155 @@ def update_item(db: Session, item_id: int, item: schemas.ItemCreate):
         db.refresh(db_item)
     return db_item
 
+ITEM_UPSERT_COLUMNS = ["name", "description", "make", "model_number", "unit_price", "minimum_stock"]
+ITEM_UPSERT_CHUNK_SIZE = 500
+
+def bulk_upsert_items(db: Session, items: List[schemas.ItemCreate], chunk_size: int = ITEM_UPSERT_CHUNK_SIZE):
+    """Insert or update items by code with INSERT ... ON CONFLICT, creating missing stock rows; one commit per chunk.
+    Created vs updated is what the database reports for this statement, so it holds under concurrent imports."""
+    results = [None] * len(items)
+    # A code repeated in the payload: the last occurrence wins, earlier ones are reported as superseded
+    last_index = {}
+    for index, item in enumerate(items):
+        previous = last_index.get(item.code)
+        if previous is not None:
+            results[previous] = {"index": previous, "code": item.code, "status": "superseded"}
+        last_index[item.code] = index
+    pending = sorted(last_index.values())
+
+    item_table = models.Item.__table__
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        codes = [items[index].code for index in chunk]
+        try:
+            now = datetime.now(pytz.timezone('Asia/Kolkata'))
+            rows = [dict(items[index].model_dump(), created_at=now) for index in chunk]
+
+            # executemany with one cached statement; building a multi-VALUES insert recompiles per chunk.
+            # New codes are inserted first and come back through RETURNING (rows another request created
+            # meanwhile are skipped there), then the remaining rows are upserted as updates.
+            stmt = dialect_insert(item_table)
+            if stmt is not None:
+                created = set(db.execute(
+                    stmt.on_conflict_do_nothing(index_elements=["code"]).returning(item_table.c.code), rows
+                ).scalars())
+                updates = [row for row in rows if row["code"] not in created]
+                if updates:
+                    stmt = dialect_insert(item_table)
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=["code"],
+                        set_={name: stmt.excluded[name] for name in ITEM_UPSERT_COLUMNS}
+                    )
+                    db.connection().execute(stmt, updates)
+            else:
+                existing = {code for (code,) in db.query(models.Item.code).filter(models.Item.code.in_(codes))}
+                created = set(codes) - existing
+                for row in rows:
+                    if row["code"] in existing:
+                        db.connection().execute(item_table.update().where(item_table.c.code == row["code"]).values(
+                            **{name: row[name] for name in ITEM_UPSERT_COLUMNS}
+                        ))
+                    else:
+                        db.connection().execute(item_table.insert().values(**row))
+
+            ids = dict(db.query(models.Item.code, models.Item.id).filter(models.Item.code.in_(codes)))
+            stock_rows = [{"item_id": ids[code], "current_quantity": 0, "last_updated": now} for code in codes if code in created]
+            if stock_rows:
+                stock_stmt = dialect_insert(models.Stock.__table__)
+                if stock_stmt is not None:
+                    db.connection().execute(stock_stmt.on_conflict_do_nothing(index_elements=["item_id"]), stock_rows)
+                else:
+                    db.connection().execute(models.Stock.__table__.insert(), stock_rows)
+
+            cache.mark_dirty(db, ids.values())
+            outbox.record_changes(db, "items", [ids[code] for code in codes if code in created], op="insert")
+            outbox.record_changes(db, "items", [ids[code] for code in codes if code not in created], op="update")
+            outbox.record_changes(db, "stock", [row["item_id"] for row in stock_rows], op="insert")
+            db.commit()
+            for index in chunk:
+                code = items[index].code
+                results[index] = {"index": index, "code": code, "id": ids.get(code), "status": "created" if code in created else "updated"}
+        except Exception as e:
+            db.rollback()
+            for index in chunk:
+                results[index] = {"index": index, "code": items[index].code, "status": "failed", "error": str(e)}
+
+    for result in results:
+        if result["status"] == "superseded":
+            result["id"] = results[last_index[result["code"]]].get("id")
+    return {
+        "created": sum(1 for result in results if result["status"] == "created"),
+        "updated": sum(1 for result in results if result["status"] == "updated"),
+        "superseded": sum(1 for result in results if result["status"] == "superseded"),
+        "failed": sum(1 for result in results if result["status"] == "failed"),
+        "results": results
+    }
+
 # Purchase Order CRUD operations
-def get_purchase_orders(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.PurchaseOrder).offset(skip).limit(limit).all()
+# Eager-load the nested item/stock rows that every PO and requirement payload serializes
+PURCHASE_ORDER_LOAD = (
+    selectinload(models.PurchaseOrder.items).joinedload(models.PurchaseOrderItem.item).joinedload(models.Item.stock),
+    selectinload(models.PurchaseOrder.invoices),
+)
+REQUIREMENT_LOAD = (
+    selectinload(models.Requirement.items).joinedload(models.RequirementItem.item).joinedload(models.Item.stock),
+)
+
+# Indexed columns the PO list can be sorted on ("-name" for descending)
+PURCHASE_ORDER_SORTS = {
+    "id": models.PurchaseOrder.id,
+    "po_number": models.PurchaseOrder.po_number,
+    "created_at": models.PurchaseOrder.created_at,
+    "expected_delivery_date": models.PurchaseOrder.expected_delivery_date,
+    "status": models.PurchaseOrder.status,
+    "supplier_id": models.PurchaseOrder.supplier_id,
+}
+PURCHASE_ORDER_COUNT_CACHE_SIZE = 256
+_purchase_order_counts = {}  # filters -> (purchase_orders version, count)
+
+def _filter_purchase_orders(
+    query,
+    status: Optional[str] = None,
+    supplier_id: Optional[int] = None,
+    overdue: bool = False,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+):
+    """status may list several values separated by commas; overdue means still open with an
+    expected_delivery_date before today (served by the partial open-order index)"""
+    po = models.PurchaseOrder
+    if status:
+        statuses = [value.strip() for value in status.split(",") if value.strip()]
+        query = query.filter(po.status.in_(statuses) if len(statuses) > 1 else po.status == statuses[0])
+    if supplier_id is not None:
+        query = query.filter(po.supplier_id == supplier_id)
+    if overdue:
+        query = query.filter(text(models.OPEN_PURCHASE_ORDER), po.expected_delivery_date < datetime.combine(rollups.local_today(), time.min))
+    if start_date is not None:
+        query = query.filter(po.created_at >= start_date)
+    if end_date is not None:
+        query = query.filter(po.created_at <= end_date)
+    return query
+
+def get_purchase_orders(db: Session, skip: int = 0, limit: int = 100, sort: str = "id", **filters):
+    column = PURCHASE_ORDER_SORTS[sort.lstrip("-")]
+    query = _filter_purchase_orders(db.query(models.PurchaseOrder).options(*PURCHASE_ORDER_LOAD), **filters)
+    order = [column.desc(), models.PurchaseOrder.id.desc()] if sort.startswith("-") else [column, models.PurchaseOrder.id]
+    return query.order_by(*order).offset(skip).limit(limit).all()
+
+def count_purchase_orders(db: Session, **filters):
+    """Total for a PO list filter, recounted only after a purchase order changed (its entity clock
+    moved) or the day rolled over, so paging through a list costs one version lookup per page"""
+    key = (rollups.local_today(),) + tuple(sorted(filters.items()))
+    version = sync.entity_version(db, "purchase_orders")
+    cached = _purchase_order_counts.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    total = _filter_purchase_orders(db.query(func.count(models.PurchaseOrder.id)), **filters).scalar()
+    if len(_purchase_order_counts) >= PURCHASE_ORDER_COUNT_CACHE_SIZE:
+        _purchase_order_counts.clear()
+    _purchase_order_counts[key] = (version, total)
+    return total
 
 def get_purchase_order(db: Session, po_id: int):
     return db.query(models.PurchaseOrder).filter(models.PurchaseOrder.id == po_id).first()
@@ -79,25 +229,28 @@ def create_purchase_order(db: Session, po: schemas.PurchaseOrderCreate):
     # Calculate total amount
     total_amount = sum(item.quantity * item.unit_price for item in po.items)
     
+    # Allocate the PO number before this session takes the write lock
+    po_number = numbering.next_document_number("po")
+    supplier = suppliers.get_or_create_supplier(db, po.supplier_name)
     db_po = models.PurchaseOrder(
-        supplier_name=po.supplier_name,
+        po_number=po_number,
+        supplier_id=supplier.id,
+        supplier_name=supplier.name,
         expected_delivery_date=po.expected_delivery_date,
         total_amount=total_amount
     )
     db.add(db_po)
-    db.commit()
-    db.refresh(db_po)
+    suppliers.record_order(db, supplier.id, total_amount)
     
-    # Create PO items
+    # Create PO items (header and lines are committed together)
     for item in po.items:
         db_po_item = models.PurchaseOrderItem(
-            purchase_order_id=db_po.id,
             item_id=item.item_id,
             quantity=item.quantity,
             unit_price=item.unit_price,
             total_price=item.quantity * item.unit_price
         )
-        db.add(db_po_item)
+        db_po.items.append(db_po_item)
         # Mark related requirement items as ordered
         req_items = db.query(models.RequirementItem).filter(
             models.RequirementItem.item_id == item.item_id,
@@ -107,52 +260,55 @@ def create_purchase_order(db: Session, po: schemas.PurchaseOrderCreate):
         for req_item in req_items:
             req_item.ordered = True
     
+    db.flush()
+    matching.reconcile(db, [db_po.id])
     db.commit()
     db.refresh(db_po)
     return db_po
 
+def _add_invoices(db: Session, po_id: int, invoices: List[schemas.InvoiceCreate] = None):
+    for invoice_data in invoices or []:
+        db_invoice = models.Invoice(
+            purchase_order_id=po_id,
+            invoice_number=invoice_data.invoice_number,
+            invoice_date=invoice_data.invoice_date,
+            amount=invoice_data.amount,
+            description=invoice_data.description
+        )
+        db.add(db_invoice)
+
 def receive_purchase_order(db: Session, po_id: int, invoices: List[schemas.InvoiceCreate] = None):
     db_po = get_purchase_order(db, po_id)
     if not db_po or db_po.status == "Received":
         return None
     
-    db_po.status = "Received"
-    db_po.received_at = datetime.now()
+    # Claim the PO first so a concurrent receipt of the same PO cannot add its stock twice
+    received_at = rollups.local_now()
+    claimed = db.query(models.PurchaseOrder).filter(
+        models.PurchaseOrder.id == po_id,
+        models.PurchaseOrder.status != "Received"
+    ).update({models.PurchaseOrder.status: "Received", models.PurchaseOrder.received_at: received_at}, synchronize_session=False)
+    db.expire(db_po, ["status", "received_at"])
+    if not claimed:
+        db.rollback()
+        return None
+    outbox.record_changes(db, "purchase_orders", [po_id])
     
     # Create invoices if provided
-    if invoices:
-        for invoice_data in invoices:
-            db_invoice = models.Invoice(
-                purchase_order_id=po_id,
-                invoice_number=invoice_data.invoice_number,
-                invoice_date=invoice_data.invoice_date,
-                amount=invoice_data.amount,
-                description=invoice_data.description
-            )
-            db.add(db_invoice)
+    _add_invoices(db, po_id, invoices)
     
-    # Add items to stock and create transactions
+    # Receive whatever is still outstanding on each line, update stock and create transactions
+    received_value = 0.0
     for po_item in db_po.items:
-        # Update stock
-        stock = db.query(models.Stock).filter(models.Stock.item_id == po_item.item_id).first()
-        if stock:
-            stock.current_quantity += po_item.quantity
-        else:
-            stock = models.Stock(item_id=po_item.item_id, current_quantity=po_item.quantity)
-            db.add(stock)
-        
-        # Mark as fully received
-        po_item.received_quantity = po_item.quantity
-        
-        # Create transaction
-        transaction = models.Transaction(
-            item_id=po_item.item_id,
-            quantity=po_item.quantity,
-            action="Purchase",
-            purchase_order_id=po_id
-        )
-        db.add(transaction)
+        quantity = receive_line(db, po_item, po_item.quantity)
+        if quantity <= 0:
+            continue
+        received_value += quantity * po_item.unit_price
+        move_stock(db, po_item.item_id, quantity)
+        record_transaction(db, item_id=po_item.item_id, quantity=quantity, action="Purchase", purchase_order_id=po_id, unit_cost=po_item.unit_price)
     
+    suppliers.record_receipt(db, db_po, received_value, completed=True)
+    matching.reconcile(db, [po_id])
     db.commit()
     db.refresh(db_po)
     return db_po
@@ -164,18 +320,10 @@ def receive_purchase_order_partial(db: Session, po_id: int, received_items: List
         return None
     
     # Create invoices if provided
-    if invoices:
-        for invoice_data in invoices:
-            db_invoice = models.Invoice(
-                purchase_order_id=po_id,
-                invoice_number=invoice_data.invoice_number,
-                invoice_date=invoice_data.invoice_date,
-                amount=invoice_data.amount,
-                description=invoice_data.description
-            )
-            db.add(db_invoice)
+    _add_invoices(db, po_id, invoices)
     
     # Process received items
+    received_value = 0.0
     for received_item in received_items:
         item_id = received_item.get('item_id')
         quantity = received_item.get('quantity', 0)
@@ -192,34 +340,30 @@ def receive_purchase_order_partial(db: Session, po_id: int, received_items: List
         if not po_item:
             continue
             
-        # Check if we can receive this quantity
-        remaining_quantity = po_item.quantity - po_item.received_quantity
-        quantity_to_receive = min(quantity, remaining_quantity)
+        # Receive up to the remaining quantity
+        quantity_to_receive = receive_line(db, po_item, quantity)
         
         if quantity_to_receive <= 0:
             continue
             
-        # Update received quantity
-        po_item.received_quantity += quantity_to_receive
+        received_value += quantity_to_receive * po_item.unit_price
         
         # Update stock
-        stock = db.query(models.Stock).filter(models.Stock.item_id == item_id).first()
-        if stock:
-            stock.current_quantity += quantity_to_receive
-        else:
-            stock = models.Stock(item_id=item_id, current_quantity=quantity_to_receive)
-            db.add(stock)
+        move_stock(db, item_id, quantity_to_receive)
         
         # Create transaction
-        transaction = models.Transaction(
-            item_id=item_id,
-            quantity=quantity_to_receive,
-            action="Purchase",
-            purchase_order_id=po_id
-        )
-        db.add(transaction)
+        record_transaction(db, item_id=item_id, quantity=quantity_to_receive, action="Purchase", purchase_order_id=po_id, unit_cost=po_item.unit_price)
     
-    # Update PO status based on received quantities
+    finish_partial_receipt(db, db_po, received_value)
+    db.commit()
+    db.refresh(db_po)
+    return db_po
+
+def finish_partial_receipt(db: Session, db_po: models.PurchaseOrder, received_value: float):
+    """After lines of a PO were received: move it to Partially Received or Received and update the
+    supplier scorecard and three-way match (caller commits)"""
+    po_id = db_po.id
+    db.expire(db_po, ["status", "received_at"])
     all_items_received = True
     any_items_received = False
     
@@ -229,19 +373,152 @@ def receive_purchase_order_partial(db: Session, po_id: int, received_items: List
         if po_item.received_quantity < po_item.quantity:
             all_items_received = False
     
+    completed = False
     if all_items_received:
-        db_po.status = "Received"
-        db_po.received_at = datetime.now()
-    elif any_items_received:
+        # Only the receipt that completes the PO stamps it (and counts it for the supplier)
+        completed = db.query(models.PurchaseOrder).filter(
+            models.PurchaseOrder.id == po_id,
+            models.PurchaseOrder.status != "Received"
+        ).update({models.PurchaseOrder.status: "Received", models.PurchaseOrder.received_at: rollups.local_now()}, synchronize_session=False) > 0
+        db.expire(db_po, ["status", "received_at"])
+        if completed:
+            outbox.record_changes(db, "purchase_orders", [po_id])
+    elif any_items_received and db_po.status != "Partially Received":
         db_po.status = "Partially Received"
     
-    db.commit()
-    db.refresh(db_po)
-    return db_po
+    suppliers.record_receipt(db, db_po, received_value, completed=completed)
+    matching.reconcile(db, [po_id])
+
+class StockFrozenError(Exception):
+    """A stock write hit an item that is being counted in an open stock-take"""
+
+    def __init__(self, item_id: int):
+        super().__init__(f"Stock for item {item_id} is frozen by an open stock-take")
+        self.item_id = item_id
+
+class StockContentionError(Exception):
+    """A compare-and-set stock write kept losing to concurrent moves of the same item"""
+
+    def __init__(self, item_id: int):
+        super().__init__(f"Stock for item {item_id} is changing too quickly to set; retry")
+        self.item_id = item_id
+
+def _check_not_frozen(db: Session, item_id: int):
+    if db.query(models.Stock.count_session_id).filter(models.Stock.item_id == item_id).scalar() is not None:
+        raise StockFrozenError(item_id)
+
+# Atomic stock and line updates: each is a single conditional UPDATE, so concurrent
+# requests can never lose each other's changes or push a counter past its limit
+def move_stock(db: Session, item_id: int, delta: int):
+    """current_quantity += delta; returns False (changing nothing) when stock would go negative.
+    Raises StockFrozenError while the item is under count."""
+    query = db.query(models.Stock).filter(models.Stock.item_id == item_id, models.Stock.count_session_id.is_(None))
+    if delta < 0:
+        query = query.filter(models.Stock.current_quantity >= -delta)
+    updated = query.update({
+        models.Stock.current_quantity: func.coalesce(models.Stock.current_quantity, 0) + delta,
+        models.Stock.last_updated: rollups.local_now()
+    }, synchronize_session=False)
+    if not updated:
+        _check_not_frozen(db, item_id)
+        if delta < 0:
+            return False
+        db.add(models.Stock(item_id=item_id, current_quantity=delta))
+        db.flush()
+        return True
+    cache.mark_dirty(db, [item_id])
+    outbox.record_changes(db, "stock", [item_id])
+    return True
+
+def move_stock_many(db: Session, deltas: dict):
+    """move_stock for {item_id: delta} with one UPDATE (stock rows are created for items that have
+    none). Returns False when any item would go negative; the caller must then roll back, as the
+    other items have moved. Raises StockFrozenError while one of the items is under count."""
+    deltas = {item_id: delta for item_id, delta in deltas.items() if delta}
+    if not deltas:
+        return True
+    stock = models.Stock.__table__
+    item_ids = sorted(deltas)
+    missing = set(item_ids) - set(db.execute(select(stock.c.item_id).where(stock.c.item_id.in_(item_ids))).scalars())
+    if missing:
+        db.execute(stock.insert(), [{"item_id": item_id, "current_quantity": 0, "reserved_quantity": 0} for item_id in sorted(missing)])
+        outbox.record_changes(db, "stock", missing, op="insert")
+    delta = case(deltas, value=stock.c.item_id, else_=0)
+    updated = db.execute(update(stock).where(
+        stock.c.item_id.in_(item_ids),
+        stock.c.count_session_id.is_(None),
+        func.coalesce(stock.c.current_quantity, 0) + delta >= 0
+    ).values(current_quantity=func.coalesce(stock.c.current_quantity, 0) + delta, last_updated=rollups.local_now())).rowcount
+    if updated != len(item_ids):
+        frozen = db.execute(select(stock.c.item_id).where(stock.c.item_id.in_(item_ids), stock.c.count_session_id.isnot(None)).limit(1)).scalar()
+        if frozen is not None:
+            raise StockFrozenError(frozen)
+        return False
+    cache.mark_dirty(db, item_ids)
+    outbox.record_changes(db, "stock", item_ids)
+    return True
+
+def _increment_line(db: Session, line, column: str, limit_column: str, wanted: int):
+    """Add up to `wanted` to line.<column> without passing line.<limit_column>; returns the amount added"""
+    model = type(line)
+    counter = getattr(model, column)
+    for _ in range(3):
+        amount = min(wanted, (getattr(line, limit_column) or 0) - (getattr(line, column) or 0))
+        if amount <= 0:
+            return 0
+        updated = db.query(model).filter(
+            model.id == line.id,
+            func.coalesce(counter, 0) + amount <= getattr(model, limit_column)
+        ).update({counter: func.coalesce(counter, 0) + amount}, synchronize_session=False)
+        # Re-read the counter: another request may have moved it since it was loaded
+        db.expire(line, [column])
+        if updated:
+            outbox.record_changes(db, model.__tablename__, [line.id])
+            return amount
+    return 0
+
+def receive_line(db: Session, po_item: models.PurchaseOrderItem, quantity: int):
+    return _increment_line(db, po_item, "received_quantity", "quantity", quantity)
+
+def issue_line(db: Session, req_item: models.RequirementItem, quantity: int):
+    return _increment_line(db, req_item, "quantity_issued", "quantity_needed", quantity)
 
 # Requirement CRUD operations
 def get_requirements(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Requirement).offset(skip).limit(limit).all()
+    return db.query(models.Requirement).options(*REQUIREMENT_LOAD).offset(skip).limit(limit).all()
+
+def get_requirement_summaries(db: Session, skip: int = 0, limit: int = 100, status: Optional[str] = None):
+    """Progress per requirement from one GROUP BY over its lines and their stock. A line is short
+    when stock cannot cover its outstanding quantity; a requirement is ready to issue when it is
+    active, has something outstanding and no line is short (the same check as issuing it all)."""
+    line = models.RequirementItem
+    outstanding = line.quantity_needed - line.quantity_issued
+    short = and_(outstanding > 0, func.coalesce(models.Stock.current_quantity, 0) < outstanding)
+    query = db.query(
+        models.Requirement.id,
+        models.Requirement.project_name,
+        models.Requirement.status,
+        models.Requirement.created_at,
+        models.Requirement.completed_at,
+        func.count(line.id).label("lines_total"),
+        func.coalesce(func.sum(case((line.quantity_issued >= line.quantity_needed, 1), else_=0)), 0).label("lines_issued"),
+        func.coalesce(func.sum(line.quantity_needed), 0).label("quantity_needed"),
+        func.coalesce(func.sum(line.quantity_issued), 0).label("quantity_issued"),
+        func.coalesce(func.sum(case((short, 1), else_=0)), 0).label("shortage_count"),
+    ).outerjoin(line, line.requirement_id == models.Requirement.id).outerjoin(
+        models.Stock, models.Stock.item_id == line.item_id
+    )
+    if status:
+        query = query.filter(models.Requirement.status == status)
+    rows = query.group_by(models.Requirement.id).order_by(models.Requirement.id).offset(skip).limit(limit).all()
+    return [
+        {
+            **row._asdict(),
+            "fill_percent": round(100.0 * min(row.quantity_issued, row.quantity_needed) / row.quantity_needed, 1) if row.quantity_needed else 100.0,
+            "ready_to_issue": row.status == "Active" and row.quantity_issued < row.quantity_needed and row.shortage_count == 0,
+        }
+        for row in rows
+    ]
 
 def get_requirement(db: Session, requirement_id: int):
     return db.query(models.Requirement).filter(models.Requirement.id == requirement_id).first()
@@ -252,17 +529,18 @@ def create_requirement(db: Session, requirement: schemas.RequirementCreate):
         description=requirement.description
     )
     db.add(db_requirement)
-    db.commit()
-    db.refresh(db_requirement)
     
-    # Create requirement items
+    # Create requirement items and reserve their quantities (committed together)
+    reservations = {}
     for item in requirement.items:
         db_req_item = models.RequirementItem(
-            requirement_id=db_requirement.id,
             item_id=item.item_id,
-            quantity_needed=item.quantity_needed
+            quantity_needed=item.quantity_needed,
+            quantity_issued=0
         )
-        db.add(db_req_item)
+        db_requirement.items.append(db_req_item)
+        reservations[item.item_id] = reservations.get(item.item_id, 0) + item.quantity_needed
+    adjust_reservations(db, reservations)
     
     db.commit()
     db.refresh(db_requirement)
@@ -279,47 +557,147 @@ def issue_items_for_requirement(db: Session, requirement_id: int):
         if not stock or stock.current_quantity < (req_item.quantity_needed - req_item.quantity_issued):
             return None  # Not enough stock
     
-    # Issue items
+    # Issue items; the stock check is repeated atomically in case stock moved since it was read
     for req_item in db_requirement.items:
-        stock = db.query(models.Stock).filter(models.Stock.item_id == req_item.item_id).first()
-        quantity_to_issue = req_item.quantity_needed - req_item.quantity_issued
+        quantity_to_issue = issue_line(db, req_item, req_item.quantity_needed)
         
         if quantity_to_issue > 0:
-            stock.current_quantity -= quantity_to_issue
-            req_item.quantity_issued += quantity_to_issue
+            if not move_stock(db, req_item.item_id, -quantity_to_issue):
+                db.rollback()
+                return None  # Not enough stock
+            # Issuing consumes the reservation
+            if db_requirement.status == "Active":
+                adjust_reservations(db, {req_item.item_id: -quantity_to_issue})
             
             # Create transaction
-            transaction = models.Transaction(
-                item_id=req_item.item_id,
-                quantity=quantity_to_issue,
-                action="Issue",
-                requirement_id=requirement_id
-            )
-            db.add(transaction)
+            record_transaction(db, item_id=req_item.item_id, quantity=quantity_to_issue, action="Issue", requirement_id=requirement_id)
     
     # Check if requirement is complete
     all_issued = all(req_item.quantity_issued >= req_item.quantity_needed for req_item in db_requirement.items)
     if all_issued:
         db_requirement.status = "Completed"
-        db_requirement.completed_at = datetime.now()
+        db_requirement.completed_at = rollups.local_now()
     
     db.commit()
     db.refresh(db_requirement)
     return db_requirement
 
+def issue_requirement_item(db: Session, req_item: models.RequirementItem):
+    """Issue the outstanding quantity of one requirement line; returns the quantity issued, or None when stock is short"""
+    quantity_to_issue = issue_line(db, req_item, req_item.quantity_needed)
+    if quantity_to_issue <= 0:
+        return 0
+    if not move_stock(db, req_item.item_id, -quantity_to_issue):
+        db.rollback()
+        return None
+    # Issuing consumes the reservation while the requirement is active
+    if req_item.requirement.status == "Active":
+        adjust_reservations(db, {req_item.item_id: -quantity_to_issue})
+    record_transaction(db, item_id=req_item.item_id, quantity=quantity_to_issue, action="Issue", requirement_id=req_item.requirement_id)
+    return quantity_to_issue
+
+# Reservation operations
+def adjust_reservations(db: Session, deltas: dict):
+    """Move Stock.reserved_quantity by {item_id: delta} with atomic UPDATEs in the caller's transaction"""
+    deltas = {item_id: delta for item_id, delta in deltas.items() if delta}
+    for item_id, delta in deltas.items():
+        db.query(models.Stock).filter(models.Stock.item_id == item_id).update(
+            {models.Stock.reserved_quantity: func.coalesce(models.Stock.reserved_quantity, 0) + delta},
+            synchronize_session=False
+        )
+    cache.mark_dirty(db, deltas.keys())
+    outbox.record_changes(db, "stock", deltas.keys())
+
+def outstanding_by_item(db: Session, requirement_id: int):
+    rows = db.query(
+        models.RequirementItem.item_id,
+        func.sum(models.RequirementItem.quantity_needed - models.RequirementItem.quantity_issued)
+    ).filter(
+        models.RequirementItem.requirement_id == requirement_id,
+        models.RequirementItem.quantity_needed > models.RequirementItem.quantity_issued
+    ).group_by(models.RequirementItem.item_id).all()
+    return {item_id: outstanding for item_id, outstanding in rows}
+
+def set_requirement_status(db: Session, db_requirement: models.Requirement, status: str):
+    """Change status, releasing the reservation when a requirement leaves Active and re-reserving when it returns"""
+    was_active = db_requirement.status == "Active"
+    is_active = status == "Active"
+    if was_active != is_active:
+        outstanding = outstanding_by_item(db, db_requirement.id)
+        sign = 1 if is_active else -1
+        adjust_reservations(db, {item_id: sign * quantity for item_id, quantity in outstanding.items()})
+    db_requirement.status = status
+    if status == "Completed":
+        db_requirement.completed_at = datetime.now()
+
+def reserved_quantity_by_item():
+    """Correlated subquery: outstanding quantity of active requirements for stock.item_id"""
+    return select(
+        func.coalesce(func.sum(models.RequirementItem.quantity_needed - models.RequirementItem.quantity_issued), 0)
+    ).join(
+        models.Requirement, models.Requirement.id == models.RequirementItem.requirement_id
+    ).where(
+        models.Requirement.status == "Active",
+        models.RequirementItem.item_id == models.Stock.item_id,
+        models.RequirementItem.quantity_needed > models.RequirementItem.quantity_issued
+    ).correlate(models.Stock).scalar_subquery()
+
+def rebuild_reservations(bind):
+    """Recompute every Stock.reserved_quantity from active requirements (bind: Session or Connection)"""
+    bind.execute(update(models.Stock).values(reserved_quantity=reserved_quantity_by_item()))
+
+def get_available_to_promise(db: Session, skip: int = 0, limit: int = 100, item_id: Optional[int] = None, only_short: bool = False):
+    available = func.coalesce(models.Stock.current_quantity, 0) - func.coalesce(models.Stock.reserved_quantity, 0)
+    query = db.query(
+        models.Stock.item_id,
+        models.Item.code,
+        models.Item.name,
+        models.Stock.current_quantity,
+        models.Stock.reserved_quantity,
+        available.label("available_quantity")
+    ).join(models.Item, models.Item.id == models.Stock.item_id)
+    if item_id is not None:
+        query = query.filter(models.Stock.item_id == item_id)
+    if only_short:
+        query = query.filter(available < 0)
+    return [row._asdict() for row in query.order_by(models.Stock.item_id).offset(skip).limit(limit).all()]
+
 # Stock CRUD operations
 def get_stock(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Stock).offset(skip).limit(limit).all()
+    return db.query(models.Stock).options(
+        joinedload(models.Stock.item).joinedload(models.Item.stock)
+    ).offset(skip).limit(limit).all()
 
 def get_stock_by_item(db: Session, item_id: int):
     return db.query(models.Stock).filter(models.Stock.item_id == item_id).first()
 
 def update_stock(db: Session, item_id: int, quantity: int):
+    """Set the counted quantity and book the difference as an Adjustment so stock stays equal to the ledger.
+    Returns None when the item has no stock; raises StockContentionError when the stock keeps moving."""
     stock = get_stock_by_item(db, item_id)
-    if stock:
-        stock.current_quantity = quantity
-        db.commit()
-        db.refresh(stock)
+    if not stock:
+        return None
+    for _ in range(3):
+        previous = stock.current_quantity or 0
+        # Compare-and-set: retry if another request moved the stock since it was read
+        updated = db.query(models.Stock).filter(
+            models.Stock.item_id == item_id,
+            models.Stock.count_session_id.is_(None),
+            func.coalesce(models.Stock.current_quantity, 0) == previous
+        ).update({models.Stock.current_quantity: quantity, models.Stock.last_updated: rollups.local_now()}, synchronize_session=False)
+        db.expire(stock)
+        if updated:
+            break
+        _check_not_frozen(db, item_id)
+    else:
+        db.rollback()
+        raise StockContentionError(item_id)
+    cache.mark_dirty(db, [item_id])
+    outbox.record_changes(db, "stock", [item_id])
+    if quantity != previous:
+        record_transaction(db, item_id=item_id, quantity=quantity - previous, action="Adjustment")
+    db.commit()
+    db.refresh(stock)
     return stock
 
 # Invoice CRUD operations
@@ -338,6 +716,7 @@ def create_invoice(db: Session, invoice: schemas.InvoiceCreate, po_id: int):
         **invoice.dict()
     )
     db.add(db_invoice)
+    matching.reconcile(db, [po_id])
     db.commit()
     db.refresh(db_invoice)
     return db_invoice
@@ -347,6 +726,7 @@ def update_invoice(db: Session, invoice_id: int, invoice: schemas.InvoiceCreate)
     if db_invoice:
         for key, value in invoice.dict().items():
             setattr(db_invoice, key, value)
+        matching.reconcile(db, [db_invoice.purchase_order_id])
         db.commit()
         db.refresh(db_invoice)
     return db_invoice
@@ -355,20 +735,45 @@ def delete_invoice(db: Session, invoice_id: int):
     db_invoice = get_invoice(db, invoice_id)
     if db_invoice:
         db.delete(db_invoice)
+        matching.reconcile(db, [db_invoice.purchase_order_id])
         db.commit()
     return db_invoice
 
 # Transaction CRUD operations
-def get_transactions(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(models.Transaction).options(
-        joinedload(models.Transaction.item),
-        joinedload(models.Transaction.purchase_order),
-        joinedload(models.Transaction.requirement)
-    ).order_by(models.Transaction.created_at.desc()).offset(skip).limit(limit).all()
+def get_transactions(db: Session, skip: int = 0, limit: int = 100, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, item_id: Optional[int] = None):
+    return archive.get_ledger(db, skip=skip, limit=limit, start_date=start_date, end_date=end_date, item_id=item_id)
+
+def record_transaction(db: Session, item_id: int, quantity: int, action: str, purchase_order_id: int = None, requirement_id: int = None, unit_cost: float = None):
+    """Add a ledger entry and keep the daily movement rollup and cost layers in step (caller commits)"""
+    created_at = rollups.local_now()
+    db_transaction = models.Transaction(
+        item_id=item_id,
+        quantity=quantity,
+        action=action,
+        purchase_order_id=purchase_order_id,
+        requirement_id=requirement_id,
+        created_at=created_at
+    )
+    db.add(db_transaction)
+    rollups.record_movement(db, item_id=item_id, quantity=quantity, action=action, day=created_at.date())
+    
+    # Cost layers: receipts add a layer, issues consume them
+    if action == "Purchase":
+        valuation.add_layer(db, item_id=item_id, quantity=quantity, unit_cost=unit_cost, purchase_order_id=purchase_order_id)
+    elif action == "Return":
+        valuation.add_layer(db, item_id=item_id, quantity=quantity, unit_cost=unit_cost if unit_cost is not None else valuation.current_average_cost(db, item_id))
+    elif action == "Issue":
+        valuation.consume(db, item_id=item_id, quantity=quantity)
+    elif action == "Adjustment":
+        # Signed quantity: stock found on hand is valued at the average cost, missing stock is consumed
+        if quantity > 0:
+            valuation.add_layer(db, item_id=item_id, quantity=quantity, unit_cost=unit_cost if unit_cost is not None else valuation.current_average_cost(db, item_id))
+        else:
+            valuation.consume(db, item_id=item_id, quantity=-quantity)
+    return db_transaction
 
 def create_transaction(db: Session, transaction: schemas.TransactionCreate):
-    db_transaction = models.Transaction(**transaction.dict())
-    db.add(db_transaction)
+    db_transaction = record_transaction(db, **transaction.dict())
     db.commit()
     db.refresh(db_transaction)
     return db_transaction
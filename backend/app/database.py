@@ -1,27 +1,81 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from starlette.requests import Request
 import os
 
 # Database URL - using SQLite for development
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./inventory.db")
 
-# Create SQLAlchemy engine
-engine = create_engine(
-    DATABASE_URL, 
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
-)
+# Reads can go to a replica; by default they use DATABASE_URL through read-only connections
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL") or DATABASE_URL
+# Writers get a small dedicated pool so reports cannot starve them of connections
+WRITE_POOL_SIZE = int(os.getenv("DB_WRITE_POOL_SIZE", "5"))
+READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "10"))
+# WAL lets SQLite readers and the writer run at the same time instead of blocking each other
+SQLITE_WAL = os.getenv("SQLITE_WAL", "0") == "1"
 
-# Create SessionLocal class
+def _engine_options(url: str, pool_size: int):
+    options = {"connect_args": {"check_same_thread": False} if url.startswith("sqlite") else {}}
+    if url not in ("sqlite://", "sqlite:///:memory:"):  # In-memory SQLite is one connection per thread
+        options.update(pool_size=pool_size, max_overflow=pool_size)
+    return options
+
+# Create SQLAlchemy engines
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL, WRITE_POOL_SIZE))
+read_engine = create_engine(READ_DATABASE_URL, **_engine_options(READ_DATABASE_URL, READ_POOL_SIZE))
+
+if SQLITE_WAL and engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def use_wal(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA journal_mode=WAL")
+
+@event.listens_for(read_engine, "connect")
+def make_read_only(dbapi_connection, connection_record):
+    """A GET route that tries to write fails instead of taking the write lock"""
+    cursor = dbapi_connection.cursor()
+    if read_engine.dialect.name == "sqlite":
+        cursor.execute("PRAGMA query_only = ON")
+    elif read_engine.dialect.name == "postgresql":
+        cursor.execute("SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY")
+    cursor.close()
+
+# Optional separate SQLite file for archived ledger rows, attached to every connection as "archive"
+ARCHIVE_DATABASE_PATH = os.getenv("LEDGER_ARCHIVE_PATH")
+ARCHIVE_SCHEMA = "archive" if ARCHIVE_DATABASE_PATH and DATABASE_URL.startswith("sqlite") else None
+
+def attach_archive_database(dbapi_connection, connection_record):
+    dbapi_connection.execute("ATTACH DATABASE ? AS archive", (ARCHIVE_DATABASE_PATH,))
+
+if ARCHIVE_SCHEMA:
+    event.listen(engine, "connect", attach_archive_database)
+    if READ_DATABASE_URL.startswith("sqlite"):
+        event.listen(read_engine, "connect", attach_archive_database)
+
+# Create session classes: SessionLocal for writes, ReadSessionLocal for reads
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 # Create Base class
 Base = declarative_base()
 
-# Dependency to get database session
-def get_db():
-    db = SessionLocal()
+def dialect_insert(model):
+    """Return an INSERT construct that supports ON CONFLICT for the active dialect, or None"""
+    if engine.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+    return insert(model)
+
+READ_METHODS = {"GET", "HEAD"}
+
+# Dependency to get database session: GET routes read through the read-only pool
+def get_db(request: Request):
+    db = ReadSessionLocal() if request.method in READ_METHODS else SessionLocal()
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+ 
\ No newline at end of file
@@ -0,0 +1,162 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import select
+from typing import List, Optional
+from datetime import datetime
+from . import models
+from .database import SessionLocal, ReadSessionLocal
+import json
+import os
+import pytz
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", "./exports")
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "50000"))
+EXPORT_FORMATS = {"parquet": ".parquet", "xlsx": ".xlsx"}
+# Excel's row limit per sheet (header included); longer exports continue on another sheet
+XLSX_MAX_ROWS = 1048576
+
+EXPORT_COLUMNS = [
+    "transaction_id", "created_at", "action", "quantity",
+    "item_id", "item_code", "item_name",
+    "purchase_order_id", "po_number", "requirement_id", "project_name",
+]
+
+class ExportDependencyError(Exception):
+    pass
+
+def check_format(export_format: str):
+    """Fail early (before a job is queued) when the writer for a format is not installed"""
+    try:
+        if export_format == "parquet":
+            import pyarrow  # noqa: F401
+            import pandas  # noqa: F401
+        elif export_format == "xlsx":
+            import openpyxl  # noqa: F401
+    except ImportError as e:
+        raise ExportDependencyError(f"{export_format} export needs the '{e.name}' package installed")
+
+def _ledger_select(model, start_date=None, end_date=None, item_ids=None):
+    """Ledger rows joined to item code/name, PO number and project name"""
+    query = select(
+        model.id, model.created_at, model.action, model.quantity,
+        model.item_id, models.Item.code, models.Item.name,
+        model.purchase_order_id, models.PurchaseOrder.po_number,
+        model.requirement_id, models.Requirement.project_name
+    ).select_from(model).outerjoin(
+        models.Item, models.Item.id == model.item_id
+    ).outerjoin(
+        models.PurchaseOrder, models.PurchaseOrder.id == model.purchase_order_id
+    ).outerjoin(
+        models.Requirement, models.Requirement.id == model.requirement_id
+    )
+    if start_date:
+        query = query.where(model.created_at >= start_date)
+    if end_date:
+        query = query.where(model.created_at <= end_date)
+    if item_ids:
+        query = query.where(model.item_id.in_(item_ids))
+    return query
+
+def iter_ledger_chunks(db: Session, start_date=None, end_date=None, item_ids=None, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """Yield lists of ledger rows (archive first, then hot), keyset-paginated by id so memory stays bounded.
+    The transaction is ended after each chunk, so no connection or snapshot is held while a chunk is written."""
+    for model in (models.ArchivedTransaction, models.Transaction):
+        last_id = 0
+        while True:
+            rows = db.execute(
+                _ledger_select(model, start_date, end_date, item_ids).where(model.id > last_id).order_by(model.id).limit(chunk_size)
+            ).all()
+            db.commit()
+            if not rows:
+                break
+            yield [tuple(row) for row in rows]
+            last_id = rows[-1][0]
+
+def _write_parquet(path, chunks):
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("transaction_id", pa.int64()), ("created_at", pa.timestamp("us")), ("action", pa.string()), ("quantity", pa.int64()),
+        ("item_id", pa.int64()), ("item_code", pa.string()), ("item_name", pa.string()),
+        ("purchase_order_id", pa.int64()), ("po_number", pa.string()), ("requirement_id", pa.int64()), ("project_name", pa.string()),
+    ])
+    rows_written = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            frame = pd.DataFrame.from_records(chunk, columns=EXPORT_COLUMNS)
+            frame["created_at"] = pd.to_datetime(frame["created_at"]).dt.tz_localize(None)
+            for column in ("item_id", "purchase_order_id", "requirement_id"):
+                frame[column] = frame[column].astype("Int64")
+            writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+            rows_written += len(chunk)
+    return rows_written
+
+def _write_xlsx(path, chunks, max_rows: int = XLSX_MAX_ROWS):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet, sheet_rows, sheets = None, max_rows, 0
+    rows_written = 0
+    for chunk in chunks:
+        for row in chunk:
+            if sheet_rows >= max_rows:
+                sheets += 1
+                sheet = workbook.create_sheet("transactions" if sheets == 1 else f"transactions_{sheets}")
+                sheet.append(EXPORT_COLUMNS)
+                sheet_rows = 1
+            created_at = row[1].replace(tzinfo=None) if row[1] is not None and row[1].tzinfo else row[1]
+            sheet.append((row[0], created_at) + row[2:])
+            sheet_rows += 1
+        rows_written += len(chunk)
+    if sheet is None:
+        workbook.create_sheet("transactions").append(EXPORT_COLUMNS)
+    workbook.save(path)
+    return rows_written
+
+def create_export_job(db: Session, export_format: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, item_ids: Optional[List[int]] = None):
+    filters = {
+        "start_date": start_date.isoformat() if start_date else None,
+        "end_date": end_date.isoformat() if end_date else None,
+        "item_ids": item_ids or None,
+    }
+    job = models.ExportJob(format=export_format, filters=json.dumps(filters), status="Pending")
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+def run_export_job(job_id: int):
+    """Background task: stream the filtered ledger into the job's file. The ledger is read through
+    the read pool a chunk per transaction; the write session is only used to update the job."""
+    db = SessionLocal()
+    job = db.query(models.ExportJob).filter(models.ExportJob.id == job_id).first()
+    if job is None:
+        db.close()
+        return
+    export_format, filters = job.format, json.loads(job.filters or "{}")
+    job.status = "Running"
+    db.commit()  # Hands the write connection back to the pool for the length of the export
+
+    read_db = ReadSessionLocal()
+    result = {}
+    try:
+        start_date = datetime.fromisoformat(filters["start_date"]) if filters.get("start_date") else None
+        end_date = datetime.fromisoformat(filters["end_date"]) if filters.get("end_date") else None
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        path = os.path.join(EXPORT_DIR, f"transactions_{job_id}{EXPORT_FORMATS[export_format]}")
+
+        chunks = iter_ledger_chunks(read_db, start_date, end_date, filters.get("item_ids"))
+        writer = _write_parquet if export_format == "parquet" else _write_xlsx
+        result = {"row_count": writer(path, chunks), "file_path": path, "status": "Completed"}
+    except Exception as e:
+        result = {"status": "Failed", "error": str(e)}
+    finally:
+        read_db.close()
+        try:
+            for name, value in result.items():
+                setattr(job, name, value)
+            job.finished_at = datetime.now(pytz.timezone('Asia/Kolkata'))
+            db.commit()
+        finally:
+            db.close()
@@ -0,0 +1,147 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import select, delete, insert, func
+from typing import Optional
+from datetime import date, timedelta
+from statistics import NormalDist
+from . import models
+from .rollups import local_now, local_today
+import os
+
+FORECAST_HISTORY_DAYS = int(os.getenv("FORECAST_HISTORY_DAYS", "180"))
+FORECAST_WINDOW_DAYS = int(os.getenv("FORECAST_WINDOW_DAYS", "28"))  # Moving average window
+FORECAST_ALPHA = float(os.getenv("FORECAST_ALPHA", "0.2"))  # Exponential smoothing weight of the newest day
+FORECAST_SERVICE_LEVEL = float(os.getenv("FORECAST_SERVICE_LEVEL", "0.95"))
+FORECAST_LEAD_TIME_DAYS = float(os.getenv("FORECAST_LEAD_TIME_DAYS", "14"))
+# Items per dense block: bounds memory at chunk_size x history_days floats
+FORECAST_CHUNK_SIZE = int(os.getenv("FORECAST_CHUNK_SIZE", "20000"))
+
+def demand_matrix(bind, item_ids, start: date, days: int):
+    """Dense items x days array of net issued quantity (issues minus returns, never negative),
+    read from the daily movement rollups rather than the raw ledger. item_ids must be sorted."""
+    import numpy as np  # Deferred: only the scheduled job needs NumPy, not the API workers
+    matrix = np.zeros((len(item_ids), days))
+    if not len(item_ids):
+        return matrix
+    table = models.ItemDailyMovement.__table__
+    rows = bind.execute(select(
+        table.c.item_id, table.c.day,
+        func.coalesce(table.c.issue_quantity, 0) - func.coalesce(table.c.return_quantity, 0)
+    ).where(
+        table.c.item_id >= int(item_ids[0]),
+        table.c.item_id <= int(item_ids[-1]),
+        table.c.day >= start,
+        table.c.day < start + timedelta(days=days),
+    )).all()
+    if not rows:
+        return matrix
+    row_items, row_days, quantities = zip(*rows)
+    positions = np.searchsorted(item_ids, np.fromiter(row_items, dtype=np.int64, count=len(rows)))
+    columns = np.fromiter((day.toordinal() for day in row_days), dtype=np.int64, count=len(rows)) - start.toordinal()
+    found = item_ids[np.minimum(positions, len(item_ids) - 1)] == np.asarray(row_items)
+    np.add.at(matrix, (positions[found], columns[found]), np.asarray(quantities, dtype=float)[found])
+    return np.maximum(matrix, 0.0)
+
+def fit(matrix, window: int = FORECAST_WINDOW_DAYS, alpha: float = FORECAST_ALPHA):
+    """Moving average, exponential smoothing level and one-step error std for every row at once"""
+    import numpy as np
+    days = matrix.shape[1]
+    if days == 0:
+        zeros = np.zeros(matrix.shape[0])
+        return zeros, zeros, zeros
+    moving_average = matrix[:, -min(window, days):].mean(axis=1)
+    level = matrix[:, 0].copy()
+    squared_error = np.zeros(matrix.shape[0])
+    for day in range(1, days):
+        error = matrix[:, day] - level
+        squared_error += error * error
+        level += alpha * error
+    std = np.sqrt(squared_error / max(days - 1, 1))
+    return moving_average, level, std
+
+def reorder_levels(daily_demand, std, lead_time_days: float, service_level: float):
+    """Safety stock z * sigma * sqrt(L) and reorder point demand * L + safety stock, rounded up"""
+    import numpy as np
+    z = NormalDist().inv_cdf(service_level)
+    safety_stock = np.ceil(z * std * np.sqrt(lead_time_days))
+    reorder_point = np.ceil(daily_demand * lead_time_days + safety_stock)
+    return safety_stock.astype(np.int64), reorder_point.astype(np.int64)
+
+def recompute_forecasts(
+    db: Session,
+    history_days: int = FORECAST_HISTORY_DAYS,
+    window: int = FORECAST_WINDOW_DAYS,
+    alpha: float = FORECAST_ALPHA,
+    service_level: float = FORECAST_SERVICE_LEVEL,
+    lead_time_days: float = FORECAST_LEAD_TIME_DAYS,
+    chunk_size: int = FORECAST_CHUNK_SIZE,
+    end: Optional[date] = None,
+):
+    """Forecast every item from the `history_days` before `end` (default: up to yesterday) and
+    replace the stored results chunk by chunk, one commit per chunk. Returns the item count."""
+    import numpy as np
+    end = end or local_today()
+    start = end - timedelta(days=history_days)
+    now = local_now()
+    item_ids = np.fromiter(db.execute(select(models.Item.id).order_by(models.Item.id)).scalars(), dtype=np.int64)
+    table = models.ItemForecast.__table__
+
+    for offset in range(0, len(item_ids), chunk_size):
+        chunk = item_ids[offset:offset + chunk_size]
+        moving_average, smoothed, std = fit(demand_matrix(db, chunk, start, history_days), window=window, alpha=alpha)
+        safety_stock, reorder_point = reorder_levels(smoothed, std, lead_time_days, service_level)
+        db.execute(delete(table).where(table.c.item_id >= int(chunk[0]), table.c.item_id <= int(chunk[-1])))
+        db.execute(insert(table), [
+            {
+                "item_id": item_id,
+                "average_daily_demand": average,
+                "smoothed_daily_demand": level,
+                "demand_std": sigma,
+                "lead_time_days": lead_time_days,
+                "safety_stock": safety,
+                "reorder_point": reorder,
+                "history_days": history_days,
+                "computed_at": now,
+            }
+            for item_id, average, level, sigma, safety, reorder in zip(
+                chunk.tolist(), moving_average.tolist(), smoothed.tolist(), std.tolist(),
+                safety_stock.tolist(), reorder_point.tolist()
+            )
+        ])
+        db.commit()
+    # Items deleted since the last run
+    db.execute(delete(table).where(table.c.item_id.notin_(select(models.Item.id))))
+    db.commit()
+    return len(item_ids)
+
+def get_forecasts(db: Session, skip: int = 0, limit: int = 100, item_id: Optional[int] = None, below_reorder_point: bool = False):
+    """Stored forecasts with the item's current stock and minimum_stock for comparison"""
+    query = db.query(
+        models.ItemForecast,
+        models.Item.code,
+        models.Item.minimum_stock,
+        func.coalesce(models.Stock.current_quantity, 0).label("current_quantity"),
+    ).join(models.Item, models.Item.id == models.ItemForecast.item_id).outerjoin(
+        models.Stock, models.Stock.item_id == models.ItemForecast.item_id
+    )
+    if item_id is not None:
+        query = query.filter(models.ItemForecast.item_id == item_id)
+    if below_reorder_point:
+        query = query.filter(func.coalesce(models.Stock.current_quantity, 0) < models.ItemForecast.reorder_point)
+    rows = query.order_by(models.ItemForecast.item_id).offset(skip).limit(limit).all()
+    return [
+        {
+            "item_id": forecast.item_id,
+            "code": code,
+            "average_daily_demand": forecast.average_daily_demand,
+            "smoothed_daily_demand": forecast.smoothed_daily_demand,
+            "demand_std": forecast.demand_std,
+            "lead_time_days": forecast.lead_time_days,
+            "safety_stock": forecast.safety_stock,
+            "reorder_point": forecast.reorder_point,
+            "minimum_stock": minimum_stock,
+            "current_quantity": current_quantity,
+            "history_days": forecast.history_days,
+            "computed_at": forecast.computed_at,
+        }
+        for forecast, code, minimum_stock, current_quantity in rows
+    ]
@@ -0,0 +1,281 @@
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+from datetime import datetime, timedelta
+from . import models
+from .database import SessionLocal
+import asyncio
+import hashlib
+import json
+import os
+import pytz
+import time
+
+IDEMPOTENCY_HEADER = b"idempotency-key"
+STATE_CHANGING_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+EXEMPT_PATHS = {"/login"}
+
+# How long a completed response is replayed for
+KEY_TTL = timedelta(hours=float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24")))
+# How long a duplicate waits for the original request before giving up with 409
+WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+# A Processing key not refreshed for this long is treated as abandoned (worker crashed mid-request);
+# the running request refreshes it every HEARTBEAT_SECONDS, so long bulk requests stay claimed
+STALE_SECONDS = float(os.getenv("IDEMPOTENCY_STALE_SECONDS", "120"))
+HEARTBEAT_SECONDS = STALE_SECONDS / 4
+SWEEP_INTERVAL_SECONDS = float(os.getenv("IDEMPOTENCY_SWEEP_SECONDS", "300"))
+SWEEP_BATCH_SIZE = 1000
+
+def is_replayable(status_code: int):
+    """Only outcomes that a retry would repeat are stored: success and request validation (422).
+    Conflicts, rate limits, insufficient stock and the like are released so the retry runs again."""
+    return 200 <= status_code < 300 or status_code == 422
+
+def _now():
+    return datetime.now(pytz.timezone('Asia/Kolkata'))
+
+def _naive(value: datetime):
+    return value.replace(tzinfo=None) if value and value.tzinfo else value
+
+# DB operations (run in the threadpool, each in its own short transaction)
+def claim_key(key: str, method: str, path: str, request_hash: str):
+    """Returns ("new", id), ("replay", record), ("in_flight", None) or ("mismatch", None)"""
+    db = SessionLocal()
+    try:
+        for _ in range(3):
+            record = models.IdempotencyKey(
+                key=key, method=method, path=path, request_hash=request_hash,
+                status="Processing", expires_at=_now() + KEY_TTL
+            )
+            db.add(record)
+            try:
+                db.commit()
+                return "new", record.id
+            except IntegrityError:
+                db.rollback()
+
+            existing = db.query(models.IdempotencyKey).filter(
+                models.IdempotencyKey.key == key,
+                models.IdempotencyKey.method == method,
+                models.IdempotencyKey.path == path
+            ).first()
+            if existing is None:
+                continue
+            expired = _naive(existing.expires_at) < _naive(_now())
+            abandoned = existing.status == "Processing" and _naive(existing.created_at) < _naive(_now() - timedelta(seconds=STALE_SECONDS))
+            if expired or abandoned:
+                db.delete(existing)
+                db.commit()
+                continue
+            if existing.request_hash != request_hash:
+                return "mismatch", None
+            if existing.status == "Completed":
+                return "replay", _snapshot(existing)
+            return "in_flight", None
+        return "in_flight", None
+    finally:
+        db.close()
+
+def load_completed(key: str, method: str, path: str):
+    db = SessionLocal()
+    try:
+        record = db.query(models.IdempotencyKey).filter(
+            models.IdempotencyKey.key == key,
+            models.IdempotencyKey.method == method,
+            models.IdempotencyKey.path == path
+        ).first()
+        if record is None:
+            return "gone", None
+        if record.status == "Completed":
+            return "replay", _snapshot(record)
+        return "in_flight", None
+    finally:
+        db.close()
+
+def complete_key(record_id: int, status_code: int, content_type: str, body: bytes):
+    db = SessionLocal()
+    try:
+        record = db.query(models.IdempotencyKey).filter(models.IdempotencyKey.id == record_id).first()
+        if record:
+            record.status = "Completed"
+            record.response_status = status_code
+            record.response_content_type = content_type
+            record.response_body = body
+            db.commit()
+    finally:
+        db.close()
+
+def refresh_key(record_id: int):
+    """Heartbeat of a running request: keeps its Processing key from looking abandoned"""
+    db = SessionLocal()
+    try:
+        db.query(models.IdempotencyKey).filter(
+            models.IdempotencyKey.id == record_id,
+            models.IdempotencyKey.status == "Processing"
+        ).update({models.IdempotencyKey.created_at: _now()}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+def release_key(record_id: int):
+    """Forget a key whose request failed, so the client's retry runs again"""
+    db = SessionLocal()
+    try:
+        db.query(models.IdempotencyKey).filter(models.IdempotencyKey.id == record_id).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+def sweep_expired_keys(batch_size: int = SWEEP_BATCH_SIZE):
+    """Delete expired keys in small batches; returns the number removed"""
+    db = SessionLocal()
+    removed = 0
+    try:
+        while True:
+            ids = [row[0] for row in db.query(models.IdempotencyKey.id).filter(
+                models.IdempotencyKey.expires_at < _now()
+            ).limit(batch_size).all()]
+            if not ids:
+                return removed
+            db.query(models.IdempotencyKey).filter(models.IdempotencyKey.id.in_(ids)).delete(synchronize_session=False)
+            db.commit()
+            removed += len(ids)
+    finally:
+        db.close()
+
+def _snapshot(record: models.IdempotencyKey):
+    return {
+        "status": record.response_status,
+        "content_type": record.response_content_type,
+        "body": record.response_body or b"",
+    }
+
+class IdempotencyMiddleware:
+    """Replays the stored response when a state-changing request is retried with the same Idempotency-Key.
+
+    A duplicate that arrives while the original is still running waits for it and
+    receives the same response instead of applying the change a second time.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._in_flight = {}
+        self._last_sweep = time.monotonic()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in STATE_CHANGING_METHODS or scope["path"] in EXEMPT_PATHS:
+            return await self.app(scope, receive, send)
+        key = dict(scope["headers"]).get(IDEMPOTENCY_HEADER)
+        if not key:
+            return await self.app(scope, receive, send)
+        key = key.decode("latin-1")
+        method, path = scope["method"], scope["path"]
+
+        # Buffer the body so it can be fingerprinted and then replayed to the app
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        body = b"".join(chunks)
+        digest = hashlib.sha256(b"\n".join([scope.get("query_string", b""), body])).hexdigest()
+
+        for _ in range(3):
+            outcome, value = await run_in_threadpool(claim_key, key, method, path, digest)
+            if outcome == "in_flight":
+                outcome, value = await self._wait_for_original(key, method, path)
+            if outcome != "gone":
+                break
+            # The original request failed and released the key; run this one instead
+        if outcome == "mismatch":
+            return await self._send_json(send, 422, {"detail": "Idempotency-Key was already used with a different request"})
+        if outcome == "replay":
+            return await self._send_stored(send, value)
+        if outcome != "new":
+            return await self._send_json(send, 409, {"detail": "A request with this Idempotency-Key is still in progress"})
+
+        record_id = value
+        done = asyncio.Event()
+        self._in_flight[(key, method, path)] = (done, asyncio.get_running_loop())
+        try:
+            await self._run_and_store(scope, body, send, record_id)
+        finally:
+            done.set()
+            self._in_flight.pop((key, method, path), None)
+        await self._maybe_sweep()
+
+    async def _run_and_store(self, scope, body, send, record_id):
+        response = {"status": 500, "content_type": None, "body": []}
+        sent_body = False
+
+        async def replay_receive():
+            nonlocal sent_body
+            if not sent_body:
+                sent_body = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return {"type": "http.disconnect"}
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                for name, header_value in message.get("headers", []):
+                    if name.lower() == b"content-type":
+                        response["content_type"] = header_value.decode("latin-1")
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+            await send(message)
+
+        heartbeat = asyncio.ensure_future(self._heartbeat(record_id))
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        except Exception:
+            await run_in_threadpool(release_key, record_id)
+            raise
+        finally:
+            heartbeat.cancel()
+        if is_replayable(response["status"]):
+            await run_in_threadpool(complete_key, record_id, response["status"], response["content_type"], b"".join(response["body"]))
+        else:
+            await run_in_threadpool(release_key, record_id)
+
+    async def _heartbeat(self, record_id):
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            try:
+                await run_in_threadpool(refresh_key, record_id)
+            except Exception:
+                pass  # The database is busy (e.g. SQLite write lock); try again next beat
+
+    async def _wait_for_original(self, key, method, path):
+        deadline = time.monotonic() + WAIT_SECONDS
+        local, loop = self._in_flight.get((key, method, path), (None, None))
+        if local is not None and loop is asyncio.get_running_loop():
+            # Same worker: wake as soon as the original finishes
+            try:
+                await asyncio.wait_for(local.wait(), timeout=WAIT_SECONDS)
+            except asyncio.TimeoutError:
+                return "in_flight", None
+        while True:
+            outcome, value = await run_in_threadpool(load_completed, key, method, path)
+            if outcome in ("replay", "gone") or time.monotonic() >= deadline:
+                return outcome, value
+            await asyncio.sleep(0.05)
+
+    async def _maybe_sweep(self):
+        if time.monotonic() - self._last_sweep < SWEEP_INTERVAL_SECONDS:
+            return
+        self._last_sweep = time.monotonic()
+        await run_in_threadpool(sweep_expired_keys)
+
+    async def _send_stored(self, send, stored, replayed=True):
+        headers = [(b"content-length", str(len(stored["body"])).encode())]
+        if replayed:
+            headers.append((b"idempotent-replayed", b"true"))
+        if stored["content_type"]:
+            headers.append((b"content-type", stored["content_type"].encode("latin-1")))
+        await send({"type": "http.response.start", "status": stored["status"], "headers": headers})
+        await send({"type": "http.response.body", "body": stored["body"]})
+
+    async def _send_json(self, send, status_code, payload):
+        stored = {"status": status_code, "content_type": "application/json", "body": json.dumps(payload).encode()}
+        await self._send_stored(send, stored, replayed=False)
@@ -1,23 +1,36 @@
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
-from jose import jwt
+from fastapi.responses import JSONResponse
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
-from .database import engine, SessionLocal
-from . import models, crud, schemas
-from .routers import purchase_orders, requirements, stock, transactions
+from .database import ReadSessionLocal
+from . import crud, schemas, migrations
+from .cache import item_cache, ITEM_CACHE_WARM
+from .idempotency import IdempotencyMiddleware
+from .admission import AdmissionMiddleware, ADMISSION_CONTROL, admission
+from .responses import CompressionMiddleware, COMPRESSION_MIN_BYTES, default_response_class
+from .routers import purchase_orders, requirements, stock, transactions, analytics, suppliers, changes, sync, boms, stock_takes, scans
 from .dependencies import get_db, get_current_user, require_role, SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, oauth2_scheme
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
-
 app = FastAPI(
     title="Inventory Management API",
     description="API for managing inventory, purchase orders, and transactions",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=default_response_class()
 )
 
+# Replay responses for retried writes that carry an Idempotency-Key (CORS stays outermost)
+app.add_middleware(IdempotencyMiddleware)
+
+# Compress above the threshold; inside CORS, outside idempotency so stored replays stay uncompressed
+if COMPRESSION_MIN_BYTES > 0:
+    app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_BYTES)
+
+# Per-route-class concurrency limits; outside idempotency so a 429 never claims a key
+if ADMISSION_CONTROL:
+    app.add_middleware(AdmissionMiddleware)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -25,9 +38,11 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "Server-Timing"],
 )
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
+    from jose import jwt  # Deferred: pulls in the cryptography backends
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
@@ -39,6 +54,32 @@ app.include_router(purchase_orders.router)
 app.include_router(requirements.router)
 app.include_router(stock.router)
 app.include_router(transactions.router)
+app.include_router(analytics.router)
+app.include_router(suppliers.router)
+app.include_router(changes.router)
+app.include_router(sync.router)
+app.include_router(boms.router)
+app.include_router(stock_takes.router)
+app.include_router(scans.router)
+
+@app.exception_handler(crud.StockFrozenError)
+def stock_frozen(request, exc: crud.StockFrozenError):
+    """Any stock write to an item under an open stock-take; nothing was committed"""
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
+
+@app.exception_handler(crud.StockContentionError)
+def stock_contention(request, exc: crud.StockContentionError):
+    """update_stock lost its compare-and-set on every attempt; nothing was committed"""
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
+
+@app.on_event("startup")
+def warm_item_cache():
+    if ITEM_CACHE_WARM:
+        db = ReadSessionLocal()
+        try:
+            item_cache.warm(db)
+        finally:
+            db.close()
 
 @app.post("/login")
 def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
@@ -54,4 +95,24 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy"} 
\ No newline at end of file
+    return {"status": "healthy"}
+
+@app.get("/ready")
+def readiness_check():
+    """Ready once the database schema matches this build (no DDL is run here)"""
+    try:
+        ready, version, expected = migrations.check_schema()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Database unavailable: {e}")
+    if not ready:
+        raise HTTPException(status_code=503, detail=f"Schema version {version}, expected {expected}; run 'python manage.py migrate'")
+    return {"status": "ready", "schema_version": version}
+
+@app.get("/metrics/cache")
+def cache_metrics():
+    return item_cache.stats()
+
+@app.get("/metrics/admission")
+def admission_metrics():
+    """Running and queued requests, rejections and queue wait percentiles per route class"""
+    return admission.stats() 
\ No newline at end of file
@@ -0,0 +1,117 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, case, select, delete, literal, true, DateTime
+from typing import Iterable, Optional
+from . import models
+from .database import dialect_insert
+from .rollups import local_now
+import os
+
+# Differences up to this amount (in currency units) still count as a match
+MATCH_TOLERANCE = float(os.getenv("INVOICE_MATCH_TOLERANCE", "0.01"))
+
+# Statuses that need someone to look at the PO
+MISMATCH_STATUSES = ("Under Invoiced", "Over Invoiced", "Exceeds Order")
+
+MATCH_COLUMNS = [
+    "purchase_order_id", "ordered_value", "received_value", "invoiced_value", "invoice_count",
+    "invoice_variance", "order_variance", "status", "mismatched", "evaluated_at",
+]
+
+def _match_select(po_ids: Optional[Iterable[int]] = None):
+    """One row per PO with its three totals, variances and match status, computed in SQL"""
+    po = models.PurchaseOrder.__table__
+    line = models.PurchaseOrderItem.__table__
+    invoice = models.Invoice.__table__
+
+    received = select(
+        line.c.purchase_order_id.label("purchase_order_id"),
+        func.sum(func.coalesce(line.c.received_quantity, 0) * line.c.unit_price).label("value")
+    ).group_by(line.c.purchase_order_id).subquery()
+    invoiced = select(
+        invoice.c.purchase_order_id.label("purchase_order_id"),
+        func.sum(invoice.c.amount).label("value"),
+        func.count(invoice.c.id).label("count")
+    ).group_by(invoice.c.purchase_order_id).subquery()
+
+    ordered_value = func.coalesce(po.c.total_amount, 0.0)
+    received_value = func.coalesce(received.c.value, 0.0)
+    invoiced_value = func.coalesce(invoiced.c.value, 0.0)
+    invoice_count = func.coalesce(invoiced.c.count, 0)
+    status = case(
+        ((invoice_count == 0) & (received_value <= MATCH_TOLERANCE), "Open"),
+        (invoice_count == 0, "Awaiting Invoice"),
+        (invoiced_value > ordered_value + MATCH_TOLERANCE, "Exceeds Order"),
+        (invoiced_value > received_value + MATCH_TOLERANCE, "Over Invoiced"),
+        (invoiced_value < received_value - MATCH_TOLERANCE, "Under Invoiced"),
+        (received_value < ordered_value - MATCH_TOLERANCE, "Partially Matched"),
+        else_="Matched"
+    )
+
+    query = select(
+        po.c.id,
+        ordered_value,
+        received_value,
+        invoiced_value,
+        invoice_count,
+        invoiced_value - received_value,
+        invoiced_value - ordered_value,
+        status,
+        status.in_(MISMATCH_STATUSES),
+        literal(local_now(), DateTime(timezone=True)),
+    ).select_from(po).outerjoin(
+        received, received.c.purchase_order_id == po.c.id
+    ).outerjoin(
+        invoiced, invoiced.c.purchase_order_id == po.c.id
+    )
+    # SQLite needs a WHERE on INSERT ... SELECT ... ON CONFLICT to parse the upsert
+    return query.where(po.c.id.in_(list(po_ids)) if po_ids is not None else true())
+
+def reconcile(bind, po_ids: Optional[Iterable[int]] = None):
+    """Re-evaluate the match rows for po_ids (every PO when None) in one INSERT ... SELECT.
+
+    bind is a Session or Connection; the caller commits.
+    """
+    if po_ids is not None:
+        po_ids = set(po_ids)
+        if not po_ids:
+            return 0
+    if isinstance(bind, Session):
+        bind.flush()
+    table = models.PurchaseOrderMatch.__table__
+    source = _match_select(po_ids)
+
+    stmt = dialect_insert(table)
+    if stmt is not None:
+        stmt = stmt.from_select(MATCH_COLUMNS, source)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["purchase_order_id"],
+            set_={name: stmt.excluded[name] for name in MATCH_COLUMNS if name != "purchase_order_id"}
+        )
+        return bind.execute(stmt).rowcount
+
+    # Fallback for dialects without ON CONFLICT support
+    stale = delete(table)
+    if po_ids is not None:
+        stale = stale.where(table.c.purchase_order_id.in_(list(po_ids)))
+    bind.execute(stale)
+    return bind.execute(table.insert().from_select(MATCH_COLUMNS, source)).rowcount
+
+def get_matches(db: Session, skip: int = 0, limit: int = 100, status: Optional[str] = None, mismatched: Optional[bool] = None):
+    query = db.query(models.PurchaseOrderMatch)
+    if status:
+        query = query.filter(models.PurchaseOrderMatch.status == status)
+    if mismatched is not None:
+        query = query.filter(models.PurchaseOrderMatch.mismatched == mismatched)
+    return query.order_by(models.PurchaseOrderMatch.purchase_order_id).offset(skip).limit(limit).all()
+
+def get_match(db: Session, po_id: int):
+    return db.query(models.PurchaseOrderMatch).filter(models.PurchaseOrderMatch.purchase_order_id == po_id).first()
+
+def get_match_summary(db: Session):
+    """PO count and total invoice variance per match status"""
+    rows = db.query(
+        models.PurchaseOrderMatch.status,
+        func.count(models.PurchaseOrderMatch.id),
+        func.coalesce(func.sum(models.PurchaseOrderMatch.invoice_variance), 0.0)
+    ).group_by(models.PurchaseOrderMatch.status).all()
+    return [{"status": status, "count": count, "invoice_variance": variance} for status, count, variance in rows]
@@ -0,0 +1,175 @@
+from sqlalchemy import inspect, text, select, func
+from typing import Optional
+from datetime import datetime
+from . import models
+from .database import engine
+import pytz
+import sys
+
+# Bump this and append to MIGRATIONS whenever the schema changes
+SCHEMA_VERSION = 19
+
+def _columns(conn, table: str):
+    return {column["name"] for column in inspect(conn).get_columns(table)}
+
+def _add_column(conn, table: str, name: str, ddl: str):
+    if name not in _columns(conn, table):
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+def _add_make_model(conn):
+    _add_column(conn, "items", "make", "VARCHAR")
+    _add_column(conn, "items", "model_number", "VARCHAR")
+
+def _add_received_quantity(conn):
+    _add_column(conn, "purchase_order_items", "received_quantity", "INTEGER DEFAULT 0")
+
+def _add_reserved_quantity(conn):
+    from . import crud
+    _add_column(conn, "stock", "reserved_quantity", "INTEGER DEFAULT 0")
+    crud.rebuild_reservations(conn)
+
+def _add_suppliers(conn):
+    from . import suppliers
+    _add_column(conn, "purchase_orders", "supplier_id", "INTEGER REFERENCES suppliers(id)")
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_purchase_orders_supplier_id ON purchase_orders (supplier_id)"))
+    suppliers.backfill_suppliers(conn)
+
+def _match_purchase_orders(conn):
+    from . import matching
+    matching.reconcile(conn)
+
+def _tables_only(conn):
+    """Nothing to alter: upgrade() creates new tables before running the steps"""
+
+def _index_transaction_items(conn):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_transactions_item_id ON transactions (item_id)"))
+
+def _add_sync_versions(conn):
+    from . import sync
+    for table in sync.SYNCED_MODELS:
+        _add_column(conn, table, "sync_version", "INTEGER DEFAULT 0")
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_sync_version ON {table} (sync_version)"))
+    sync.backfill_versions(conn)
+
+def _add_stock_count_session(conn):
+    _add_column(conn, "stock", "count_session_id", "INTEGER REFERENCES stock_takes(id)")
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_stock_count_session_id ON stock (count_session_id)"))
+
+def _index_purchase_orders(conn):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_purchase_orders_expected_delivery_date ON purchase_orders (expected_delivery_date)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_purchase_orders_created_at ON purchase_orders (created_at)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_purchase_orders_status_created_at ON purchase_orders (status, created_at)"))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_purchase_orders_open_delivery ON purchase_orders (expected_delivery_date) "
+        f"WHERE {models.OPEN_PURCHASE_ORDER}"
+    ))
+    # Without statistics SQLite prefers the status index over the partial one for overdue lists
+    conn.execute(text("ANALYZE purchase_orders"))
+
+def _index_requirement_items(conn):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_requirement_items_requirement_id ON requirement_items (requirement_id)"))
+
+def _add_supplier_name_keys(conn):
+    from . import suppliers
+    _add_column(conn, "suppliers", "name_key", "VARCHAR")
+    suppliers.backfill_name_keys(conn)
+    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_suppliers_name_key ON suppliers (name_key)"))
+
+def _index_purchase_order_sorts(conn):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_purchase_orders_status_id ON purchase_orders (status, id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_purchase_orders_supplier_id_id ON purchase_orders (supplier_id, id)"))
+    # Superseded by the (supplier_id, id) index
+    conn.execute(text("DROP INDEX IF EXISTS ix_purchase_orders_supplier_id"))
+    conn.execute(text("ANALYZE purchase_orders"))
+
+def _autoincrement_transactions(conn):
+    """SQLite hands out max(id) + 1 for a plain INTEGER PRIMARY KEY, so once the hot ledger has
+    been archived empty it reuses ids already in the archive. Rebuild it with AUTOINCREMENT and
+    start its sequence past every id in either table."""
+    if conn.dialect.name != "sqlite":
+        return  # Serial sequences never go back
+    sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'transactions'")).scalar()
+    if "AUTOINCREMENT" not in sql.upper():
+        columns = ", ".join(sorted(_columns(conn, "transactions") & set(models.Transaction.__table__.c.keys())))
+        conn.execute(text("ALTER TABLE transactions RENAME TO transactions_old"))
+        for (index,) in conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'transactions_old' AND sql IS NOT NULL"
+        )).all():
+            conn.execute(text(f"DROP INDEX {index}"))
+        models.Transaction.__table__.create(conn)
+        conn.execute(text(f"INSERT INTO transactions ({columns}) SELECT {columns} FROM transactions_old"))
+        conn.execute(text("DROP TABLE transactions_old"))
+
+    hot, cold = models.Transaction.__table__, models.ArchivedTransaction.__table__
+    last_id = max(
+        conn.execute(select(func.max(hot.c.id))).scalar() or 0,
+        conn.execute(select(func.max(cold.c.id))).scalar() or 0,
+    )
+    # Rows that already took an archived id would fail the next archive run: move them past it
+    reused = conn.execute(select(hot.c.id).where(hot.c.id.in_(select(cold.c.id))).order_by(hot.c.id)).scalars().all()
+    for old_id in reused:
+        last_id += 1
+        conn.execute(hot.update().where(hot.c.id == old_id).values(id=last_id))
+    if conn.execute(text("UPDATE sqlite_sequence SET seq = max(seq, :id) WHERE name = 'transactions'"), {"id": last_id}).rowcount == 0:
+        conn.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('transactions', :id)"), {"id": last_id})
+
+def _add_adjustment_rollups(conn):
+    from . import rollups
+    _add_column(conn, "item_daily_movements", "adjustment_quantity", "INTEGER DEFAULT 0")
+    rollups.recompute_daily_movements(conn)
+
+# (version, description, step) - every step must be safe to run on a database that already has it
+MIGRATIONS = [
+    (2, "items.make and items.model_number", _add_make_model),
+    (3, "purchase_order_items.received_quantity", _add_received_quantity),
+    (4, "stock.reserved_quantity, backfilled from active requirements", _add_reserved_quantity),
+    (5, "suppliers table and purchase_orders.supplier_id, backfilled from supplier_name", _add_suppliers),
+    (6, "purchase_order_matches, evaluated for every existing PO", _match_purchase_orders),
+    (7, "change_outbox table for the /changes feed", _tables_only),
+    (8, "index transactions.item_id for per-item ledger replay", _index_transaction_items),
+    (9, "sync_version on items, purchase_orders and requirements, and sync_tombstones for /sync", _add_sync_versions),
+    (10, "bom_templates and bom_template_lines", _tables_only),
+    (11, "item_forecasts for demand forecasts", _tables_only),
+    (12, "stock_takes, stock_take_lines and stock.count_session_id", _add_stock_count_session),
+    (13, "purchase_orders indexes for list filters and the partial open-order index", _index_purchase_orders),
+    (14, "index requirement_items.requirement_id for the requirement summary", _index_requirement_items),
+    (15, "scan_events for barcode scan deduplication", _tables_only),
+    (16, "suppliers.name_key with a unique index, merging case/spacing duplicates; lead times clamped at 0", _add_supplier_name_keys),
+    (17, "purchase_orders (status, id) and (supplier_id, id) indexes for the list sorts", _index_purchase_order_sorts),
+    (18, "transactions rebuilt with AUTOINCREMENT so archived ids are never reused", _autoincrement_transactions),
+    (19, "item_daily_movements.adjustment_quantity, recomputed from the ledger", _add_adjustment_rollups),
+]
+
+def current_version(conn) -> Optional[int]:
+    """Schema version stamped in the database, or None if it was never migrated"""
+    if not inspect(conn).has_table(models.SchemaVersion.__tablename__):
+        return None
+    return conn.execute(select(models.SchemaVersion.__table__.c.version).where(models.SchemaVersion.__table__.c.id == 1)).scalar()
+
+def upgrade(bind=engine, log=print):
+    """Create missing tables, apply pending migrations and stamp SCHEMA_VERSION"""
+    with bind.begin() as conn:
+        version = current_version(conn) or 1
+        models.Base.metadata.create_all(bind=conn)
+        for step_version, description, step in MIGRATIONS:
+            if step_version > version:
+                log(f"Applying migration {step_version}: {description}")
+                step(conn)
+
+        table = models.SchemaVersion.__table__
+        now = datetime.now(pytz.timezone('Asia/Kolkata'))
+        if conn.execute(table.update().where(table.c.id == 1).values(version=SCHEMA_VERSION, applied_at=now)).rowcount == 0:
+            conn.execute(table.insert().values(id=1, version=SCHEMA_VERSION, applied_at=now))
+    return SCHEMA_VERSION
+
+def check_schema(bind=engine):
+    """Read-only readiness check: (ready, current version, expected version)"""
+    with bind.connect() as conn:
+        version = current_version(conn)
+    return version == SCHEMA_VERSION, version, SCHEMA_VERSION
+
+def require_schema(bind=engine):
+    """For maintenance scripts: exit, pointing at `manage.py migrate`, unless the schema is current"""
+    ready, version, expected = check_schema(bind)
+    if not ready:
+        sys.exit(f"✗ Schema version is {version}, expected {expected}. Run: python manage.py migrate")
@@ -1,7 +1,7 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text
+from sqlalchemy import Column, Integer, String, Float, DateTime, Date, ForeignKey, Boolean, Text, LargeBinary, UniqueConstraint, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from .database import Base
+from .database import Base, ARCHIVE_SCHEMA
 import uuid
 import pytz
 from datetime import datetime
@@ -10,10 +10,8 @@ def generate_uuid():
     return str(uuid.uuid4())
 
 def generate_po_number():
-    import random
-    import string
-    short_id = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-    return f"PO-{short_id}"
+    from .numbering import next_document_number
+    return next_document_number("po")
 
 class User(Base):
     __tablename__ = "users"
@@ -35,6 +33,7 @@ class Item(Base):
     model_number = Column(String, nullable=True)
     unit_price = Column(Float, default=0.0)
     minimum_stock = Column(Integer, default=0)
+    sync_version = Column(Integer, default=0, index=True)  # Delta sync: version of the last write to this row or its children
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.timezone('Asia/Kolkata')))
     
     # Relationships
@@ -43,23 +42,71 @@ class Item(Base):
     requirement_items = relationship("RequirementItem", back_populates="item")
     transactions = relationship("Transaction", back_populates="item")
 
+class Supplier(Base):
+    __tablename__ = "suppliers"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, index=True, nullable=False)
+    name_key = Column(String, unique=True, index=True)  # Lower-cased, whitespace-collapsed name (suppliers.name_key)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.timezone('Asia/Kolkata')))
+    
+    # Scorecard rollups, maintained on PO creation and receipt (see suppliers.py)
+    order_count = Column(Integer, default=0)
+    received_order_count = Column(Integer, default=0)
+    total_lead_time_days = Column(Float, default=0.0)  # Sum of received_at - created_at over received orders
+    on_time_count = Column(Integer, default=0)  # Received orders with an expected_delivery_date that was met
+    rated_order_count = Column(Integer, default=0)  # Received orders with an expected_delivery_date
+    open_order_value = Column(Float, default=0.0)  # Value of ordered quantity not yet received
+    last_received_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # Relationships
+    purchase_orders = relationship("PurchaseOrder", back_populates="supplier")
+    
+    @property
+    def average_lead_time_days(self):
+        return self.total_lead_time_days / self.received_order_count if self.received_order_count else None
+    
+    @property
+    def on_time_rate(self):
+        return self.on_time_count / self.rated_order_count if self.rated_order_count else None
+
+# Written as literal SQL: SQLite only uses the partial index when a query repeats this exact term
+OPEN_PURCHASE_ORDER = "status IN ('Pending', 'Partially Received')"
+
 class PurchaseOrder(Base):
     __tablename__ = "purchase_orders"
+    __table_args__ = (
+        Index("ix_purchase_orders_status_created_at", "status", "created_at"),
+        # Filter-and-sort indexes for the list's status and supplier_id sorts (id breaks ties)
+        Index("ix_purchase_orders_status_id", "status", "id"),
+        Index("ix_purchase_orders_supplier_id_id", "supplier_id", "id"),
+        Index("ix_purchase_orders_open_delivery", "expected_delivery_date",
+              sqlite_where=text(OPEN_PURCHASE_ORDER), postgresql_where=text(OPEN_PURCHASE_ORDER)),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     po_number = Column(String, unique=True, index=True, default=generate_po_number)
-    supplier_name = Column(String)
-    expected_delivery_date = Column(DateTime)
+    supplier_id = Column(Integer, ForeignKey("suppliers.id"), nullable=True)
+    supplier_name = Column(String)  # Kept alongside supplier_id for existing clients
+    expected_delivery_date = Column(DateTime, index=True)
     status = Column(String, default="Pending")  # Pending, Partially Received, Received, Cancelled
     total_amount = Column(Float, default=0.0)
-    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.timezone('Asia/Kolkata')))
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.timezone('Asia/Kolkata')), index=True)
     received_at = Column(DateTime(timezone=True), nullable=True)
+    sync_version = Column(Integer, default=0, index=True)
     
     # Relationships
+    supplier = relationship("Supplier", back_populates="purchase_orders")
     items = relationship("PurchaseOrderItem", back_populates="purchase_order", cascade="all, delete-orphan")
     invoices = relationship("Invoice", back_populates="purchase_order", cascade="all, delete-orphan")
     transactions = relationship("Transaction", back_populates="purchase_order")
 
+class DocumentSequence(Base):
+    __tablename__ = "document_sequences"
+    
+    name = Column(String, primary_key=True)  # po, grn, issue_slip
+    next_value = Column(Integer, nullable=False, default=1)
+
 class Invoice(Base):
     __tablename__ = "invoices"
     
@@ -74,6 +121,25 @@ class Invoice(Base):
     # Relationships
     purchase_order = relationship("PurchaseOrder", back_populates="invoices")
 
+class PurchaseOrderMatch(Base):
+    """Three-way match of a PO: ordered total vs value received vs invoiced amount"""
+    __tablename__ = "purchase_order_matches"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    purchase_order_id = Column(Integer, ForeignKey("purchase_orders.id"), unique=True, nullable=False)
+    ordered_value = Column(Float, default=0.0)
+    received_value = Column(Float, default=0.0)
+    invoiced_value = Column(Float, default=0.0)
+    invoice_count = Column(Integer, default=0)
+    invoice_variance = Column(Float, default=0.0)  # invoiced - received
+    order_variance = Column(Float, default=0.0)  # invoiced - ordered
+    status = Column(String, index=True)  # Open, Awaiting Invoice, Partially Matched, Matched, Under Invoiced, Over Invoiced, Exceeds Order
+    mismatched = Column(Boolean, default=False, index=True)
+    evaluated_at = Column(DateTime(timezone=True))
+    
+    # Relationships
+    purchase_order = relationship("PurchaseOrder")
+
 class PurchaseOrderItem(Base):
     __tablename__ = "purchase_order_items"
     
@@ -98,6 +164,7 @@ class Requirement(Base):
     status = Column(String, default="Active")  # Active, Completed
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.timezone('Asia/Kolkata')))
     completed_at = Column(DateTime(timezone=True), nullable=True)
+    sync_version = Column(Integer, default=0, index=True)
     
     # Relationships
     items = relationship("RequirementItem", back_populates="requirement", cascade="all, delete-orphan")
@@ -107,7 +174,7 @@ class RequirementItem(Base):
     __tablename__ = "requirement_items"
     
     id = Column(Integer, primary_key=True, index=True)
-    requirement_id = Column(Integer, ForeignKey("requirements.id"))
+    requirement_id = Column(Integer, ForeignKey("requirements.id"), index=True)
     item_id = Column(Integer, ForeignKey("items.id"))
     quantity_needed = Column(Integer)
     quantity_issued = Column(Integer, default=0)
@@ -117,24 +184,94 @@ class RequirementItem(Base):
     requirement = relationship("Requirement", back_populates="items")
     item = relationship("Item", back_populates="requirement_items")
 
+class BomTemplate(Base):
+    __tablename__ = "bom_templates"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, index=True, nullable=False)
+    description = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.timezone('Asia/Kolkata')))
+    
+    # Relationships
+    lines = relationship("BomTemplateLine", back_populates="template", cascade="all, delete-orphan",
+                         foreign_keys="BomTemplateLine.template_id", order_by="BomTemplateLine.id")
+
+class BomTemplateLine(Base):
+    __tablename__ = "bom_template_lines"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    template_id = Column(Integer, ForeignKey("bom_templates.id"), index=True, nullable=False)
+    # Exactly one of item_id (a part) and sub_template_id (a nested sub-assembly) is set
+    item_id = Column(Integer, ForeignKey("items.id"), nullable=True)
+    sub_template_id = Column(Integer, ForeignKey("bom_templates.id"), nullable=True)
+    quantity = Column(Integer, nullable=False)  # Per one unit of the template
+    
+    # Relationships
+    template = relationship("BomTemplate", back_populates="lines", foreign_keys=[template_id])
+    item = relationship("Item")
+    sub_template = relationship("BomTemplate", foreign_keys=[sub_template_id])
+
 class Stock(Base):
     __tablename__ = "stock"
     
     id = Column(Integer, primary_key=True, index=True)
     item_id = Column(Integer, ForeignKey("items.id"), unique=True)
     current_quantity = Column(Integer, default=0)
+    reserved_quantity = Column(Integer, default=0)  # Outstanding quantity of active requirements
+    count_session_id = Column(Integer, ForeignKey("stock_takes.id"), index=True, nullable=True)  # Set while frozen by a stock-take
     last_updated = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.timezone('Asia/Kolkata')), onupdate=lambda: datetime.now(pytz.timezone('Asia/Kolkata')))
     
     # Relationships
     item = relationship("Item", back_populates="stock")
 
+class StockTake(Base):
+    __tablename__ = "stock_takes"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    status = Column(String, default="Open", index=True)  # Open, Closed, Cancelled
+    item_count = Column(Integer, default=0)  # Items frozen for the count
+    counted_count = Column(Integer, default=0)
+    adjusted_count = Column(Integer, default=0)
+    variance_quantity = Column(Integer, default=0)  # Net adjustment booked at close
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.timezone('Asia/Kolkata')))
+    closed_at = Column(DateTime(timezone=True), nullable=True)
+
+class StockTakeLine(Base):
+    __tablename__ = "stock_take_lines"
+    __table_args__ = (UniqueConstraint("stock_take_id", "item_id", name="uq_stock_take_line"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    stock_take_id = Column(Integer, ForeignKey("stock_takes.id"), nullable=False)
+    item_id = Column(Integer, ForeignKey("items.id"), nullable=False)
+    counted_quantity = Column(Integer, nullable=False)  # The last uploaded count wins
+    system_quantity = Column(Integer, nullable=True)  # Stock when the session closed
+    counted_at = Column(DateTime(timezone=True))
+
+class ScanEvent(Base):
+    """A barcode scan applied by POST /scans, kept for a while so retransmitted batches are not applied twice"""
+    __tablename__ = "scan_events"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    event_id = Column(String, unique=True, index=True, nullable=False)  # Generated by the scanner
+    scanner_id = Column(String, nullable=True)
+    code = Column(String, nullable=False)
+    item_id = Column(Integer, ForeignKey("items.id"), nullable=True)
+    action = Column(String, nullable=False)  # issue, receive
+    quantity = Column(Integer, nullable=False)
+    requirement_id = Column(Integer, ForeignKey("requirements.id"), nullable=True)
+    purchase_order_id = Column(Integer, ForeignKey("purchase_orders.id"), nullable=True)
+    scanned_at = Column(DateTime, nullable=True)  # Client clock
+    received_at = Column(DateTime(timezone=True), index=True)
+
 class Transaction(Base):
     __tablename__ = "transactions"
+    __table_args__ = {"sqlite_autoincrement": True}  # Never reuse an id once its row is archived
     
     id = Column(Integer, primary_key=True, index=True)
-    item_id = Column(Integer, ForeignKey("items.id"))
-    quantity = Column(Integer)
-    action = Column(String)  # Purchase, Issue, Return
+    item_id = Column(Integer, ForeignKey("items.id"), index=True)
+    quantity = Column(Integer)  # Signed for Adjustment, positive otherwise
+    action = Column(String)  # Purchase, Issue, Return, Adjustment
     purchase_order_id = Column(Integer, ForeignKey("purchase_orders.id"), nullable=True)
     requirement_id = Column(Integer, ForeignKey("requirements.id"), nullable=True)
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.timezone('Asia/Kolkata')))
@@ -142,4 +279,141 @@ class Transaction(Base):
     # Relationships
     item = relationship("Item", back_populates="transactions")
     purchase_order = relationship("PurchaseOrder", back_populates="transactions")
-    requirement = relationship("Requirement", back_populates="transactions") 
\ No newline at end of file
+    requirement = relationship("Requirement", back_populates="transactions")
+
+class ArchivedTransaction(Base):
+    """Transactions moved out of the hot ledger; same shape as Transaction"""
+    __tablename__ = "transactions_archive"
+    __table_args__ = {"schema": ARCHIVE_SCHEMA} if ARCHIVE_SCHEMA else {}
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    item_id = Column(Integer, index=True)
+    quantity = Column(Integer)
+    action = Column(String)
+    purchase_order_id = Column(Integer, nullable=True)
+    requirement_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), index=True)
+    archived_at = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.timezone('Asia/Kolkata')))
+    
+    # Relationships (no foreign keys: the archive may live in a separate database file)
+    item = relationship("Item", primaryjoin="foreign(ArchivedTransaction.item_id) == Item.id", viewonly=True)
+    purchase_order = relationship("PurchaseOrder", primaryjoin="foreign(ArchivedTransaction.purchase_order_id) == PurchaseOrder.id", viewonly=True)
+    requirement = relationship("Requirement", primaryjoin="foreign(ArchivedTransaction.requirement_id) == Requirement.id", viewonly=True)
+
+class ItemDailyMovement(Base):
+    __tablename__ = "item_daily_movements"
+    __table_args__ = (UniqueConstraint("item_id", "day", name="uq_item_daily_movement"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    item_id = Column(Integer, ForeignKey("items.id"), nullable=False)
+    day = Column(Date, nullable=False)
+    purchase_quantity = Column(Integer, default=0)
+    issue_quantity = Column(Integer, default=0)
+    return_quantity = Column(Integer, default=0)
+    adjustment_quantity = Column(Integer, default=0)  # Net signed Adjustments (counts, manual updates, reconciliation)
+    transaction_count = Column(Integer, default=0)
+
+class ItemForecast(Base):
+    """Demand forecast per item, recomputed by forecast_demand.py (never in a request)"""
+    __tablename__ = "item_forecasts"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    item_id = Column(Integer, ForeignKey("items.id"), unique=True, index=True, nullable=False)
+    average_daily_demand = Column(Float, default=0.0)  # Moving average over the last window
+    smoothed_daily_demand = Column(Float, default=0.0)  # Simple exponential smoothing level
+    demand_std = Column(Float, default=0.0)  # Std of the one-step smoothing errors, per day
+    lead_time_days = Column(Float, default=0.0)
+    safety_stock = Column(Integer, default=0)
+    reorder_point = Column(Integer, default=0)
+    history_days = Column(Integer, default=0)
+    computed_at = Column(DateTime(timezone=True))
+    
+    # Relationships
+    item = relationship("Item")
+
+class CostLayer(Base):
+    __tablename__ = "cost_layers"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    item_id = Column(Integer, ForeignKey("items.id"), index=True, nullable=False)
+    purchase_order_id = Column(Integer, ForeignKey("purchase_orders.id"), nullable=True)
+    quantity = Column(Integer, nullable=False)  # Quantity received into this layer
+    remaining_quantity = Column(Integer, nullable=False)  # Quantity not yet issued
+    unit_cost = Column(Float, default=0.0)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.timezone('Asia/Kolkata')))
+
+class ItemValuation(Base):
+    __tablename__ = "item_valuations"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    item_id = Column(Integer, ForeignKey("items.id"), unique=True, nullable=False)
+    quantity = Column(Integer, default=0)
+    total_value = Column(Float, default=0.0)
+    average_cost = Column(Float, default=0.0)
+    last_updated = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.timezone('Asia/Kolkata')), onupdate=lambda: datetime.now(pytz.timezone('Asia/Kolkata')))
+
+class CacheVersion(Base):
+    __tablename__ = "cache_versions"
+    
+    name = Column(String, primary_key=True)  # e.g. "items:17" - one row per cache bucket
+    version = Column(Integer, nullable=False, default=0)
+
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+    
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False)
+    applied_at = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.timezone('Asia/Kolkata')))
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (UniqueConstraint("key", "method", "path", name="uq_idempotency_key"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String, nullable=False)
+    method = Column(String, nullable=False)
+    path = Column(String, nullable=False)
+    request_hash = Column(String, nullable=False)
+    status = Column(String, default="Processing")  # Processing, Completed
+    response_status = Column(Integer, nullable=True)
+    response_content_type = Column(String, nullable=True)
+    response_body = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.timezone('Asia/Kolkata')))
+    expires_at = Column(DateTime(timezone=True), index=True)
+
+class ExportJob(Base):
+    __tablename__ = "export_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String, default="Pending")  # Pending, Running, Completed, Failed
+    format = Column(String, nullable=False)  # parquet, xlsx
+    filters = Column(Text, nullable=True)  # JSON
+    file_path = Column(String, nullable=True)
+    row_count = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.timezone('Asia/Kolkata')))
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class ChangeRecord(Base):
+    """Transactional outbox: one row per committed write, read in seq order by /changes"""
+    __tablename__ = "change_outbox"
+    __table_args__ = {"sqlite_autoincrement": True}  # Never reuse a seq after compaction
+    
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    entity = Column(String, nullable=False)  # Table name, e.g. items, stock, purchase_orders
+    entity_id = Column(Integer, nullable=False)
+    op = Column(String, nullable=False)  # insert, update, delete
+    payload = Column(Text, nullable=True)  # Compact JSON of the written columns; null for bulk writes
+    created_at = Column(DateTime(timezone=True), index=True)
+
+
+class SyncTombstone(Base):
+    """A deleted synced row, so /sync can tell offline clients to drop it"""
+    __tablename__ = "sync_tombstones"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    entity = Column(String, nullable=False)  # items, purchase_orders, requirements
+    entity_id = Column(Integer, nullable=False)
+    sync_version = Column(Integer, nullable=False, index=True)
+    deleted_at = Column(DateTime(timezone=True), default=lambda: datetime.now(pytz.timezone('Asia/Kolkata')))
@@ -0,0 +1,91 @@
+from sqlalchemy import select, update, insert
+from sqlalchemy.exc import IntegrityError
+from .database import engine
+from . import models
+import os
+import re
+import threading
+
+# Document number formats; {number} is the sequence value
+NUMBER_FORMATS = {
+    "po": os.getenv("PO_NUMBER_FORMAT", "PO-{number:06d}"),
+    "grn": os.getenv("GRN_NUMBER_FORMAT", "GRN-{number:06d}"),
+    "issue_slip": os.getenv("ISSUE_SLIP_NUMBER_FORMAT", "IS-{number:06d}"),
+}
+
+# Numbers reserved per worker process at a time
+BLOCK_SIZE = int(os.getenv("DOCUMENT_NUMBER_BLOCK_SIZE", "20"))
+
+def _format_prefix(name: str):
+    return NUMBER_FORMATS[name].split("{", 1)[0]
+
+def _existing_max(conn, name: str):
+    """Highest number already issued for a document type (PO numbers predate the sequence table)"""
+    if name != "po":
+        return 0
+    prefix = _format_prefix(name)
+    column = models.PurchaseOrder.__table__.c.po_number
+    highest = 0
+    for (po_number,) in conn.execute(select(column).where(column.like(f"{prefix}%"))):
+        match = re.fullmatch(r"(\d+)", po_number[len(prefix):])
+        if match:
+            highest = max(highest, int(match.group(1)))
+    return highest
+
+class DocumentNumberAllocator:
+    """Hands out sequence numbers from blocks reserved in document_sequences.
+
+    Each process reserves BLOCK_SIZE numbers in one short transaction on its own
+    connection, then serves them from memory, so most allocations cost no round-trip
+    and two workers can never receive the same number. Numbers left in a block when
+    a worker exits are skipped, so sequences can have gaps.
+    """
+
+    def __init__(self, block_size: int = BLOCK_SIZE):
+        self.block_size = block_size
+        self._blocks = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _reserve_block(self, name: str):
+        table = models.DocumentSequence.__table__
+        for _ in range(3):
+            try:
+                with engine.begin() as conn:
+                    result = conn.execute(
+                        update(table).where(table.c.name == name).values(next_value=table.c.next_value + self.block_size)
+                    )
+                    if result.rowcount == 0:
+                        start = _existing_max(conn, name) + 1
+                        conn.execute(insert(table).values(name=name, next_value=start + self.block_size))
+                    else:
+                        start = conn.execute(select(table.c.next_value).where(table.c.name == name)).scalar() - self.block_size
+                return [start, start + self.block_size]
+            except IntegrityError:
+                # Another worker created the sequence row first; reserve from it instead
+                continue
+        raise RuntimeError(f"Could not reserve document numbers for '{name}'")
+
+    def next_value(self, name: str):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked worker: never reuse the parent's block
+                self._blocks = {}
+                self._pid = os.getpid()
+            block = self._blocks.get(name)
+            if block is None or block[0] >= block[1]:
+                block = self._reserve_block(name)
+                self._blocks[name] = block
+            value = block[0]
+            block[0] += 1
+            return value
+
+allocator = DocumentNumberAllocator()
+
+def next_document_number(name: str):
+    """Next formatted document number, e.g. next_document_number("po") -> "PO-000042".
+
+    Call this before the caller's session starts writing: a block reservation uses
+    its own connection and would wait on the caller's SQLite write lock.
+    """
+    return NUMBER_FORMATS[name].format(number=allocator.next_value(name))
@@ -0,0 +1,190 @@
+from sqlalchemy import event, inspect, select, delete, func, text
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from itertools import chain
+from typing import Iterable, Optional
+from datetime import date, datetime, timedelta
+from . import models, sync
+from .database import ReadSessionLocal
+from .rollups import local_now
+import asyncio
+import json
+import os
+import threading
+
+CHANGE_BATCH_SIZE = int(os.getenv("CHANGE_FEED_BATCH_SIZE", "500"))
+CHANGE_MAX_BATCH_SIZE = 5000
+# Records older than this are compacted to the latest record per entity
+CHANGE_RETENTION_DAYS = int(os.getenv("CHANGE_FEED_RETENTION_DAYS", "7"))
+# How often a long-poll re-reads the outbox for writes committed by other workers
+CHANGE_POLL_SECONDS = float(os.getenv("CHANGE_FEED_POLL_SECONDS", "0.5"))
+
+# Business entities published on the feed, keyed the way the REST API addresses them
+# (stock by item_id). Derived tables (rollups, valuations, matches) are not published.
+TRACKED_MODELS = {
+    models.Item: "id",
+    models.Stock: "item_id",
+    models.Supplier: "id",
+    models.PurchaseOrder: "id",
+    models.PurchaseOrderItem: "id",
+    models.Invoice: "id",
+    models.Requirement: "id",
+    models.RequirementItem: "id",
+    models.Transaction: "id",
+}
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+def _payload(values: Optional[dict]):
+    if not values:
+        return None
+    return json.dumps({key: _json_value(value) for key, value in values.items()}, separators=(",", ":"))
+
+def _append(session: Session, rows):
+    """Insert change records on the session's connection, i.e. in the writer's own transaction"""
+    if not rows:
+        return
+    conn = session.connection()
+    if conn.dialect.name == "postgresql":
+        # Serialize outbox writers so sequence order is commit order (SQLite writers are serialized already)
+        conn.execute(text("SELECT pg_advisory_xact_lock(7263)"))
+    now = local_now()
+    conn.execute(models.ChangeRecord.__table__.insert(), [dict(row, created_at=now) for row in rows])
+    session.info["outbox_appended"] = True
+
+def record_changes(db: Session, entity: str, entity_ids: Iterable[int], op: str = "update"):
+    """For writes that bypass the ORM (bulk statements): publish the touched rows without a payload
+    and bump their /sync versions"""
+    entity_ids = sorted(set(entity_ids))
+    _append(db, [
+        {"entity": entity, "entity_id": entity_id, "op": op, "payload": None}
+        for entity_id in entity_ids
+    ])
+    sync.touch(db, entity, entity_ids)
+
+# Capture every ORM write to a tracked model in the same flush
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session, flush_context):
+    rows = []
+    for obj, op in chain(
+        ((obj, "insert") for obj in session.new),
+        ((obj, "update") for obj in session.dirty),
+        ((obj, "delete") for obj in session.deleted),
+    ):
+        key = TRACKED_MODELS.get(type(obj))
+        if key is None:
+            continue
+        state = inspect(obj)
+        if op == "insert":
+            values = {attr.key: state.dict.get(attr.key) for attr in state.mapper.column_attrs}
+        elif op == "update":
+            values = {}
+            for attr in state.mapper.column_attrs:
+                history = state.attrs[attr.key].history
+                if history.added:
+                    values[attr.key] = history.added[0]
+            if not values:
+                continue
+        else:
+            values = None
+        entity_id = getattr(obj, key)
+        if entity_id is None:
+            continue
+        rows.append({"entity": type(obj).__tablename__, "entity_id": entity_id, "op": op, "payload": _payload(values)})
+    _append(session, rows)
+
+@event.listens_for(Session, "after_commit")
+def _notify_committed_changes(session):
+    if session.info.pop("outbox_appended", False):
+        notifier.notify()
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_changes(session):
+    session.info.pop("outbox_appended", None)
+
+class ChangeNotifier:
+    """Wakes long-polls in this process as soon as a change is committed"""
+
+    def __init__(self):
+        self._waiters = set()
+        self._lock = threading.Lock()
+
+    async def wait(self, timeout: float):
+        waiter = (asyncio.Event(), asyncio.get_running_loop())
+        with self._lock:
+            self._waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter[0].wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+    def notify(self):
+        with self._lock:
+            waiters = list(self._waiters)
+        for done, loop in waiters:
+            try:
+                loop.call_soon_threadsafe(done.set)
+            except RuntimeError:
+                pass  # Loop already closed
+
+notifier = ChangeNotifier()
+
+# Reading the feed
+def get_changes(after: int = 0, limit: int = CHANGE_BATCH_SIZE, entity: Optional[str] = None):
+    """Records with seq > after in sequence order, and the seq to resume after"""
+    db = ReadSessionLocal()
+    try:
+        query = db.query(models.ChangeRecord).filter(models.ChangeRecord.seq > after)
+        if entity:
+            query = query.filter(models.ChangeRecord.entity == entity)
+        records = query.order_by(models.ChangeRecord.seq).limit(limit + 1).all()
+        has_more = len(records) > limit
+        records = records[:limit]
+        return {
+            "changes": [_record_dict(record) for record in records],
+            "last_seq": records[-1].seq if records else after,
+            "has_more": has_more,
+        }
+    finally:
+        db.close()
+
+def _record_dict(record: models.ChangeRecord):
+    return {
+        "seq": record.seq,
+        "entity": record.entity,
+        "entity_id": record.entity_id,
+        "op": record.op,
+        "data": json.loads(record.payload) if record.payload else None,
+        "created_at": record.created_at,
+    }
+
+async def wait_for_changes(after: int, limit: int, wait: float, entity: Optional[str] = None):
+    """Long-poll: return as soon as there is something after `after`, or empty once `wait` seconds pass"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    while True:
+        batch = await run_in_threadpool(get_changes, after, limit, entity)
+        remaining = deadline - loop.time()
+        if batch["changes"] or remaining <= 0:
+            return batch
+        await notifier.wait(min(remaining, CHANGE_POLL_SECONDS))
+
+# Retention
+def compact_changes(db: Session, older_than: datetime = None):
+    """Past the retention window keep only the newest record per entity, so a consumer
+    starting from zero still learns about every row without replaying its full history"""
+    older_than = older_than or local_now() - timedelta(days=CHANGE_RETENTION_DAYS)
+    table = models.ChangeRecord.__table__
+    boundary = db.execute(select(func.max(table.c.seq)).where(table.c.created_at < older_than)).scalar()
+    if boundary is None:
+        return 0
+    latest = select(func.max(table.c.seq)).where(table.c.seq <= boundary).group_by(table.c.entity, table.c.entity_id)
+    removed = db.execute(delete(table).where(table.c.seq <= boundary, table.c.seq.notin_(latest))).rowcount
+    db.commit()
+    return removed
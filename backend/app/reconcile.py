@@ -0,0 +1,108 @@
+from sqlalchemy import func, case, select, union_all
+from typing import List, Tuple
+from . import models
+from .database import SessionLocal, engine
+
+RECONCILE_BATCH_SIZE = 500
+
+def _signed(model):
+    """Ledger quantity with its effect on stock: issues subtract, adjustments carry their own sign"""
+    return case((model.action == "Issue", -model.quantity), else_=model.quantity)
+
+def ledger_balances(bind, start_id: int, end_id: int):
+    """{item_id: stock implied by the hot and archived ledger} for start_id <= item_id < end_id"""
+    ledger = union_all(*[
+        select(model.item_id.label("item_id"), _signed(model).label("quantity")).where(
+            model.item_id >= start_id, model.item_id < end_id
+        )
+        for model in (models.Transaction, models.ArchivedTransaction)
+    ]).subquery()
+    rows = bind.execute(
+        select(ledger.c.item_id, func.coalesce(func.sum(ledger.c.quantity), 0)).group_by(ledger.c.item_id)
+    ).all()
+    return {item_id: int(total) for item_id, total in rows}
+
+def stock_balances(bind, start_id: int, end_id: int):
+    rows = bind.execute(select(models.Stock.item_id, models.Stock.current_quantity).where(
+        models.Stock.item_id >= start_id, models.Stock.item_id < end_id
+    )).all()
+    return {item_id: quantity or 0 for item_id, quantity in rows}
+
+def partition_item_ids(bind, partitions: int) -> List[Tuple[int, int]]:
+    """Split the item id space into contiguous [start, end) ranges"""
+    low, high = bind.execute(select(func.min(models.Item.id), func.max(models.Item.id))).one()
+    if low is None:
+        return []
+    partitions = max(1, partitions)
+    step = max(1, -(-(high - low + 1) // partitions))
+    return [(start, min(start + step, high + 1)) for start in range(low, high + 1, step)]
+
+def replay_partition(item_range: Tuple[int, int]):
+    """Pool worker: replay the ledger for one id range and return its drift rows"""
+    start_id, end_id = item_range
+    with engine.connect() as conn:
+        ledger = ledger_balances(conn, start_id, end_id)
+        stock = stock_balances(conn, start_id, end_id)
+    drift = []
+    for item_id in sorted(set(ledger) | set(stock)):
+        ledger_quantity = ledger.get(item_id, 0)
+        stock_quantity = stock.get(item_id)
+        if stock_quantity is None or stock_quantity != ledger_quantity:
+            drift.append({
+                "item_id": item_id,
+                "stock_quantity": stock_quantity,
+                "ledger_quantity": ledger_quantity,
+                "drift": (stock_quantity or 0) - ledger_quantity,
+            })
+    return drift
+
+def init_worker():
+    """Process pool initializer: a forked worker must not reuse the parent's pooled connections"""
+    engine.dispose(close=False)
+
+def apply_corrections(drift_rows, trust: str = "stock", batch_size: int = RECONCILE_BATCH_SIZE):
+    """Correct drift in batches, one commit each; balances are re-read inside each batch.
+
+    trust="stock" books an Adjustment transaction so the ledger agrees with the counted stock;
+    trust="ledger" resets Stock.current_quantity to the ledger balance.
+    Items under an open stock-take are left alone (closing the count books its own adjustment),
+    as are items whose ledger balance is negative when trusting the ledger.
+    Returns (number of items corrected, [{"item_id", "reason"} for each item skipped]).
+    """
+    from . import crud
+
+    corrected, skipped = 0, []
+    item_ids = [row["item_id"] for row in drift_rows]
+    db = SessionLocal()
+    try:
+        for start in range(0, len(item_ids), batch_size):
+            batch = set(item_ids[start:start + batch_size])
+            for item_id in sorted(batch):
+                ledger = ledger_balances(db, item_id, item_id + 1).get(item_id, 0)
+                row = db.execute(select(models.Stock.current_quantity, models.Stock.count_session_id).where(
+                    models.Stock.item_id == item_id
+                )).first()
+                if row is None and trust == "stock":
+                    continue  # Nothing counted to trust
+                stock, session_id = (row[0] or 0, row[1]) if row else (0, None)
+                if stock - ledger == 0:
+                    continue
+                if session_id is not None:
+                    skipped.append({"item_id": item_id, "reason": "under an open stock-take"})
+                    continue
+                if trust == "stock":
+                    crud.record_transaction(db, item_id=item_id, quantity=stock - ledger, action="Adjustment")
+                else:
+                    try:
+                        moved = crud.move_stock(db, item_id, ledger - stock)
+                    except crud.StockFrozenError:
+                        skipped.append({"item_id": item_id, "reason": "under an open stock-take"})
+                        continue
+                    if not moved:
+                        skipped.append({"item_id": item_id, "reason": f"ledger balance {ledger} is negative"})
+                        continue
+                corrected += 1
+            db.commit()
+    finally:
+        db.close()
+    return corrected, skipped
@@ -0,0 +1,94 @@
+from fastapi.responses import JSONResponse, Response
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.gzip import GZipMiddleware
+from pydantic import TypeAdapter
+from typing import Optional
+import os
+
+try:
+    import orjson
+except ImportError:  # Optional: the fast path falls back to pydantic's own encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # Optional: without it responses are only gzip-compressed
+    brotli = None
+
+# Opt-in: list endpoints serialize with prebuilt pydantic serializers and other routes encode with orjson
+FAST_RESPONSES = os.getenv("FAST_RESPONSES", "0") == "1"
+# Compress responses of at least this many bytes when the client accepts it (0 = off)
+COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "0"))
+GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", "4"))
+
+class ORJSONResponse(JSONResponse):
+    """Encodes the already jsonable content with orjson (used when FAST_RESPONSES=1)"""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+def default_response_class():
+    return ORJSONResponse if FAST_RESPONSES and orjson is not None else JSONResponse
+
+def serialize(adapter: TypeAdapter, value, headers: Optional[dict] = None):
+    """Return value as-is for FastAPI's response_model path, or with FAST_RESPONSES=1 as a
+    Response encoded in one pass by the schema's prebuilt serializer (no jsonable_encoder walk).
+    headers only apply to the fast path; set them on the injected Response as well."""
+    if not FAST_RESPONSES:
+        return value
+    body = adapter.dump_json(adapter.validate_python(value, from_attributes=True))
+    return Response(content=body, media_type="application/json", headers=headers)
+
+class CompressionMiddleware:
+    """gzip or brotli (when installed and accepted) for responses of at least minimum_size bytes"""
+
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size, compresslevel=GZIP_LEVEL)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accepted = Headers(scope=scope).get("accept-encoding", "")
+        if brotli is not None and "br" in accepted:
+            await BrotliResponder(self.app, self.minimum_size)(scope, receive, send)
+        else:
+            await self.gzip(scope, receive, send)
+
+class BrotliResponder:
+    """Compresses single-message bodies; streamed responses (file downloads) pass through"""
+
+    def __init__(self, app, minimum_size: int):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.start_message = None
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message):
+        if message["type"] == "http.response.start":
+            self.start_message = message  # Held until the first body chunk decides
+            return
+        if message["type"] != "http.response.body" or self.start_message is None:
+            await self.send(message)
+            return
+
+        start, self.start_message = self.start_message, None
+        headers = MutableHeaders(raw=start["headers"])
+        body = message.get("body", b"")
+        if message.get("more_body", False) or len(body) < self.minimum_size or "content-encoding" in headers:
+            await self.send(start)
+            await self.send(message)
+            return
+
+        body = brotli.compress(body, quality=BROTLI_QUALITY)
+        headers["Content-Encoding"] = "br"
+        headers["Content-Length"] = str(len(body))
+        headers.add_vary_header("Accept-Encoding")
+        await self.send(start)
+        await self.send({"type": "http.response.body", "body": body})
@@ -0,0 +1,143 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, case, select, insert, union_all
+from typing import List, Optional
+from datetime import date, datetime, timedelta
+from collections import OrderedDict
+from . import models
+from .database import dialect_insert
+import pytz
+
+# Transaction action -> rollup column
+MOVEMENT_COLUMNS = {
+    "Purchase": "purchase_quantity",
+    "Issue": "issue_quantity",
+    "Return": "return_quantity",
+    "Adjustment": "adjustment_quantity",  # Signed: the net of stock found and stock written off
+}
+ROLLUP_COLUMNS = list(MOVEMENT_COLUMNS.values()) + ["transaction_count"]
+
+def local_now():
+    return datetime.now(pytz.timezone('Asia/Kolkata'))
+
+def local_today():
+    return local_now().date()
+
+def record_movement(db: Session, item_id: int, quantity: int, action: str, day: date = None):
+    """Add a transaction's quantity to the item's daily rollup row (same DB transaction as the caller)"""
+    day = day or local_today()
+    values = {
+        "item_id": item_id,
+        "day": day,
+        "purchase_quantity": 0,
+        "issue_quantity": 0,
+        "return_quantity": 0,
+        "adjustment_quantity": 0,
+        "transaction_count": 1,
+    }
+    column = MOVEMENT_COLUMNS.get(action)
+    if column:
+        values[column] = quantity
+
+    stmt = dialect_insert(models.ItemDailyMovement)
+    if stmt is not None:
+        table = models.ItemDailyMovement.__table__
+        stmt = stmt.values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["item_id", "day"],
+            set_={
+                name: table.c[name] + stmt.excluded[name]
+                for name in ROLLUP_COLUMNS
+            }
+        )
+        db.execute(stmt)
+        return
+
+    # Fallback for dialects without ON CONFLICT support
+    row = db.query(models.ItemDailyMovement).filter(
+        models.ItemDailyMovement.item_id == item_id,
+        models.ItemDailyMovement.day == day
+    ).with_for_update().first()
+    if row:
+        if column:
+            setattr(row, column, (getattr(row, column) or 0) + quantity)
+        row.transaction_count += 1
+    else:
+        db.add(models.ItemDailyMovement(**values))
+
+def recompute_daily_movements(bind):
+    """Replace the rollup table with totals recomputed from the ledger (bind: a Connection or Session)"""
+    # Hot and archived ledger rows together
+    ledger = union_all(*[
+        select(model.id, model.item_id, model.quantity, model.action, model.created_at)
+        for model in (models.Transaction, models.ArchivedTransaction)
+    ]).subquery()
+    day = func.date(ledger.c.created_at)
+
+    def quantity_for(action):
+        return func.coalesce(func.sum(case((ledger.c.action == action, ledger.c.quantity), else_=0)), 0)
+
+    source = select(
+        ledger.c.item_id,
+        day,
+        *[quantity_for(action) for action in MOVEMENT_COLUMNS],
+        func.count(ledger.c.id)
+    ).where(ledger.c.item_id.isnot(None)).group_by(ledger.c.item_id, day)
+
+    table = models.ItemDailyMovement.__table__
+    bind.execute(table.delete())
+    bind.execute(insert(table).from_select(["item_id", "day"] + ROLLUP_COLUMNS, source))
+
+def rebuild_daily_movements(db: Session):
+    """Recompute the whole rollup table from the transaction ledger"""
+    recompute_daily_movements(db)
+    db.commit()
+    return db.query(models.ItemDailyMovement).count()
+
+def _bucket_start(day: date, bucket: str):
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+def get_consumption(db: Session, start: date, end: date, item_ids: Optional[List[int]] = None, bucket: str = "day"):
+    """Per-item movement totals between start and end (inclusive), grouped into day/week/month buckets"""
+    query = db.query(models.ItemDailyMovement).filter(
+        models.ItemDailyMovement.day >= start,
+        models.ItemDailyMovement.day <= end
+    )
+    if item_ids:
+        query = query.filter(models.ItemDailyMovement.item_id.in_(item_ids))
+    rows = query.order_by(models.ItemDailyMovement.item_id, models.ItemDailyMovement.day).all()
+
+    series = OrderedDict()
+    for row in rows:
+        item_series = series.setdefault(row.item_id, {
+            "item_id": row.item_id,
+            "purchased": 0,
+            "issued": 0,
+            "returned": 0,
+            "adjusted": 0,
+            "periods": OrderedDict()
+        })
+        period_start = _bucket_start(row.day, bucket)
+        period = item_series["periods"].setdefault(period_start, {
+            "period_start": period_start,
+            "purchased": 0,
+            "issued": 0,
+            "returned": 0,
+            "adjusted": 0
+        })
+        period["purchased"] += row.purchase_quantity or 0
+        period["issued"] += row.issue_quantity or 0
+        period["returned"] += row.return_quantity or 0
+        period["adjusted"] += row.adjustment_quantity or 0
+        item_series["purchased"] += row.purchase_quantity or 0
+        item_series["issued"] += row.issue_quantity or 0
+        item_series["returned"] += row.return_quantity or 0
+        item_series["adjusted"] += row.adjustment_quantity or 0
+
+    return [
+        dict(item_series, periods=list(item_series["periods"].values()))
+        for item_series in series.values()
+    ]
@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from datetime import date, timedelta
+from ..database import get_db
+from .. import schemas, rollups, valuation, forecasting
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+@router.get("/consumption", response_model=List[schemas.ItemConsumption])
+def get_consumption(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    item_id: Optional[List[int]] = Query(None),
+    bucket: str = "day",
+    db: Session = Depends(get_db)
+):
+    """Per-item purchased/issued/returned quantities over a date range, read from the daily rollups"""
+    if bucket not in ("day", "week", "month"):
+        raise HTTPException(status_code=400, detail="bucket must be one of: day, week, month")
+    end = end or rollups.local_today()
+    start = start or end - timedelta(days=364)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    return rollups.get_consumption(db=db, start=start, end=end, item_ids=item_id, bucket=bucket)
+
+@router.get("/valuation", response_model=schemas.InventoryValuation)
+def get_inventory_valuation(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    """Inventory value from the per-item cost layers (FIFO or moving average)"""
+    return valuation.get_inventory_valuation(db=db, skip=skip, limit=limit)
+
+@router.get("/forecast", response_model=List[schemas.ItemForecast])
+def get_forecasts(
+    skip: int = 0,
+    limit: int = 100,
+    item_id: Optional[int] = None,
+    below_reorder_point: bool = False,
+    db: Session = Depends(get_db)
+):
+    """Suggested safety stock and reorder point per item, as stored by the last forecast_demand.py run"""
+    return forecasting.get_forecasts(db=db, skip=skip, limit=limit, item_id=item_id, below_reorder_point=below_reorder_point)
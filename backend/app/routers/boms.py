@@ -0,0 +1,57 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import List
+from ..database import get_db
+from .. import schemas, boms
+
+router = APIRouter(prefix="/boms", tags=["boms"])
+
+@router.post("/", response_model=schemas.BomTemplate)
+def create_bom_template(template: schemas.BomTemplateCreate, db: Session = Depends(get_db)):
+    """Create a BOM template; lines are parts or nested sub-assembly templates"""
+    if not template.name.strip():
+        raise HTTPException(status_code=400, detail="Template name must not be empty")
+    if boms.get_template_by_name(db, template.name):
+        raise HTTPException(status_code=400, detail="BOM template already exists")
+    try:
+        return boms.create_template(db=db, template=template)
+    except boms.BomError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/", response_model=List[schemas.BomTemplate])
+def get_bom_templates(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    """Get all BOM templates"""
+    return boms.get_templates(db=db, skip=skip, limit=limit)
+
+@router.get("/{template_id}", response_model=schemas.BomTemplate)
+def get_bom_template(template_id: int, db: Session = Depends(get_db)):
+    """Get a specific BOM template"""
+    template = boms.get_template(db=db, template_id=template_id)
+    if template is None:
+        raise HTTPException(status_code=404, detail="BOM template not found")
+    return template
+
+@router.put("/{template_id}", response_model=schemas.BomTemplate)
+def update_bom_template(template_id: int, template: schemas.BomTemplateCreate, db: Session = Depends(get_db)):
+    """Replace a BOM template's name, description and lines"""
+    existing = boms.get_template_by_name(db, template.name)
+    if existing is not None and existing.id != template_id:
+        raise HTTPException(status_code=400, detail="BOM template already exists")
+    try:
+        db_template = boms.update_template(db=db, template_id=template_id, template=template)
+    except boms.BomError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if db_template is None:
+        raise HTTPException(status_code=404, detail="BOM template not found")
+    return db_template
+
+@router.get("/{template_id}/explode", response_model=List[schemas.BomExplosionLine])
+def explode_bom_template(template_id: int, multiplier: int = Query(1, ge=1), db: Session = Depends(get_db)):
+    """Flattened part quantities for `multiplier` units of a template"""
+    if boms.get_template(db=db, template_id=template_id) is None:
+        raise HTTPException(status_code=404, detail="BOM template not found")
+    try:
+        parts = boms.explode(db=db, template_id=template_id, multiplier=multiplier)
+    except boms.BomError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return [{"item_id": item_id, "quantity": quantity} for item_id, quantity in parts.items()]
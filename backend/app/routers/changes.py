@@ -0,0 +1,17 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
+from .. import schemas, outbox
+
+router = APIRouter(prefix="/changes", tags=["changes"])
+
+@router.get("/", response_model=schemas.ChangeFeed)
+async def get_changes(
+    after: int = 0,
+    limit: int = Query(outbox.CHANGE_BATCH_SIZE, ge=1, le=outbox.CHANGE_MAX_BATCH_SIZE),
+    wait: float = Query(0, ge=0, le=60),
+    entity: Optional[str] = None
+):
+    """Committed changes with seq > after; with wait > 0, holds the request until something arrives"""
+    if after < 0:
+        raise HTTPException(status_code=400, detail="after must not be negative")
+    return await outbox.wait_for_changes(after=after, limit=limit, wait=wait, entity=entity)
@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from datetime import datetime
 from ..database import get_db
-from .. import crud, schemas
+from .. import crud, schemas, matching, suppliers
+from ..responses import serialize
 from fastapi import Body
 
 router = APIRouter(prefix="/purchase-orders", tags=["purchase-orders"])
@@ -10,12 +12,59 @@ router = APIRouter(prefix="/purchase-orders", tags=["purchase-orders"])
 @router.post("/", response_model=schemas.PurchaseOrder)
 def create_purchase_order(po: schemas.PurchaseOrderCreate, db: Session = Depends(get_db)):
     """Create a new purchase order"""
+    if not suppliers.normalize_name(po.supplier_name):
+        raise HTTPException(status_code=400, detail="Supplier name must not be empty")
     return crud.create_purchase_order(db=db, po=po)
 
+def _list_purchase_orders(db: Session, response: Response, skip: int, limit: int, sort: str, **filters):
+    if sort.lstrip("-") not in crud.PURCHASE_ORDER_SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(crud.PURCHASE_ORDER_SORTS)} (prefix - for descending)")
+    headers = {"X-Total-Count": str(crud.count_purchase_orders(db=db, **filters))}
+    response.headers.update(headers)
+    orders = crud.get_purchase_orders(db=db, skip=skip, limit=limit, sort=sort, **filters)
+    return serialize(schemas.PurchaseOrderListAdapter, orders, headers=headers)
+
 @router.get("/", response_model=List[schemas.PurchaseOrder])
-def get_purchase_orders(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """Get all purchase orders"""
-    return crud.get_purchase_orders(db=db, skip=skip, limit=limit)
+def get_purchase_orders(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    status: Optional[str] = None,
+    supplier_id: Optional[int] = None,
+    overdue: bool = False,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    sort: str = "id",
+    db: Session = Depends(get_db)
+):
+    """Get purchase orders, filtered and sorted in the database; the filtered total is in X-Total-Count"""
+    return _list_purchase_orders(
+        db, response, skip, limit, sort, status=status, supplier_id=supplier_id,
+        overdue=overdue, start_date=start_date, end_date=end_date
+    )
+
+@router.get("/overdue", response_model=List[schemas.PurchaseOrder])
+def get_overdue_purchase_orders(response: Response, skip: int = 0, limit: int = 100, supplier_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """Open purchase orders past their expected delivery date, longest overdue first"""
+    return _list_purchase_orders(db, response, skip, limit, "expected_delivery_date", supplier_id=supplier_id, overdue=True)
+
+# Three-way match endpoints (declared before /{po_id})
+@router.get("/matches", response_model=List[schemas.PurchaseOrderMatch])
+def get_purchase_order_matches(skip: int = 0, limit: int = 100, status: Optional[str] = None, mismatched: Optional[bool] = None, db: Session = Depends(get_db)):
+    """Invoice vs PO vs receipt match status per purchase order"""
+    return matching.get_matches(db=db, skip=skip, limit=limit, status=status, mismatched=mismatched)
+
+@router.get("/matches/summary", response_model=List[schemas.MatchStatusSummary])
+def get_purchase_order_match_summary(db: Session = Depends(get_db)):
+    """PO count and invoice variance per match status"""
+    return matching.get_match_summary(db=db)
+
+@router.post("/matches/reconcile", response_model=schemas.ReconcileResult)
+def reconcile_purchase_orders(db: Session = Depends(get_db)):
+    """Re-evaluate the match for every purchase order in one pass"""
+    evaluated = matching.reconcile(db)
+    db.commit()
+    return {"evaluated": evaluated, "summary": matching.get_match_summary(db=db)}
 
 @router.get("/{po_id}", response_model=schemas.PurchaseOrder)
 def get_purchase_order(po_id: int, db: Session = Depends(get_db)):
@@ -41,6 +90,14 @@ def receive_purchase_order_partial(po_id: int, data: schemas.PurchaseOrderPartia
         raise HTTPException(status_code=404, detail="Purchase order not found or already fully received")
     return po
 
+@router.get("/{po_id}/match", response_model=schemas.PurchaseOrderMatch)
+def get_purchase_order_match(po_id: int, db: Session = Depends(get_db)):
+    """Three-way match for a specific purchase order"""
+    match = matching.get_match(db=db, po_id=po_id)
+    if match is None:
+        raise HTTPException(status_code=404, detail="Purchase order not found")
+    return match
+
 # Invoice endpoints
 @router.get("/{po_id}/invoices", response_model=List[schemas.Invoice])
 def get_purchase_order_invoices(po_id: int, db: Session = Depends(get_db)):
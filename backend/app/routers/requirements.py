@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from ..database import get_db
-from .. import crud, schemas
-from ..models import RequirementItem, Stock, Transaction
+from .. import crud, schemas, boms
+from ..responses import serialize
+from ..models import RequirementItem, Stock
 from ..models import Requirement
 from fastapi import Depends
 from ..dependencies import require_role
@@ -15,10 +16,25 @@ def create_requirement(requirement: schemas.RequirementCreate, db: Session = Dep
     """Create a new requirement/project"""
     return crud.create_requirement(db=db, requirement=requirement)
 
+@router.post("/from-template", response_model=schemas.Requirement)
+def create_requirement_from_template(requirement: schemas.RequirementFromTemplate, db: Session = Depends(get_db)):
+    """Create a requirement from a BOM template exploded for `multiplier` units"""
+    if boms.get_template(db=db, template_id=requirement.template_id) is None:
+        raise HTTPException(status_code=404, detail="BOM template not found")
+    try:
+        return boms.create_requirement_from_template(db=db, request=requirement)
+    except boms.BomError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/", response_model=List[schemas.Requirement])
 def get_requirements(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     """Get all requirements/projects"""
-    return crud.get_requirements(db=db, skip=skip, limit=limit)
+    return serialize(schemas.RequirementListAdapter, crud.get_requirements(db=db, skip=skip, limit=limit))
+
+@router.get("/summary", response_model=List[schemas.RequirementSummary])
+def get_requirement_summaries(skip: int = 0, limit: int = Query(100, ge=1, le=1000), status: Optional[str] = None, db: Session = Depends(get_db)):
+    """Line counts, issued vs needed quantity and shortages per requirement, without the lines"""
+    return crud.get_requirement_summaries(db=db, skip=skip, limit=limit, status=status)
 
 @router.get("/{requirement_id}", response_model=schemas.Requirement)
 def get_requirement(requirement_id: int, db: Session = Depends(get_db)):
@@ -50,17 +66,12 @@ def issue_item_for_requirement(requirement_id: int, item_id: int, db: Session =
     quantity_to_issue = req_item.quantity_needed - req_item.quantity_issued
     if not stock or stock.current_quantity < quantity_to_issue:
         raise HTTPException(status_code=400, detail="Not enough stock to issue this item")
-    # Issue item
-    stock.current_quantity -= quantity_to_issue
-    req_item.quantity_issued += quantity_to_issue
-    # Create transaction
-    transaction = Transaction(
-        item_id=item_id,
-        quantity=quantity_to_issue,
-        action="Issue",
-        requirement_id=requirement_id
-    )
-    db.add(transaction)
+    # Issue item with atomic updates (consuming its reservation while the requirement is active)
+    issued = crud.issue_requirement_item(db, req_item)
+    if issued is None:
+        raise HTTPException(status_code=400, detail="Not enough stock to issue this item")
+    if issued == 0:
+        raise HTTPException(status_code=400, detail="Item already fully issued or not found")
     db.commit()
     # Optionally, mark as completed if all items are issued
     requirement = db.query(Requirement).filter(Requirement.id == requirement_id).first()
@@ -78,11 +89,7 @@ def update_requirement(requirement_id: int, requirement_update: schemas.Requirem
     if requirement is None:
         raise HTTPException(status_code=404, detail="Requirement not found")
     
-    requirement.status = requirement_update.status
-    if requirement_update.status == "Completed":
-        from datetime import datetime
-        requirement.completed_at = datetime.now()
-    
+    crud.set_requirement_status(db, requirement, requirement_update.status)
     db.commit()
     db.refresh(requirement)
     return requirement 
\ No newline at end of file
@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from ..database import get_db
+from .. import schemas, scans
+
+router = APIRouter(prefix="/scans", tags=["scans"])
+
+@router.post("/", response_model=schemas.ScanResult)
+def ingest_scans(batch: schemas.ScanBatch, db: Session = Depends(get_db)):
+    """Apply a batch of buffered barcode scans (issues and receipts) in one transaction"""
+    try:
+        return scans.ingest(db=db, batch=batch)
+    except scans.ScanConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except scans.ScanError as e:
+        raise HTTPException(status_code=400, detail=str(e))
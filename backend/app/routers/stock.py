@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from typing import List
-import pandas as pd
 import io
 import csv
 from ..database import get_db
 from .. import crud, schemas, models
+from ..cache import item_cache
+from ..responses import serialize
 from ..dependencies import require_role
 # Will use get_current_user for endpoint protection later
 
@@ -14,22 +15,26 @@ router = APIRouter(prefix="/stock", tags=["stock"])
 @router.post("/items", response_model=schemas.Item)
 def create_item(item: schemas.ItemCreate, db: Session = Depends(get_db)):
     """Create a new item"""
-    db_item = crud.get_item_by_code(db=db, code=item.code)
-    if db_item:
+    if item_cache.get_item_by_code(db=db, code=item.code):
         raise HTTPException(status_code=400, detail="Item code already exists")
     return crud.create_item(db=db, item=item)
 
+@router.post("/items/bulk", response_model=schemas.ItemBulkUpsertResponse)
+def bulk_upsert_items(items: List[schemas.ItemCreate], db: Session = Depends(get_db)):
+    """Create or update many items by code in one call (existing codes are updated)"""
+    return crud.bulk_upsert_items(db=db, items=items)
+
 @router.get("/items", response_model=List[schemas.Item])
 def get_items(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     """Get all items with their stock"""
-    items = db.query(models.Item).offset(skip).limit(limit).all()
+    items = db.query(models.Item).options(joinedload(models.Item.stock)).offset(skip).limit(limit).all()
     # The .stock relationship will be included if configured in the SQLAlchemy model
-    return items
+    return serialize(schemas.ItemListAdapter, items)
 
 @router.get("/items/{item_id}", response_model=schemas.Item)
 def get_item(item_id: int, db: Session = Depends(get_db)):
     """Get a specific item"""
-    item = crud.get_item(db=db, item_id=item_id)
+    item = item_cache.get_item(db=db, item_id=item_id)
     if item is None:
         raise HTTPException(status_code=404, detail="Item not found")
     return item
@@ -132,7 +137,7 @@ async def import_items_from_csv(file: UploadFile = File(...), db: Session = Depe
                     continue
                 
                 # Check if item code already exists
-                existing_item = crud.get_item_by_code(db=db, code=item_data['code'])
+                existing_item = item_cache.get_item_by_code(db=db, code=item_data['code'])
                 if existing_item:
                     results['errors'].append(f"Row {row_num}: Item code '{item_data['code']}' already exists")
                     results['failed'] += 1
@@ -170,13 +175,26 @@ def get_stock(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     """Get all stock levels"""
     return crud.get_stock(db=db, skip=skip, limit=limit)
 
+@router.get("/available", response_model=List[schemas.AvailableToPromise])
+def get_available_to_promise(skip: int = 0, limit: int = 100, only_short: bool = False, db: Session = Depends(get_db)):
+    """Available-to-promise (current stock minus active-requirement reservations) for the catalog"""
+    return crud.get_available_to_promise(db=db, skip=skip, limit=limit, only_short=only_short)
+
+@router.get("/{item_id}/available", response_model=schemas.AvailableToPromise)
+def get_item_available_to_promise(item_id: int, db: Session = Depends(get_db)):
+    """Available-to-promise for one item"""
+    rows = crud.get_available_to_promise(db=db, item_id=item_id, limit=1)
+    if not rows:
+        raise HTTPException(status_code=404, detail="Stock not found for this item")
+    return rows[0]
+
 @router.get("/{item_id}", response_model=schemas.StockStandalone)
 def get_stock_by_item(item_id: int, db: Session = Depends(get_db)):
     """Get stock level for a specific item"""
-    stock = crud.get_stock_by_item(db=db, item_id=item_id)
-    if stock is None:
+    item = item_cache.get_item(db=db, item_id=item_id)
+    if item is None or item.stock is None:
         raise HTTPException(status_code=404, detail="Stock not found for this item")
-    return stock
+    return schemas.StockStandalone(**item.stock.model_dump(), item=item)
 
 @router.patch("/{item_id}", response_model=schemas.StockStandalone)
 def update_stock(item_id: int, stock_update: schemas.StockUpdate, db: Session = Depends(get_db)):
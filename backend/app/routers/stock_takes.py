@@ -0,0 +1,70 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from ..database import get_db
+from .. import schemas, stock_takes
+
+router = APIRouter(prefix="/stock-takes", tags=["stock-takes"])
+
+def _get_or_404(db: Session, stock_take_id: int):
+    stock_take = stock_takes.get_stock_take(db=db, stock_take_id=stock_take_id)
+    if stock_take is None:
+        raise HTTPException(status_code=404, detail="Stock-take not found")
+    return stock_take
+
+@router.post("/", response_model=schemas.StockTake)
+def open_stock_take(stock_take: schemas.StockTakeCreate, db: Session = Depends(get_db)):
+    """Start a stock-take; stock writes for its items are refused until it is closed or cancelled"""
+    try:
+        return stock_takes.open_stock_take(db=db, stock_take=stock_take)
+    except stock_takes.StockTakeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.get("/", response_model=List[schemas.StockTake])
+def get_stock_takes(skip: int = 0, limit: int = 100, status: Optional[str] = None, db: Session = Depends(get_db)):
+    """Get stock-takes, newest first"""
+    return stock_takes.get_stock_takes(db=db, skip=skip, limit=limit, status=status)
+
+@router.get("/{stock_take_id}", response_model=schemas.StockTake)
+def get_stock_take(stock_take_id: int, db: Session = Depends(get_db)):
+    """Get a specific stock-take"""
+    return _get_or_404(db, stock_take_id)
+
+@router.post("/{stock_take_id}/counts", response_model=schemas.StockCountResult)
+def upload_counts(stock_take_id: int, counts: List[schemas.StockCount], db: Session = Depends(get_db)):
+    """Upload counted quantities in bulk (a later count of the same item replaces the earlier one)"""
+    _get_or_404(db, stock_take_id)
+    try:
+        return stock_takes.record_counts(db=db, stock_take_id=stock_take_id, counts=counts)
+    except stock_takes.StockTakeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.get("/{stock_take_id}/variances", response_model=List[schemas.StockTakeVariance])
+def get_variances(
+    stock_take_id: int,
+    skip: int = 0,
+    limit: int = Query(1000, ge=1, le=10000),
+    only_differences: bool = True,
+    db: Session = Depends(get_db)
+):
+    """Counted vs system quantity for the counted items"""
+    stock_take = _get_or_404(db, stock_take_id)
+    return stock_takes.get_variances(db=db, stock_take=stock_take, skip=skip, limit=limit, only_differences=only_differences)
+
+@router.post("/{stock_take_id}/close", response_model=schemas.StockTake)
+def close_stock_take(stock_take_id: int, db: Session = Depends(get_db)):
+    """Book every variance as an Adjustment, set stock to the counts and unfreeze the items"""
+    _get_or_404(db, stock_take_id)
+    try:
+        return stock_takes.close_stock_take(db=db, stock_take_id=stock_take_id)
+    except stock_takes.StockTakeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.post("/{stock_take_id}/cancel", response_model=schemas.StockTake)
+def cancel_stock_take(stock_take_id: int, db: Session = Depends(get_db)):
+    """Discard the counts and unfreeze the items"""
+    _get_or_404(db, stock_take_id)
+    try:
+        return stock_takes.cancel_stock_take(db=db, stock_take_id=stock_take_id)
+    except stock_takes.StockTakeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
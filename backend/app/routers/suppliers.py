@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import List
+from ..database import get_db
+from .. import crud, schemas, suppliers
+
+router = APIRouter(prefix="/suppliers", tags=["suppliers"])
+
+@router.post("/", response_model=schemas.Supplier)
+def create_supplier(supplier: schemas.SupplierCreate, db: Session = Depends(get_db)):
+    """Create a new supplier"""
+    if not suppliers.normalize_name(supplier.name):
+        raise HTTPException(status_code=400, detail="Supplier name must not be empty")
+    if suppliers.get_supplier_by_name(db, supplier.name):
+        raise HTTPException(status_code=400, detail="Supplier already exists")
+    db_supplier = suppliers.get_or_create_supplier(db, supplier.name)
+    db.commit()
+    db.refresh(db_supplier)
+    return db_supplier
+
+@router.get("/", response_model=List[schemas.Supplier])
+def get_suppliers(skip: int = 0, limit: int = 100, sort: str = "name", db: Session = Depends(get_db)):
+    """Supplier scorecards (lead time, on-time rate, open order value)"""
+    if sort not in suppliers.SCORECARD_ORDER:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(suppliers.SCORECARD_ORDER)}")
+    return suppliers.get_suppliers(db=db, skip=skip, limit=limit, sort=sort)
+
+@router.get("/{supplier_id}", response_model=schemas.Supplier)
+def get_supplier(supplier_id: int, db: Session = Depends(get_db)):
+    """Get a supplier's scorecard"""
+    supplier = suppliers.get_supplier(db=db, supplier_id=supplier_id)
+    if supplier is None:
+        raise HTTPException(status_code=404, detail="Supplier not found")
+    return supplier
+
+@router.get("/{supplier_id}/purchase-orders", response_model=List[schemas.PurchaseOrder])
+def get_supplier_purchase_orders(supplier_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    """Purchase orders placed with a supplier"""
+    if suppliers.get_supplier(db=db, supplier_id=supplier_id) is None:
+        raise HTTPException(status_code=404, detail="Supplier not found")
+    return crud.get_purchase_orders(db=db, skip=skip, limit=limit, supplier_id=supplier_id)
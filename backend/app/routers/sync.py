@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from ..database import get_db
+from .. import schemas, sync
+from ..responses import serialize
+
+router = APIRouter(prefix="/sync", tags=["sync"])
+
+@router.get("", response_model=schemas.SyncDelta)
+def get_sync_delta(
+    since: int = 0,
+    limit: int = Query(sync.SYNC_BATCH_SIZE, ge=1, le=sync.SYNC_MAX_BATCH_SIZE),
+    db: Session = Depends(get_db)
+):
+    """Items, purchase orders and requirements changed after version `since`, plus deletions"""
+    if since < 0:
+        raise HTTPException(status_code=400, detail="since must not be negative")
+    if since > sync.current_version(db):
+        raise HTTPException(status_code=409, detail="Unknown sync version, resync with since=0")
+    return serialize(schemas.SyncDeltaAdapter, sync.get_delta(db, since=since, limit=limit))
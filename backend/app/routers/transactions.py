@@ -1,15 +1,55 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from datetime import datetime
 from ..database import get_db
-from .. import crud, schemas
+from .. import crud, schemas, models, exports
 
 router = APIRouter(prefix="/transactions", tags=["transactions"])
 
 @router.get("/", response_model=List[schemas.Transaction])
-def get_transactions(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """Get all transactions"""
-    return crud.get_transactions(db=db, skip=skip, limit=limit)
+def get_transactions(
+    skip: int = 0,
+    limit: int = 100,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    item_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """Get transactions, newest first (archived rows are included when start_date reaches back into the archive)"""
+    return crud.get_transactions(db=db, skip=skip, limit=limit, start_date=start_date, end_date=end_date, item_id=item_id)
+
+@router.post("/exports", response_model=schemas.ExportJob)
+def create_export(export: schemas.ExportRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """Start a background export of the ledger (Parquet or XLSX) for a date/item filter"""
+    if export.format not in exports.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(exports.EXPORT_FORMATS)}")
+    try:
+        exports.check_format(export.format)
+    except exports.ExportDependencyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    job = exports.create_export_job(db=db, export_format=export.format, start_date=export.start_date, end_date=export.end_date, item_ids=export.item_ids)
+    background_tasks.add_task(exports.run_export_job, job.id)
+    return job
+
+@router.get("/exports/{job_id}", response_model=schemas.ExportJob)
+def get_export(job_id: int, db: Session = Depends(get_db)):
+    """Get the status of an export job"""
+    job = db.query(models.ExportJob).filter(models.ExportJob.id == job_id).first()
+    if job is None:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    return job
+
+@router.get("/exports/{job_id}/download")
+def download_export(job_id: int, db: Session = Depends(get_db)):
+    """Download the file of a completed export job"""
+    job = db.query(models.ExportJob).filter(models.ExportJob.id == job_id).first()
+    if job is None:
+        raise HTTPException(status_code=404, detail="Export job not found")
+    if job.status != "Completed":
+        raise HTTPException(status_code=409, detail=f"Export job is {job.status}")
+    return FileResponse(job.file_path, filename=f"transactions_{job.id}{exports.EXPORT_FORMATS[job.format]}")
 
 @router.get("/dashboard", response_model=schemas.DashboardSummary)
 def get_dashboard_summary(db: Session = Depends(get_db)):
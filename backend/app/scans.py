@@ -0,0 +1,238 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import select, delete, insert
+from collections import defaultdict
+from datetime import timedelta
+from . import models, schemas, crud
+from .cache import code_index
+from .database import dialect_insert
+from .rollups import local_now
+import os
+import time
+
+SCAN_BATCH_LIMIT = int(os.getenv("SCAN_BATCH_LIMIT", "5000"))
+# Applied scans are remembered this long; a batch resent after that would be applied again
+SCAN_EVENT_TTL = timedelta(hours=float(os.getenv("SCAN_EVENT_TTL_HOURS", "72")))
+SWEEP_INTERVAL_SECONDS = float(os.getenv("SCAN_SWEEP_SECONDS", "300"))
+SWEEP_BATCH_SIZE = 5000
+
+class ScanError(Exception):
+    pass
+
+class ScanConflict(ScanError):
+    """Stock or a line moved between validation and the write; nothing was applied"""
+
+_last_sweep = time.monotonic()
+
+def _claim(db: Session, rows):
+    """Insert the scan events, skipping event ids seen before; returns the ids inserted here"""
+    table = models.ScanEvent.__table__
+    stmt = dialect_insert(table)
+    if stmt is not None:
+        stmt = stmt.on_conflict_do_nothing(index_elements=["event_id"]).returning(table.c.event_id)
+        return set(db.execute(stmt, rows).scalars())
+    seen = set(db.execute(select(table.c.event_id).where(table.c.event_id.in_([row["event_id"] for row in rows]))).scalars())
+    rows = [row for row in rows if row["event_id"] not in seen]
+    if rows:
+        db.execute(insert(table), rows)
+    return {row["event_id"] for row in rows}
+
+def _load_lines(db: Session, model, parent_column, parent_ids, item_ids):
+    """{(parent_id, item_id): [lines]} for the batch's documents and items, oldest line first"""
+    lines = defaultdict(list)
+    if parent_ids:
+        for line in db.query(model).filter(parent_column.in_(parent_ids), model.item_id.in_(item_ids)).order_by(model.id):
+            lines[(getattr(line, parent_column.key), line.item_id)].append(line)
+    return lines
+
+def _plan(db: Session, totals):
+    """Check every (action, document, item) total against the current documents and stock; returns
+    {key: error} and the loaded orders and lines. Receipts count first, so goods received in a batch can be issued."""
+    item_ids = sorted({item_id for _, _, item_id in totals})
+    stock = {
+        item_id: (quantity or 0, session_id)
+        for item_id, quantity, session_id in db.query(
+            models.Stock.item_id, models.Stock.current_quantity, models.Stock.count_session_id
+        ).filter(models.Stock.item_id.in_(item_ids))
+    }
+    po_ids = sorted({ref for action, ref, _ in totals if action == "receive"})
+    requirement_ids = sorted({ref for action, ref, _ in totals if action == "issue"})
+    orders = {po.id: po for po in db.query(models.PurchaseOrder).filter(models.PurchaseOrder.id.in_(po_ids))} if po_ids else {}
+    requirements = dict(db.query(models.Requirement.id, models.Requirement.status).filter(
+        models.Requirement.id.in_(requirement_ids)
+    )) if requirement_ids else {}
+    po_lines = _load_lines(db, models.PurchaseOrderItem, models.PurchaseOrderItem.purchase_order_id, po_ids, item_ids)
+    requirement_lines = _load_lines(db, models.RequirementItem, models.RequirementItem.requirement_id, requirement_ids, item_ids)
+
+    available = {item_id: quantity for item_id, (quantity, _) in stock.items()}
+    errors = {}
+    for key in sorted(totals, key=lambda key: (key[0] != "receive", key)):
+        action, ref, item_id = key
+        quantity = totals[key]
+        if stock.get(item_id, (0, None))[1] is not None:
+            errors[key] = "Stock is frozen by an open stock-take"
+            continue
+        if action == "receive":
+            po = orders.get(ref)
+            lines = po_lines.get((ref, item_id), [])
+            outstanding = sum(line.quantity - (line.received_quantity or 0) for line in lines)
+            if po is None:
+                errors[key] = "Purchase order not found"
+            elif po.status in ("Received", "Cancelled"):
+                errors[key] = f"Purchase order is {po.status}"
+            elif not lines:
+                errors[key] = "Item is not on this purchase order"
+            elif quantity > outstanding:
+                errors[key] = f"Exceeds the {outstanding} still to receive"
+            else:
+                available[item_id] = available.get(item_id, 0) + quantity
+        else:
+            status = requirements.get(ref)
+            lines = requirement_lines.get((ref, item_id), [])
+            outstanding = sum(line.quantity_needed - (line.quantity_issued or 0) for line in lines)
+            if status is None:
+                errors[key] = "Requirement not found"
+            elif status != "Active":
+                errors[key] = f"Requirement is {status}"
+            elif not lines:
+                errors[key] = "Item is not on this requirement"
+            elif quantity > outstanding:
+                errors[key] = f"Exceeds the {outstanding} still to issue"
+            elif available.get(item_id, 0) < quantity:
+                errors[key] = f"Not enough stock ({available.get(item_id, 0)} available)"
+            else:
+                available[item_id] -= quantity
+    return errors, orders, po_lines, requirement_lines
+
+def _apply(db: Session, totals, orders, po_lines, requirement_lines):
+    """Book the planned totals: a ledger entry per document line and item, then every stock
+    movement of the batch in one UPDATE"""
+    received_value = defaultdict(float)
+    reservations, stock_deltas = defaultdict(int), defaultdict(int)
+    for (action, ref, item_id), quantity in sorted(totals.items(), key=lambda entry: (entry[0][0] != "receive", entry[0])):
+        if action == "receive":
+            remaining = quantity
+            for line in po_lines[(ref, item_id)]:
+                amount = crud.receive_line(db, line, remaining)
+                if amount:
+                    crud.record_transaction(db, item_id=item_id, quantity=amount, action="Purchase", purchase_order_id=ref, unit_cost=line.unit_price)
+                    received_value[ref] += amount * line.unit_price
+                    remaining -= amount
+            if remaining:
+                raise ScanConflict(f"Purchase order {ref} changed while the scans were applied; resend the batch")
+            stock_deltas[item_id] += quantity
+        else:
+            remaining = quantity
+            for line in requirement_lines[(ref, item_id)]:
+                remaining -= crud.issue_line(db, line, remaining)
+            if remaining:
+                raise ScanConflict(f"Requirement {ref} changed while the scans were applied; resend the batch")
+            reservations[item_id] -= quantity
+            stock_deltas[item_id] -= quantity
+            crud.record_transaction(db, item_id=item_id, quantity=quantity, action="Issue", requirement_id=ref)
+
+    if not crud.move_stock_many(db, stock_deltas):
+        raise ScanConflict("Stock changed while the scans were applied; resend the batch")
+    crud.adjust_reservations(db, reservations)
+    for po_id, value in sorted(received_value.items()):
+        crud.finish_partial_receipt(db, orders[po_id], value)
+    issued_requirements = sorted({ref for action, ref, _ in totals if action == "issue"})
+    if issued_requirements:
+        now = local_now()
+        for requirement in db.query(models.Requirement).filter(models.Requirement.id.in_(issued_requirements)):
+            if not crud.outstanding_by_item(db, requirement.id):
+                requirement.status = "Completed"
+                requirement.completed_at = now
+
+def ingest(db: Session, batch: schemas.ScanBatch):
+    """Apply a batch of buffered scans in one transaction: events already applied are skipped,
+    codes resolve through the in-memory code index, and scans of the same item against the same
+    document are summed into one stock move. A document/item whose total cannot be applied is
+    rejected as a whole (its events are not remembered, so they can be corrected and resent)."""
+    events = batch.events
+    if len(events) > SCAN_BATCH_LIMIT:
+        raise ScanError(f"At most {SCAN_BATCH_LIMIT} scans per batch")
+    ids_by_code = code_index.resolve(db, {event.code for event in events})
+    rejected, candidates, duplicates = [], {}, 0
+    for index, event in enumerate(events):
+        if event.action == "issue":
+            ref = event.requirement_id
+        elif event.action == "receive":
+            ref = event.purchase_order_id
+        else:
+            rejected.append({"index": index, "event_id": event.event_id, "error": "action must be issue or receive"})
+            continue
+        if ref is None:
+            field = "requirement_id" if event.action == "issue" else "purchase_order_id"
+            rejected.append({"index": index, "event_id": event.event_id, "error": f"{event.action} scans need a {field}"})
+        elif event.code not in ids_by_code:
+            rejected.append({"index": index, "event_id": event.event_id, "error": "Unknown item code"})
+        elif event.event_id in candidates:
+            duplicates += 1  # Repeated within the batch
+        else:
+            candidates[event.event_id] = (index, (event.action, ref, ids_by_code[event.code]))
+
+    now = local_now()
+    claimed = _claim(db, [
+        {
+            "event_id": event_id, "scanner_id": batch.scanner_id, "code": events[index].code, "item_id": key[2],
+            "action": key[0], "quantity": events[index].quantity, "scanned_at": events[index].scanned_at,
+            "requirement_id": events[index].requirement_id, "purchase_order_id": events[index].purchase_order_id,
+            "received_at": now,
+        }
+        for event_id, (index, key) in candidates.items()
+    ]) if candidates else set()
+    duplicates += len(candidates) - len(claimed)
+
+    groups, totals = defaultdict(list), defaultdict(int)
+    for event_id, (index, key) in candidates.items():
+        if event_id in claimed:
+            groups[key].append(index)
+            totals[key] += events[index].quantity
+    errors, orders, po_lines, requirement_lines = _plan(db, totals) if totals else ({}, {}, {}, {})
+    forgotten = []
+    for key, error in errors.items():
+        for index in groups.pop(key):
+            rejected.append({"index": index, "event_id": events[index].event_id, "error": error})
+            forgotten.append(events[index].event_id)
+        del totals[key]
+    try:
+        _apply(db, totals, orders, po_lines, requirement_lines)
+    except ScanConflict:
+        db.rollback()
+        raise
+
+    if forgotten:
+        table = models.ScanEvent.__table__
+        db.execute(delete(table).where(table.c.event_id.in_(forgotten)))
+    db.commit()
+    _maybe_sweep(db)
+
+    rejected.sort(key=lambda row: row["index"])
+    return {
+        "accepted": sum(len(indexes) for indexes in groups.values()),
+        "duplicates": duplicates,
+        "rejected": rejected,
+        "applied": [
+            {
+                "action": action, "item_id": item_id, "quantity": totals[(action, ref, item_id)], "events": len(indexes),
+                "requirement_id": ref if action == "issue" else None,
+                "purchase_order_id": ref if action == "receive" else None,
+            }
+            for (action, ref, item_id), indexes in sorted(groups.items())
+        ],
+    }
+
+def _maybe_sweep(db: Session):
+    """Forget applied scans older than SCAN_EVENT_TTL, a batch per commit, at most every SWEEP_INTERVAL_SECONDS"""
+    global _last_sweep
+    if time.monotonic() - _last_sweep < SWEEP_INTERVAL_SECONDS:
+        return
+    _last_sweep = time.monotonic()
+    table = models.ScanEvent.__table__
+    cutoff = local_now() - SCAN_EVENT_TTL
+    while True:
+        expired = select(table.c.id).where(table.c.received_at < cutoff).limit(SWEEP_BATCH_SIZE)
+        deleted = db.execute(delete(table).where(table.c.id.in_(expired))).rowcount
+        db.commit()
+        if deleted < SWEEP_BATCH_SIZE:
+            break
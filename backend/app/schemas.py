@@ -1,6 +1,6 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter
 from typing import List, Optional
-from datetime import datetime
+from datetime import datetime, date
 
 # User Schemas
 class UserBase(BaseModel):
@@ -36,6 +36,7 @@ class Stock(BaseModel):
     id: int
     item_id: int
     current_quantity: int
+    reserved_quantity: int = 0
     last_updated: datetime
     class Config:
         from_attributes = True
@@ -61,6 +62,20 @@ class Item(ItemBase):
     class Config:
         from_attributes = True
 
+class ItemUpsertResult(BaseModel):
+    index: int
+    code: str
+    id: Optional[int] = None
+    status: str  # created, updated, superseded (a later row has the same code), failed
+    error: Optional[str] = None
+
+class ItemBulkUpsertResponse(BaseModel):
+    created: int = 0
+    updated: int = 0
+    superseded: int = 0
+    failed: int = 0
+    results: List[ItemUpsertResult] = []
+
 # Invoice Schemas
 class InvoiceBase(BaseModel):
     invoice_number: str
@@ -97,6 +112,26 @@ class PurchaseOrderItem(PurchaseOrderItemBase):
     class Config:
         from_attributes = True
 
+# Supplier Schemas
+class SupplierBase(BaseModel):
+    name: str
+
+class SupplierCreate(SupplierBase):
+    pass
+
+class Supplier(SupplierBase):
+    id: int
+    created_at: datetime
+    order_count: int = 0
+    received_order_count: int = 0
+    average_lead_time_days: Optional[float] = None
+    on_time_rate: Optional[float] = None
+    open_order_value: float = 0.0
+    last_received_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
 # Purchase Order Schemas
 class PurchaseOrderBase(BaseModel):
     supplier_name: str
@@ -118,6 +153,7 @@ class PurchaseOrderPartialReceive(BaseModel):
 class PurchaseOrder(PurchaseOrderBase):
     id: int
     po_number: str
+    supplier_id: Optional[int] = None
     status: str
     total_amount: float
     created_at: datetime
@@ -128,6 +164,30 @@ class PurchaseOrder(PurchaseOrderBase):
     class Config:
         from_attributes = True
 
+class PurchaseOrderMatch(BaseModel):
+    purchase_order_id: int
+    ordered_value: float
+    received_value: float
+    invoiced_value: float
+    invoice_count: int
+    invoice_variance: float
+    order_variance: float
+    status: str
+    mismatched: bool
+    evaluated_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+class MatchStatusSummary(BaseModel):
+    status: str
+    count: int
+    invoice_variance: float
+
+class ReconcileResult(BaseModel):
+    evaluated: int
+    summary: List[MatchStatusSummary] = []
+
 # Requirement Item Schemas
 class RequirementItemBase(BaseModel):
     item_id: int
@@ -166,6 +226,58 @@ class Requirement(RequirementBase):
     class Config:
         from_attributes = True
 
+class RequirementSummary(BaseModel):
+    id: int
+    project_name: str
+    status: str
+    created_at: datetime
+    completed_at: Optional[datetime] = None
+    lines_total: int
+    lines_issued: int
+    quantity_needed: int
+    quantity_issued: int
+    fill_percent: float
+    shortage_count: int
+    ready_to_issue: bool
+
+class RequirementFromTemplate(RequirementBase):
+    template_id: int
+    multiplier: int = Field(1, ge=1)
+
+# BOM Template Schemas
+class BomLineBase(BaseModel):
+    item_id: Optional[int] = None  # A part...
+    sub_template_id: Optional[int] = None  # ...or a nested sub-assembly
+    quantity: int
+
+class BomLineCreate(BomLineBase):
+    pass
+
+class BomLine(BomLineBase):
+    id: int
+    
+    class Config:
+        from_attributes = True
+
+class BomTemplateBase(BaseModel):
+    name: str
+    description: Optional[str] = None
+
+class BomTemplateCreate(BomTemplateBase):
+    lines: List[BomLineCreate]
+
+class BomTemplate(BomTemplateBase):
+    id: int
+    created_at: datetime
+    lines: List[BomLine] = []
+    
+    class Config:
+        from_attributes = True
+
+class BomExplosionLine(BaseModel):
+    item_id: int
+    quantity: int
+
 # Stock Schemas (standalone)
 class StockBase(BaseModel):
     item_id: int
@@ -179,12 +291,96 @@ class StockUpdate(BaseModel):
 
 class StockStandalone(StockBase):
     id: int
+    reserved_quantity: int = 0
     last_updated: datetime
     item: Item
     
     class Config:
         from_attributes = True
 
+class AvailableToPromise(BaseModel):
+    item_id: int
+    code: str
+    name: str
+    current_quantity: int
+    reserved_quantity: int
+    available_quantity: int
+
+# Stock-take Schemas
+class StockTakeCreate(BaseModel):
+    name: str
+    item_ids: Optional[List[int]] = None  # Omit to count every item
+
+class StockTake(BaseModel):
+    id: int
+    name: str
+    status: str
+    item_count: int
+    counted_count: int
+    adjusted_count: int
+    variance_quantity: int
+    created_at: datetime
+    closed_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+class StockCount(BaseModel):
+    item_id: Optional[int] = None  # Either the item id...
+    code: Optional[str] = None  # ...or its code
+    counted_quantity: int = Field(..., ge=0)
+
+class StockCountRejection(BaseModel):
+    index: int
+    item_id: Optional[int] = None
+    code: Optional[str] = None
+    error: str
+
+class StockCountResult(BaseModel):
+    accepted: int
+    rejected: List[StockCountRejection] = []
+
+class StockTakeVariance(BaseModel):
+    item_id: int
+    code: str
+    name: str
+    counted_quantity: int
+    system_quantity: int
+    variance: int
+
+# Scan Ingest Schemas
+class ScanEventCreate(BaseModel):
+    event_id: str = Field(..., min_length=1, max_length=64)  # Unique per scan; resent unchanged on retry
+    code: str
+    quantity: int = Field(1, ge=1)
+    action: str  # issue (needs requirement_id) or receive (needs purchase_order_id)
+    requirement_id: Optional[int] = None
+    purchase_order_id: Optional[int] = None
+    scanned_at: Optional[datetime] = None
+
+class ScanBatch(BaseModel):
+    scanner_id: Optional[str] = None
+    events: List[ScanEventCreate]
+
+class ScanRejection(BaseModel):
+    index: int
+    event_id: str
+    error: str
+
+class ScanApplied(BaseModel):
+    action: str
+    item_id: int
+    requirement_id: Optional[int] = None
+    purchase_order_id: Optional[int] = None
+    quantity: int
+    events: int
+
+class ScanResult(BaseModel):
+    accepted: int
+    duplicates: int
+    rejected: List[ScanRejection] = []
+    applied: List[ScanApplied] = []
+
 # Transaction Schemas
 class TransactionBase(BaseModel):
     item_id: int
@@ -206,6 +402,25 @@ class Transaction(TransactionBase):
     class Config:
         from_attributes = True
 
+# Ledger Export Schemas
+class ExportRequest(BaseModel):
+    format: str = "parquet"  # parquet or xlsx
+    start_date: Optional[datetime] = None
+    end_date: Optional[datetime] = None
+    item_ids: Optional[List[int]] = None
+
+class ExportJob(BaseModel):
+    id: int
+    status: str
+    format: str
+    row_count: int = 0
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
 # To-Be-Ordered Schema
 class ToBeOrderedItem(BaseModel):
     item: Item
@@ -217,6 +432,33 @@ class ToBeOrderedItem(BaseModel):
     class Config:
         from_attributes = True
 
+# Change Feed Schemas
+class ChangeRecord(BaseModel):
+    seq: int
+    entity: str
+    entity_id: int
+    op: str
+    data: Optional[dict] = None
+    created_at: datetime
+
+class ChangeFeed(BaseModel):
+    changes: List[ChangeRecord] = []
+    last_seq: int
+    has_more: bool
+
+# Sync Schemas
+class SyncTombstone(BaseModel):
+    entity: str
+    id: int
+
+class SyncDelta(BaseModel):
+    version: int
+    has_more: bool
+    items: List[Item] = []
+    purchase_orders: List[PurchaseOrder] = []
+    requirements: List[Requirement] = []
+    deleted: List[SyncTombstone] = []
+
 # Dashboard Summary Schema
 class DashboardSummary(BaseModel):
     total_stock_items: int
@@ -229,10 +471,61 @@ class DashboardSummary(BaseModel):
     class Config:
         from_attributes = True
 
+# Analytics Schemas
+class ConsumptionPeriod(BaseModel):
+    period_start: date
+    purchased: int = 0
+    issued: int = 0
+    returned: int = 0
+    adjusted: int = 0  # Net signed adjustments
+
+class ItemConsumption(BaseModel):
+    item_id: int
+    purchased: int = 0
+    issued: int = 0
+    returned: int = 0
+    adjusted: int = 0
+    periods: List[ConsumptionPeriod] = []
+
+class ItemValuation(BaseModel):
+    item_id: int
+    quantity: int
+    total_value: float
+    average_cost: float
+    
+    class Config:
+        from_attributes = True
+
+class InventoryValuation(BaseModel):
+    method: str
+    total_quantity: int
+    total_value: float
+    items: List[ItemValuation] = []
+
+class ItemForecast(BaseModel):
+    item_id: int
+    code: str
+    average_daily_demand: float
+    smoothed_daily_demand: float
+    demand_std: float
+    lead_time_days: float
+    safety_stock: int
+    reorder_point: int
+    minimum_stock: Optional[int] = None
+    current_quantity: int
+    history_days: int
+    computed_at: Optional[datetime] = None
+
 # Authentication Schemas
 class Token(BaseModel):
     access_token: str
     token_type: str
 
 class TokenData(BaseModel):
-    username: Optional[str] = None 
\ No newline at end of file
+    username: Optional[str] = None 
+
+# Prebuilt serializers for the big list endpoints (used by responses.serialize with FAST_RESPONSES=1)
+ItemListAdapter = TypeAdapter(List[Item])
+PurchaseOrderListAdapter = TypeAdapter(List[PurchaseOrder])
+RequirementListAdapter = TypeAdapter(List[Requirement])
+SyncDeltaAdapter = TypeAdapter(SyncDelta)
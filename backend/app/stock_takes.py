@@ -0,0 +1,190 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, select, update, delete, insert, and_
+from typing import List, Optional
+from . import models, schemas, cache, outbox, crud
+from .database import dialect_insert
+from .rollups import local_now
+
+class StockTakeError(Exception):
+    pass
+
+def get_stock_takes(db: Session, skip: int = 0, limit: int = 100, status: Optional[str] = None):
+    query = db.query(models.StockTake)
+    if status:
+        query = query.filter(models.StockTake.status == status)
+    return query.order_by(models.StockTake.id.desc()).offset(skip).limit(limit).all()
+
+def get_stock_take(db: Session, stock_take_id: int):
+    return db.query(models.StockTake).filter(models.StockTake.id == stock_take_id).first()
+
+def open_stock_take(db: Session, stock_take: schemas.StockTakeCreate):
+    """Start a count and freeze stock writes for its items (every item when item_ids is omitted)"""
+    stock = models.Stock.__table__
+    item_ids = sorted(set(stock_take.item_ids)) if stock_take.item_ids is not None else None
+    if item_ids is not None:
+        if not item_ids:
+            raise StockTakeError("item_ids must not be empty")
+        found = set(db.execute(select(models.Item.id).where(models.Item.id.in_(item_ids))).scalars())
+        if found != set(item_ids):
+            raise StockTakeError(f"Items not found: {', '.join(str(item_id) for item_id in sorted(set(item_ids) - found))}")
+        item_filter = stock.c.item_id.in_(item_ids)
+    else:
+        item_filter = stock.c.item_id.isnot(None)
+
+    # Items that were never stocked are counted from zero
+    missing = select(models.Item.id).where(
+        models.Item.id.notin_(select(stock.c.item_id).where(stock.c.item_id.isnot(None)))
+    )
+    if item_ids is not None:
+        missing = missing.where(models.Item.id.in_(item_ids))
+    missing = db.execute(missing).scalars().all()
+    if missing:
+        now = local_now()
+        db.execute(insert(stock), [{"item_id": item_id, "current_quantity": 0, "last_updated": now} for item_id in missing])
+        outbox.record_changes(db, "stock", missing, op="insert")
+
+    busy = db.execute(select(stock.c.item_id).where(item_filter, stock.c.count_session_id.isnot(None)).limit(20)).scalars().all()
+    if busy:
+        db.rollback()
+        raise StockTakeError(f"Items already under count: {', '.join(str(item_id) for item_id in busy)}")
+
+    db_stock_take = models.StockTake(name=stock_take.name, status="Open")
+    db.add(db_stock_take)
+    db.flush()
+    expected = db.execute(select(func.count()).select_from(stock).where(item_filter)).scalar()
+    frozen = db.execute(update(stock).where(item_filter, stock.c.count_session_id.is_(None)).values(
+        count_session_id=db_stock_take.id
+    )).rowcount
+    if frozen != expected:
+        db.rollback()  # Another count froze some of the items in the meantime
+        raise StockTakeError("Some items were put under count by another stock-take; try again")
+    db_stock_take.item_count = frozen
+    db.commit()
+    db.refresh(db_stock_take)
+    return db_stock_take
+
+def record_counts(db: Session, stock_take_id: int, counts: List[schemas.StockCount]):
+    """Upsert uploaded counts in one statement; items given by id or code, the last count per item wins"""
+    codes = {count.code for count in counts if count.item_id is None and count.code}
+    ids_by_code = dict(db.query(models.Item.code, models.Item.id).filter(models.Item.code.in_(codes))) if codes else {}
+    rejected, latest = [], {}
+    for index, count in enumerate(counts):
+        item_id = count.item_id if count.item_id is not None else ids_by_code.get(count.code)
+        if item_id is None:
+            rejected.append({"index": index, "item_id": count.item_id, "code": count.code, "error": "Item not found"})
+            continue
+        latest[item_id] = (index, count.counted_quantity)
+
+    stock = models.Stock.__table__
+    under_count = set(db.execute(select(stock.c.item_id).where(
+        stock.c.count_session_id == stock_take_id, stock.c.item_id.in_(list(latest))
+    )).scalars()) if latest else set()
+    for item_id in sorted(set(latest) - under_count):
+        index = latest.pop(item_id)[0]
+        rejected.append({"index": index, "item_id": item_id, "code": counts[index].code, "error": "Item is not part of this stock-take"})
+
+    now = local_now()
+    rows = [
+        {"stock_take_id": stock_take_id, "item_id": item_id, "counted_quantity": quantity, "counted_at": now}
+        for item_id, (index, quantity) in sorted(latest.items())
+    ]
+    table = models.StockTakeLine.__table__
+    if rows:
+        stmt = dialect_insert(table)
+        if stmt is not None:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["stock_take_id", "item_id"],
+                set_={"counted_quantity": stmt.excluded.counted_quantity, "counted_at": stmt.excluded.counted_at}
+            )
+            db.execute(stmt, rows)
+        else:
+            db.execute(delete(table).where(table.c.stock_take_id == stock_take_id, table.c.item_id.in_(list(latest))))
+            db.execute(insert(table), rows)
+
+    # Guarded on the status so counts cannot land after the session was closed
+    counted = select(func.count()).select_from(table).where(table.c.stock_take_id == stock_take_id).scalar_subquery()
+    still_open = db.query(models.StockTake).filter(
+        models.StockTake.id == stock_take_id, models.StockTake.status == "Open"
+    ).update({models.StockTake.counted_count: counted}, synchronize_session=False)
+    if not still_open:
+        db.rollback()
+        raise StockTakeError("Stock-take is not open")
+    db.commit()
+    rejected.sort(key=lambda row: row["index"])
+    return {"accepted": len(rows), "rejected": rejected}
+
+def get_variances(db: Session, stock_take: models.StockTake, skip: int = 0, limit: int = 1000, only_differences: bool = True):
+    """Counted vs system quantity per counted item in one set-based query (system stock is frozen
+    while the count is open; after closing, the snapshot taken at close is used)"""
+    line = models.StockTakeLine
+    system = line.system_quantity if stock_take.status != "Open" else func.coalesce(models.Stock.current_quantity, 0)
+    variance = line.counted_quantity - system
+    query = db.query(
+        line.item_id, models.Item.code, models.Item.name, line.counted_quantity,
+        system.label("system_quantity"), variance.label("variance")
+    ).join(models.Item, models.Item.id == line.item_id).outerjoin(
+        models.Stock, models.Stock.item_id == line.item_id
+    ).filter(line.stock_take_id == stock_take.id)
+    if only_differences:
+        query = query.filter(variance != 0)
+    return [row._asdict() for row in query.order_by(line.item_id).offset(skip).limit(limit).all()]
+
+def _claim(db: Session, stock_take_id: int, status: str):
+    claimed = db.query(models.StockTake).filter(
+        models.StockTake.id == stock_take_id, models.StockTake.status == "Open"
+    ).update({models.StockTake.status: status, models.StockTake.closed_at: local_now()}, synchronize_session=False)
+    if not claimed:
+        db.rollback()
+        raise StockTakeError("Stock-take is not open")
+
+def _unfreeze(db: Session, stock_take_id: int):
+    stock = models.Stock.__table__
+    db.execute(update(stock).where(stock.c.count_session_id == stock_take_id).values(count_session_id=None))
+
+def close_stock_take(db: Session, stock_take_id: int):
+    """Apply every variance in one commit: stock is set to the count with one UPDATE, each
+    difference is booked as an Adjustment transaction, and the items are unfrozen"""
+    _claim(db, stock_take_id, "Closed")
+    stock, line = models.Stock.__table__, models.StockTakeLine.__table__
+    lines_of_session = line.c.stock_take_id == stock_take_id
+
+    # Snapshot system stock on the lines; it cannot have moved since the items were frozen
+    db.execute(update(line).where(lines_of_session).values(system_quantity=func.coalesce(
+        select(stock.c.current_quantity).where(stock.c.item_id == line.c.item_id).scalar_subquery(), 0
+    )))
+    differing = and_(lines_of_session, line.c.counted_quantity != line.c.system_quantity)
+    variances = db.execute(select(
+        line.c.item_id, line.c.counted_quantity - line.c.system_quantity
+    ).where(differing).order_by(line.c.item_id)).all()
+
+    now = local_now()
+    db.execute(update(stock).where(
+        stock.c.count_session_id == stock_take_id,
+        stock.c.item_id.in_(select(line.c.item_id).where(differing))
+    ).values(
+        current_quantity=select(line.c.counted_quantity).where(
+            lines_of_session, line.c.item_id == stock.c.item_id
+        ).scalar_subquery(),
+        last_updated=now
+    ))
+    _unfreeze(db, stock_take_id)
+
+    for item_id, variance in variances:
+        crud.record_transaction(db, item_id=item_id, quantity=variance, action="Adjustment")
+    adjusted = [item_id for item_id, _ in variances]
+    cache.mark_dirty(db, adjusted)
+    outbox.record_changes(db, "stock", adjusted)
+
+    db.query(models.StockTake).filter(models.StockTake.id == stock_take_id).update({
+        models.StockTake.adjusted_count: len(variances),
+        models.StockTake.variance_quantity: sum(variance for _, variance in variances),
+    }, synchronize_session=False)
+    db.commit()
+    return get_stock_take(db, stock_take_id)
+
+def cancel_stock_take(db: Session, stock_take_id: int):
+    """Discard the counts and unfreeze the items without changing stock"""
+    _claim(db, stock_take_id, "Cancelled")
+    _unfreeze(db, stock_take_id)
+    db.commit()
+    return get_stock_take(db, stock_take_id)
@@ -0,0 +1,199 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func, select, update, bindparam
+from sqlalchemy.exc import IntegrityError
+from typing import Optional
+from datetime import datetime
+from . import models, outbox
+from .database import dialect_insert
+import pytz
+
+# Scorecard sort keys -> SQL expressions over the precomputed rollups
+SCORECARD_ORDER = {
+    "name": models.Supplier.name.asc(),
+    "on_time_rate": (models.Supplier.on_time_count * 1.0 / func.nullif(models.Supplier.rated_order_count, 0)).desc(),
+    "lead_time": (models.Supplier.total_lead_time_days / func.nullif(models.Supplier.received_order_count, 0)).asc(),
+    "open_order_value": models.Supplier.open_order_value.desc(),
+}
+
+def normalize_name(name: str):
+    return " ".join((name or "").split())
+
+def name_key(name: str):
+    """Matching key behind the unique index: names differing only in case or spacing are one supplier"""
+    return normalize_name(name).lower()
+
+def _naive(value: datetime):
+    return value.replace(tzinfo=None) if value is not None and value.tzinfo else value
+
+def lead_time_days(created_at: datetime, received_at: datetime):
+    """Days from order to receipt, never negative: older versions stamped received_at in naive server
+    time (UTC on most hosts), which can land before a same-day created_at stamped in Asia/Kolkata"""
+    return max((_naive(received_at) - _naive(created_at)).total_seconds() / 86400, 0.0)
+
+def is_on_time(received_at: datetime, expected_delivery_date: Optional[datetime]):
+    """None when the order had no expected date to be measured against"""
+    if expected_delivery_date is None:
+        return None
+    return _naive(received_at).date() <= _naive(expected_delivery_date).date()
+
+def get_supplier_by_name(db: Session, name: str):
+    return db.query(models.Supplier).filter(models.Supplier.name_key == name_key(name)).first()
+
+def get_or_create_supplier(db: Session, name: str):
+    """Supplier row for a free-text name; names are matched ignoring case and repeated whitespace.
+    A new supplier is inserted in the caller's transaction, so it is rolled back with it."""
+    supplier = get_supplier_by_name(db, name)
+    if supplier is not None:
+        return supplier
+    table = models.Supplier.__table__
+    stmt = dialect_insert(table)
+    if stmt is None:
+        try:
+            with db.begin_nested():
+                supplier = models.Supplier(name=normalize_name(name), name_key=name_key(name))
+                db.add(supplier)
+        except IntegrityError:
+            # Created by a concurrent request in the meantime
+            supplier = get_supplier_by_name(db, name)
+        return supplier
+    # A concurrent request creating the same supplier makes this a no-op instead of an error
+    created = db.execute(stmt.values(name=normalize_name(name), name_key=name_key(name)).on_conflict_do_nothing(
+        index_elements=["name_key"]
+    ).returning(table.c.id)).scalar()
+    if created is not None:
+        outbox.record_changes(db, "suppliers", [created], op="insert")
+    return get_supplier_by_name(db, name)
+
+def record_order(db: Session, supplier_id: int, order_value: float):
+    """A new PO adds to the supplier's order count and open order value"""
+    db.query(models.Supplier).filter(models.Supplier.id == supplier_id).update({
+        models.Supplier.order_count: func.coalesce(models.Supplier.order_count, 0) + 1,
+        models.Supplier.open_order_value: func.coalesce(models.Supplier.open_order_value, 0.0) + (order_value or 0.0),
+    }, synchronize_session=False)
+    outbox.record_changes(db, "suppliers", [supplier_id])
+
+def record_receipt(db: Session, po: models.PurchaseOrder, received_value: float, completed: bool):
+    """Take received value off the open order value; a PO that is now fully received adds its lead time and on-time result"""
+    if po.supplier_id is None:
+        return
+    values = {
+        models.Supplier.open_order_value: func.coalesce(models.Supplier.open_order_value, 0.0) - (received_value or 0.0),
+    }
+    if completed and po.received_at is not None:
+        on_time = is_on_time(po.received_at, po.expected_delivery_date)
+        values.update({
+            models.Supplier.received_order_count: func.coalesce(models.Supplier.received_order_count, 0) + 1,
+            models.Supplier.total_lead_time_days: func.coalesce(models.Supplier.total_lead_time_days, 0.0) + lead_time_days(po.created_at, po.received_at),
+            models.Supplier.rated_order_count: func.coalesce(models.Supplier.rated_order_count, 0) + (0 if on_time is None else 1),
+            models.Supplier.on_time_count: func.coalesce(models.Supplier.on_time_count, 0) + (1 if on_time else 0),
+            models.Supplier.last_received_at: po.received_at,
+        })
+    db.query(models.Supplier).filter(models.Supplier.id == po.supplier_id).update(values, synchronize_session=False)
+    outbox.record_changes(db, "suppliers", [po.supplier_id])
+
+def rebuild_supplier_stats(bind):
+    """Recompute every supplier's rollups from its purchase orders (bind: a Connection or Session)"""
+    po = models.PurchaseOrder.__table__
+    line = models.PurchaseOrderItem.__table__
+    supplier = models.Supplier.__table__
+
+    open_value = dict(bind.execute(
+        select(
+            line.c.purchase_order_id,
+            func.sum((line.c.quantity - func.coalesce(line.c.received_quantity, 0)) * line.c.unit_price)
+        ).group_by(line.c.purchase_order_id)
+    ).all())
+
+    stats = {
+        supplier_id: {
+            "b_id": supplier_id, "order_count": 0, "received_order_count": 0, "total_lead_time_days": 0.0,
+            "on_time_count": 0, "rated_order_count": 0, "open_order_value": 0.0, "last_received_at": None,
+        }
+        for (supplier_id,) in bind.execute(select(supplier.c.id)).all()
+    }
+    rows = bind.execute(select(
+        po.c.id, po.c.supplier_id, po.c.status, po.c.created_at, po.c.received_at, po.c.expected_delivery_date
+    ).where(po.c.supplier_id.isnot(None))).all()
+    for po_id, supplier_id, status, created_at, received_at, expected in rows:
+        entry = stats.get(supplier_id)
+        if entry is None:
+            continue
+        entry["order_count"] += 1
+        if status != "Cancelled":
+            entry["open_order_value"] += max(open_value.get(po_id) or 0.0, 0.0)
+        if status == "Received" and received_at is not None and created_at is not None:
+            entry["received_order_count"] += 1
+            entry["total_lead_time_days"] += lead_time_days(created_at, received_at)
+            on_time = is_on_time(received_at, expected)
+            if on_time is not None:
+                entry["rated_order_count"] += 1
+                entry["on_time_count"] += 1 if on_time else 0
+            if entry["last_received_at"] is None or _naive(received_at) > _naive(entry["last_received_at"]):
+                entry["last_received_at"] = received_at
+
+    if stats:
+        columns = [name for name in next(iter(stats.values())) if name != "b_id"]
+        bind.execute(
+            update(supplier).where(supplier.c.id == bindparam("b_id")).values({name: bindparam(name) for name in columns}),
+            list(stats.values())
+        )
+    return len(stats)
+
+def backfill_suppliers(bind):
+    """Create a supplier for every distinct PO supplier_name, link the orders and compute the rollups"""
+    po = models.PurchaseOrder.__table__
+    supplier = models.Supplier.__table__
+
+    ids = {name_key(name): supplier_id for supplier_id, name in bind.execute(select(supplier.c.id, supplier.c.name)).all()}
+    raw_names = [name for (name,) in bind.execute(
+        select(po.c.supplier_name).where(po.c.supplier_id.is_(None), po.c.supplier_name.isnot(None)).distinct()
+    ).all()]
+
+    links = []
+    for raw_name in raw_names:
+        key = name_key(raw_name)
+        if not key:
+            continue
+        if key not in ids:
+            ids[key] = bind.execute(supplier.insert().values(
+                name=normalize_name(raw_name), name_key=key, created_at=datetime.now(pytz.timezone('Asia/Kolkata'))
+            )).inserted_primary_key[0]
+        links.append({"b_name": raw_name, "b_id": ids[key]})
+
+    if links:
+        bind.execute(
+            update(po).where(po.c.supplier_name == bindparam("b_name"), po.c.supplier_id.is_(None)).values(supplier_id=bindparam("b_id")),
+            links
+        )
+    rebuild_supplier_stats(bind)
+    return len(links)
+
+def backfill_name_keys(bind):
+    """Fill suppliers.name_key, merging suppliers whose names differ only in case or spacing into the
+    oldest one (their orders are relinked), then recompute the rollups; returns the number merged"""
+    po = models.PurchaseOrder.__table__
+    supplier = models.Supplier.__table__
+
+    keep, merged, keys = {}, [], []
+    for supplier_id, name in bind.execute(select(supplier.c.id, supplier.c.name).order_by(supplier.c.id)).all():
+        key = name_key(name)
+        if key in keep:
+            merged.append({"b_from": supplier_id, "b_to": keep[key]})
+        else:
+            keep[key] = supplier_id
+            keys.append({"b_id": supplier_id, "b_key": key})
+
+    if merged:
+        bind.execute(update(po).where(po.c.supplier_id == bindparam("b_from")).values(supplier_id=bindparam("b_to")), merged)
+        bind.execute(supplier.delete().where(supplier.c.id.in_([row["b_from"] for row in merged])))
+    if keys:
+        bind.execute(update(supplier).where(supplier.c.id == bindparam("b_id")).values(name_key=bindparam("b_key")), keys)
+    rebuild_supplier_stats(bind)
+    return len(merged)
+
+def get_suppliers(db: Session, skip: int = 0, limit: int = 100, sort: str = "name"):
+    """Supplier scorecards; every figure is read from the rollup columns"""
+    return db.query(models.Supplier).order_by(SCORECARD_ORDER[sort], models.Supplier.id).offset(skip).limit(limit).all()
+
+def get_supplier(db: Session, supplier_id: int):
+    return db.query(models.Supplier).filter(models.Supplier.id == supplier_id).first()
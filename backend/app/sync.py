@@ -0,0 +1,203 @@
+from sqlalchemy import event, select, update, func
+from sqlalchemy.orm import Session, joinedload
+from itertools import chain
+from typing import Iterable
+from . import models, schemas
+from .database import dialect_insert
+from .rollups import local_now
+import os
+
+SYNC_BATCH_SIZE = int(os.getenv("SYNC_BATCH_SIZE", "1000"))
+SYNC_MAX_BATCH_SIZE = 10000
+
+# The one counter every synced write takes its version from (a row in cache_versions).
+# Updating it holds a row lock until commit, so versions are handed out in commit order.
+CLOCK_NAME = "sync"
+
+# Synced entities that also keep a counter of their own (cache_versions row "sync:<entity>"),
+# advanced once per transaction that writes them, for caches that must not be invalidated
+# by every stock movement (the purchase order list counts)
+ENTITY_CLOCKS = {"purchase_orders"}
+
+# Entities a client keeps offline; a write to a child row bumps its parent's version
+SYNCED_MODELS = {
+    "items": models.Item,
+    "purchase_orders": models.PurchaseOrder,
+    "requirements": models.Requirement,
+}
+
+def _parent(obj):
+    """(synced table, id) whose version a write to obj changes, or None"""
+    if isinstance(obj, (models.Item, models.PurchaseOrder, models.Requirement)):
+        return type(obj).__tablename__, obj.id
+    if isinstance(obj, models.Stock):
+        return "items", obj.item_id
+    if isinstance(obj, (models.PurchaseOrderItem, models.Invoice)):
+        return "purchase_orders", obj.purchase_order_id
+    if isinstance(obj, models.RequirementItem):
+        return "requirements", obj.requirement_id
+    return None
+
+# Child tables written by bulk statements: table -> (synced table, parent key column)
+_CHILD_PARENTS = {
+    "stock": ("items", None),  # Change records for stock are keyed by item_id already
+    "purchase_order_items": ("purchase_orders", models.PurchaseOrderItem.__table__.c.purchase_order_id),
+    "invoices": ("purchase_orders", models.Invoice.__table__.c.purchase_order_id),
+    "requirement_items": ("requirements", models.RequirementItem.__table__.c.requirement_id),
+}
+
+def current_version(bind):
+    table = models.CacheVersion.__table__
+    return bind.execute(select(table.c.version).where(table.c.name == CLOCK_NAME)).scalar() or 0
+
+def _set_clock(conn, version: int):
+    table = models.CacheVersion.__table__
+    if conn.execute(update(table).where(table.c.name == CLOCK_NAME).values(version=version)).rowcount == 0:
+        conn.execute(table.insert().values(name=CLOCK_NAME, version=version))
+
+def backfill_versions(bind):
+    """Version unversioned rows by their id (so a first sync pages evenly) and move the clock past them"""
+    version = current_version(bind)
+    for model in SYNCED_MODELS.values():
+        table = model.__table__
+        bind.execute(update(table).where(func.coalesce(table.c.sync_version, 0) == 0).values(sync_version=table.c.id))
+        version = max(version, bind.execute(select(func.max(table.c.sync_version))).scalar() or 0)
+    _set_clock(bind, version)
+
+def entity_version(bind, entity: str):
+    """Counter of one of the ENTITY_CLOCKS; moves only when that entity is written"""
+    table = models.CacheVersion.__table__
+    return bind.execute(select(table.c.version).where(table.c.name == f"{CLOCK_NAME}:{entity}")).scalar() or 0
+
+def _advance(conn, name: str):
+    table = models.CacheVersion.__table__
+    stmt = dialect_insert(table)
+    if stmt is not None:
+        conn.execute(stmt.values(name=name, version=1).on_conflict_do_update(
+            index_elements=["name"], set_={"version": table.c.version + 1}
+        ))
+    elif conn.execute(update(table).where(table.c.name == name).values(version=table.c.version + 1)).rowcount == 0:
+        conn.execute(table.insert().values(name=name, version=1))
+
+def _transaction_version(session: Session):
+    """Advance the clock once per transaction and reuse that version for all its writes"""
+    version = session.info.get("sync_version")
+    if version is not None:
+        return version
+    conn = session.connection()
+    _advance(conn, CLOCK_NAME)
+    version = session.info["sync_version"] = current_version(conn)
+    return version
+
+def _advance_entity_clocks(session: Session, entities):
+    advanced = session.info.setdefault("sync_entity_clocks", set())
+    for entity in sorted((set(entities) & ENTITY_CLOCKS) - advanced):
+        _advance(session.connection(), f"{CLOCK_NAME}:{entity}")
+        advanced.add(entity)
+
+def _stamp(session: Session, touched: dict, deleted: Iterable = ()):
+    deleted = list(deleted)
+    if not any(touched.values()) and not deleted:
+        return
+    version = _transaction_version(session)
+    _advance_entity_clocks(session, [name for name, ids in touched.items() if ids] + [entity for entity, _ in deleted])
+    conn = session.connection()
+    for table_name, ids in touched.items():
+        if ids:
+            table = SYNCED_MODELS[table_name].__table__
+            conn.execute(update(table).where(table.c.id.in_(sorted(ids))).values(sync_version=version))
+    if deleted:
+        conn.execute(models.SyncTombstone.__table__.insert(), [
+            {"entity": entity, "entity_id": entity_id, "sync_version": version, "deleted_at": local_now()}
+            for entity, entity_id in deleted
+        ])
+
+def touch(db: Session, entity: str, entity_ids: Iterable[int]):
+    """For writes that bypass the ORM: bump the version of the synced rows behind entity_ids"""
+    entity_ids = sorted(set(entity_ids))
+    if not entity_ids:
+        return
+    if entity in SYNCED_MODELS:
+        _stamp(db, {entity: set(entity_ids)})
+        return
+    parent = _CHILD_PARENTS.get(entity)
+    if parent is None:
+        return
+    parent_table, parent_column = parent
+    if parent_column is None:
+        parent_ids = set(entity_ids)
+    else:
+        parent_ids = {row[0] for row in db.connection().execute(
+            select(parent_column).where(parent_column.table.c.id.in_(entity_ids)).distinct()
+        )}
+    _stamp(db, {parent_table: parent_ids})
+
+@event.listens_for(Session, "after_flush")
+def _version_flushed_rows(session, flush_context):
+    touched = {name: set() for name in SYNCED_MODELS}
+    deleted = []
+    for obj in chain(session.new, session.dirty, session.deleted):
+        parent = _parent(obj)
+        if parent is None or parent[1] is None:
+            continue
+        if obj in session.deleted and type(obj).__tablename__ == parent[0]:
+            deleted.append(parent)
+        elif obj not in session.dirty or session.is_modified(obj, include_collections=False):
+            touched[parent[0]].add(parent[1])
+    for entity, entity_id in deleted:
+        touched[entity].discard(entity_id)
+    _stamp(session, touched, deleted)
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _end_sync_transaction(session):
+    session.info.pop("sync_version", None)
+    session.info.pop("sync_entity_clocks", None)
+
+# Reading
+def _sources():
+    from .crud import PURCHASE_ORDER_LOAD, REQUIREMENT_LOAD
+    return {
+        "items": (models.Item, (joinedload(models.Item.stock),)),
+        "purchase_orders": (models.PurchaseOrder, PURCHASE_ORDER_LOAD),
+        "requirements": (models.Requirement, REQUIREMENT_LOAD),
+        "deleted": (models.SyncTombstone, ()),
+    }
+
+def get_delta(db: Session, since: int = 0, limit: int = SYNC_BATCH_SIZE):
+    """Rows created or changed and tombstones written after `since`, cut at a version boundary.
+
+    When a list is longer than `limit`, every list is trimmed to the versions below the first
+    row that did not fit, so resuming from the returned version never skips a row.
+    """
+    version = current_version(db)
+    sources = _sources()
+    changes = {
+        name: db.query(model).options(*options).filter(model.sync_version > since).order_by(
+            model.sync_version, model.id
+        ).limit(limit + 1).all()
+        for name, (model, options) in sources.items()
+    }
+
+    overflow = [rows[limit].sync_version for rows in changes.values() if len(rows) > limit]
+    if overflow:
+        version = min(overflow) - 1
+        if version <= since:
+            # One transaction wrote more than `limit` rows to a list: send that version whole
+            version = min(overflow)
+            for name, rows in changes.items():
+                if len(rows) > limit and rows[limit].sync_version == version:
+                    model, options = sources[name]
+                    changes[name] = db.query(model).options(*options).filter(
+                        model.sync_version == version
+                    ).order_by(model.id).all()
+        changes = {name: [row for row in rows if row.sync_version <= version] for name, rows in changes.items()}
+
+    return {
+        "version": version,
+        "has_more": bool(overflow),
+        "items": [schemas.Item.model_validate(row) for row in changes["items"]],
+        "purchase_orders": [schemas.PurchaseOrder.model_validate(row) for row in changes["purchase_orders"]],
+        "requirements": [schemas.Requirement.model_validate(row) for row in changes["requirements"]],
+        "deleted": [{"entity": row.entity, "id": row.entity_id} for row in changes["deleted"]],
+    }
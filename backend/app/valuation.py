@@ -0,0 +1,139 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from typing import Optional
+from . import models
+import os
+
+# "fifo" consumes the oldest cost layers first, "average" issues at the moving-average cost
+# (kept on ItemValuation alone, including negative on-hand at the last average cost)
+VALUATION_METHOD = os.getenv("VALUATION_METHOD", "fifo").lower()
+
+def _get_valuation(db: Session, item_id: int):
+    # Row lock on databases that support it; SQLite already serializes writers
+    valuation = db.query(models.ItemValuation).filter(models.ItemValuation.item_id == item_id).with_for_update().first()
+    if valuation is None:
+        valuation = models.ItemValuation(item_id=item_id, quantity=0, total_value=0.0, average_cost=0.0)
+        db.add(valuation)
+        db.flush()
+    return valuation
+
+def _refresh_average(valuation: models.ItemValuation):
+    if valuation.quantity > 0:
+        valuation.average_cost = valuation.total_value / valuation.quantity
+    elif VALUATION_METHOD == "average" and valuation.quantity < 0:
+        # Issued ahead of its receipt: the shortfall stays on the books at the last average cost
+        # and the receipt that covers it is averaged against it
+        valuation.total_value = valuation.quantity * (valuation.average_cost or 0.0)
+    else:
+        valuation.quantity = 0
+        valuation.total_value = 0.0
+
+def _fallback_cost(db: Session, item_id: int, valuation: models.ItemValuation):
+    """Unit cost for stock that never came in through a receipt (opening balance, manual adjustment)"""
+    if valuation.average_cost:
+        return valuation.average_cost
+    item = db.query(models.Item).filter(models.Item.id == item_id).first()
+    return (item.unit_price if item else 0.0) or 0.0
+
+def current_average_cost(db: Session, item_id: int):
+    valuation = db.query(models.ItemValuation).filter(models.ItemValuation.item_id == item_id).first()
+    return valuation.average_cost if valuation else 0.0
+
+def add_layer(db: Session, item_id: int, quantity: int, unit_cost: float, purchase_order_id: Optional[int] = None):
+    """Record a receipt as a new cost layer and add its value to the item's running valuation.
+    Under "average" only the running valuation is kept; no layer is created."""
+    if quantity <= 0:
+        return None
+    unit_cost = unit_cost or 0.0
+    if VALUATION_METHOD == "average":
+        valuation = _get_valuation(db, item_id)
+        valuation.quantity = (valuation.quantity or 0) + quantity
+        valuation.total_value = (valuation.total_value or 0.0) + quantity * unit_cost
+        _refresh_average(valuation)
+        return None
+    layer = models.CostLayer(
+        item_id=item_id,
+        purchase_order_id=purchase_order_id,
+        quantity=quantity,
+        remaining_quantity=quantity,
+        unit_cost=unit_cost
+    )
+    db.add(layer)
+
+    valuation = _get_valuation(db, item_id)
+    valuation.quantity = (valuation.quantity or 0) + quantity
+    valuation.total_value = (valuation.total_value or 0.0) + quantity * unit_cost
+    _refresh_average(valuation)
+    return layer
+
+def consume(db: Session, item_id: int, quantity: int):
+    """Cost an issue and take it off the item's valuation: "fifo" consumes cost layers oldest-first,
+    "average" issues at the moving-average cost without touching layers"""
+    if quantity <= 0:
+        return 0.0
+    db.flush()
+    valuation = _get_valuation(db, item_id)
+
+    if VALUATION_METHOD == "average":
+        # Nothing on hand: issue at the last average cost (the item price if there never was one)
+        unit_cost = (valuation.average_cost or 0.0) if (valuation.quantity or 0) > 0 else _fallback_cost(db, item_id, valuation)
+        cost = quantity * unit_cost
+        valuation.average_cost = unit_cost
+        valuation.quantity = (valuation.quantity or 0) - quantity
+        valuation.total_value = (valuation.total_value or 0.0) - cost
+        _refresh_average(valuation)
+        return cost
+
+    layers = db.query(models.CostLayer).filter(
+        models.CostLayer.item_id == item_id,
+        models.CostLayer.remaining_quantity > 0
+    ).order_by(models.CostLayer.id).with_for_update().all()
+
+    cost = 0.0
+    outstanding = quantity
+    for layer in layers:
+        if outstanding <= 0:
+            break
+        taken = min(layer.remaining_quantity, outstanding)
+        layer.remaining_quantity -= taken
+        cost += taken * layer.unit_cost
+        outstanding -= taken
+
+    if outstanding > 0:
+        cost += outstanding * _fallback_cost(db, item_id, valuation)
+
+    valuation.quantity = (valuation.quantity or 0) - quantity
+    valuation.total_value = (valuation.total_value or 0.0) - cost
+    _refresh_average(valuation)
+    return cost
+
+def seed_opening_layers(db: Session):
+    """Create an opening layer at Item.unit_price for stocked items that have no valuation yet"""
+    rows = db.query(models.Item, models.Stock.current_quantity).join(
+        models.Stock, models.Stock.item_id == models.Item.id
+    ).outerjoin(
+        models.ItemValuation, models.ItemValuation.item_id == models.Item.id
+    ).filter(
+        models.ItemValuation.id.is_(None),
+        models.Stock.current_quantity > 0
+    ).all()
+    for item, quantity in rows:
+        add_layer(db, item_id=item.id, quantity=quantity, unit_cost=item.unit_price)
+    db.commit()
+    return len(rows)
+
+def get_inventory_valuation(db: Session, skip: int = 0, limit: int = 100):
+    """Total stock value from the precomputed per-item valuations"""
+    total_quantity, total_value = db.query(
+        func.coalesce(func.sum(models.ItemValuation.quantity), 0),
+        func.coalesce(func.sum(models.ItemValuation.total_value), 0.0)
+    ).one()
+    items = db.query(models.ItemValuation).order_by(
+        models.ItemValuation.item_id
+    ).offset(skip).limit(limit).all()
+    return {
+        "method": VALUATION_METHOD,
+        "total_quantity": total_quantity,
+        "total_value": total_value,
+        "items": items
+    }
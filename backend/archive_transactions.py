@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Move old transactions out of the hot ledger into the archive table.
+Rows are moved in small batches, each committed on its own, so issues and receipts
+are never blocked for long. Set LEDGER_ARCHIVE_PATH to keep the archive in a separate
+SQLite file (attached to every connection as "archive").
+"""
+
+import argparse
+from app.database import SessionLocal
+from app import migrations, archive
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive old ledger transactions")
+    parser.add_argument("--days", type=int, default=archive.ARCHIVE_AFTER_DAYS, help="archive transactions older than this many days")
+    parser.add_argument("--batch-size", type=int, default=archive.ARCHIVE_BATCH_SIZE, help="rows moved per commit")
+    parser.add_argument("--pause", type=float, default=0.05, help="seconds to sleep between batches")
+    args = parser.parse_args()
+
+    migrations.require_schema()
+    db = SessionLocal()
+    try:
+        cutoff = archive.archive_cutoff(args.days)
+        print(f"Archiving transactions created before {cutoff:%Y-%m-%d %H:%M}...")
+        moved = archive.archive_transactions(db, older_than=cutoff, batch_size=args.batch_size, pause=args.pause)
+        print(f"✓ {moved} transactions archived")
+    finally:
+        db.close()
@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+"""
+Rebuild the per-item daily movement rollups from the existing transaction ledger.
+Run this once after upgrading (and any time the rollups need to be recomputed).
+"""
+
+from app.database import SessionLocal
+from app import migrations, rollups
+
+if __name__ == "__main__":
+    print("Rebuilding daily movement rollups...")
+    migrations.require_schema()
+    db = SessionLocal()
+    try:
+        rows = rollups.rebuild_daily_movements(db)
+        print(f"✓ {rows} item/day rollup rows written")
+    finally:
+        db.close()
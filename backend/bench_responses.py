@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Response encoding benchmark for the big list endpoints.
+
+Seeds a fresh SQLite database, then measures for each response mode, in its own interpreter
+(the mode is read from the environment when the app is imported):
+  - CPU time per request (process time, server and client share the in-process TestClient)
+  - bytes on the wire for identity, gzip and brotli (when installed) encodings
+
+Modes: "default" (response_model + jsonable_encoder), "fast" (FAST_RESPONSES=1) and
+"fast+compression" (adds RESPONSE_COMPRESSION_MIN_BYTES=1024).
+
+    python bench_responses.py
+    python bench_responses.py --items 20000 --orders 2000 --limit 1000 --runs 20 --json responses.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ENDPOINTS = ["/stock/items", "/purchase-orders/", "/requirements/", "/sync"]
+MODES = {
+    "default": {"FAST_RESPONSES": "0", "RESPONSE_COMPRESSION_MIN_BYTES": "0"},
+    "fast": {"FAST_RESPONSES": "1", "RESPONSE_COMPRESSION_MIN_BYTES": "0"},
+    "fast+compression": {"FAST_RESPONSES": "1", "RESPONSE_COMPRESSION_MIN_BYTES": "1024"},
+}
+
+def seed(items, orders, requirements):
+    from app import migrations, schemas, crud
+    from app.database import SessionLocal
+
+    migrations.upgrade(log=lambda message: None)
+    db = SessionLocal()
+    try:
+        crud.bulk_upsert_items(db, [
+            schemas.ItemCreate(name=f"Bench item {index}", code=f"BENCH-{index:06d}", description="Benchmark item",
+                               unit_price=index % 97 + 0.5, minimum_stock=index % 10)
+            for index in range(items)
+        ])
+        for index in range(orders):
+            crud.create_purchase_order(db, schemas.PurchaseOrderCreate(
+                supplier_name=f"Supplier {index % 25}",
+                expected_delivery_date="2030-01-01T00:00:00",
+                items=[schemas.PurchaseOrderItemCreate(item_id=(index * 7 + line) % items + 1, quantity=10, unit_price=2.5) for line in range(5)],
+            ))
+        for index in range(requirements):
+            crud.create_requirement(db, schemas.RequirementCreate(
+                project_name=f"Bench project {index}",
+                items=[schemas.RequirementItemCreate(item_id=(index * 11 + line) % items + 1, quantity_needed=1) for line in range(5)],
+            ))
+    finally:
+        db.close()
+
+def run_mode(args):
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    client = TestClient(app)
+    encodings = ["identity", "gzip"]
+    try:
+        import brotli  # noqa: F401
+        encodings.append("br")
+    except ImportError:
+        pass
+
+    results = []
+    for endpoint in ENDPOINTS:
+        url = f"{endpoint}?limit={args.limit}"
+        client.get(url, headers={"Accept-Encoding": "identity"})  # Warm up
+        samples = []
+        for _ in range(args.runs):
+            started = time.process_time()
+            response = client.get(url, headers={"Accept-Encoding": "identity"})
+            samples.append(time.process_time() - started)
+            response.raise_for_status()
+        sizes = {}
+        for encoding in encodings:
+            # httpx decodes the body, so read the encoded size from Content-Length
+            response = client.get(url, headers={"Accept-Encoding": encoding})
+            sizes[encoding] = int(response.headers.get("content-length", len(response.content)))
+        results.append({
+            "endpoint": endpoint,
+            "cpu_ms_median": round(statistics.median(samples) * 1000, 2),
+            "cpu_ms_min": round(min(samples) * 1000, 2),
+            "bytes": sizes,
+        })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON encoding and compression of the list endpoints")
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--orders", type=int, default=500)
+    parser.add_argument("--requirements", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=500, help="rows per list request")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--run-mode", help=argparse.SUPPRESS)
+    parser.add_argument("--seed-only", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.seed_only:
+        seed(args.items, args.orders, args.requirements)
+        return 0
+    if args.run_mode:
+        print(json.dumps(run_mode(args)))
+        return 0
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    reports = {}
+    with tempfile.TemporaryDirectory() as directory:
+        base_env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(directory, 'bench.db')}", ITEM_CACHE_WARM="0")
+        base_env.pop("LEDGER_ARCHIVE_PATH", None)
+        print(f"Seeding {args.items} items, {args.orders} purchase orders, {args.requirements} requirements...")
+        subprocess.run([sys.executable, __file__, "--seed-only", "--items", str(args.items), "--orders", str(args.orders),
+                        "--requirements", str(args.requirements)], env=base_env, check=True, cwd=here)
+        for mode, overrides in MODES.items():
+            command = [sys.executable, __file__, "--run-mode", mode, "--limit", str(args.limit), "--runs", str(args.runs)]
+            output = subprocess.run(command, env=dict(base_env, **overrides), check=True, capture_output=True,
+                                    text=True, cwd=here).stdout
+            reports[mode] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"{'mode':<18}{'endpoint':<20}{'cpu ms':>9}{'identity':>11}{'gzip':>10}{'br':>10}")
+    for mode, results in reports.items():
+        for result in results:
+            sizes = result["bytes"]
+            print(f"{mode:<18}{result['endpoint']:<20}{result['cpu_ms_median']:>9}{sizes['identity']:>11}"
+                  f"{sizes['gzip']:>10}{sizes.get('br', '-'):>10}")
+
+    if args.json:
+        with open(args.json, "w") as handle:
+            json.dump(reports, handle, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Startup-time benchmark for the API.
+
+Measures, in fresh interpreter processes:
+  - import time of app.main
+  - time from spawning a uvicorn worker to its first successful request (/ready)
+
+Run `python manage.py migrate` first so /ready can succeed.
+
+    python bench_startup.py --runs 5
+    python bench_startup.py --runs 10 --json startup.json
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+import urllib.error
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+
+def measure_import():
+    output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], check=True, capture_output=True, text=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def measure_first_request(timeout=30.0):
+    port = free_port()
+    started = time.perf_counter()
+    worker = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except (urllib.error.URLError, ConnectionError, OSError):
+                time.sleep(0.01)
+        raise RuntimeError(f"worker did not become ready within {timeout}s")
+    finally:
+        worker.terminate()
+        worker.wait()
+
+def summarize(name, samples):
+    return {
+        "metric": name,
+        "runs": len(samples),
+        "median_ms": round(statistics.median(samples) * 1000, 1),
+        "min_ms": round(min(samples) * 1000, 1),
+        "max_ms": round(max(samples) * 1000, 1),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure API import time and time-to-first-request")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    results = [
+        summarize("import app.main", [measure_import() for _ in range(args.runs)]),
+        summarize("spawn to first request", [measure_first_request() for _ in range(args.runs)]),
+    ]
+    for result in results:
+        print(f"{result['metric']:<24} median {result['median_ms']:>8} ms   min {result['min_ms']:>8} ms   max {result['max_ms']:>8} ms   ({result['runs']} runs)")
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(results, fh, indent=2)
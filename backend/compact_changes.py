@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+Compact the change feed outbox.
+Records older than the retention window are reduced to the newest record per entity,
+so consumers that fall behind (or start from seq 0) still see every row's latest change.
+Run it from cron; it is safe while the API is serving.
+"""
+
+import argparse
+from datetime import timedelta
+from app.database import SessionLocal
+from app import migrations, outbox, rollups
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact the /changes outbox")
+    parser.add_argument("--days", type=int, default=outbox.CHANGE_RETENTION_DAYS, help="keep full history for this many days")
+    args = parser.parse_args()
+
+    migrations.require_schema()
+    db = SessionLocal()
+    try:
+        cutoff = rollups.local_now() - timedelta(days=args.days)
+        print(f"Compacting change records created before {cutoff:%Y-%m-%d %H:%M}...")
+        removed = outbox.compact_changes(db, older_than=cutoff)
+        print(f"✓ {removed} change records removed")
+    finally:
+        db.close()
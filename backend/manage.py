@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Database management commands.
+
+    python manage.py migrate   Create missing tables and apply pending migrations
+    python manage.py check     Exit non-zero if the database schema is not current
+
+The API no longer creates or alters tables when it starts; run `migrate` after
+installing or upgrading, before starting the server.
+"""
+
+import argparse
+import sys
+from app import migrations
+
+def migrate(args):
+    print("Migrating database schema...")
+    version = migrations.upgrade()
+    print(f"✓ Schema is at version {version}")
+
+def check(args):
+    ready, version, expected = migrations.check_schema()
+    if ready:
+        print(f"✓ Schema is at version {version}")
+        return 0
+    print(f"✗ Schema version is {version}, expected {expected}. Run: python manage.py migrate")
+    return 1
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inventory database management")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    subcommands.add_parser("migrate", help="create tables and apply pending migrations").set_defaults(func=migrate)
+    subcommands.add_parser("check", help="verify the schema version without changing anything").set_defaults(func=check)
+    args = parser.parse_args()
+    sys.exit(args.func(args) or 0)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Reconcile the Stock table against the transaction ledger.
+The ledger (hot and archived) is replayed per item over contiguous item-id ranges on a
+process pool and the result is diffed against Stock.current_quantity. Drift is printed and,
+with --report, written to CSV. With --fix the drift is corrected in batches:
+
+    python reconcile_stock.py                         # report only
+    python reconcile_stock.py --report drift.csv
+    python reconcile_stock.py --fix                   # book Adjustment transactions (stock is right)
+    python reconcile_stock.py --fix --trust ledger    # reset stock to the ledger balance
+
+Run --fix when receipts and issues are quiet; balances are re-read per batch before writing.
+Items under an open stock-take are skipped and listed, as the count will settle them.
+"""
+
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from app.database import engine
+from app import migrations, reconcile
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay the ledger and reconcile stock")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="replay processes")
+    parser.add_argument("--partitions", type=int, help="item-id ranges (default: 4 per worker)")
+    parser.add_argument("--report", help="write the drift rows to this CSV file")
+    parser.add_argument("--fix", action="store_true", help="correct the drift")
+    parser.add_argument("--trust", choices=["stock", "ledger"], default="stock", help="which side is correct when fixing")
+    parser.add_argument("--batch-size", type=int, default=reconcile.RECONCILE_BATCH_SIZE, help="items corrected per commit")
+    args = parser.parse_args()
+
+    migrations.require_schema()
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        ranges = reconcile.partition_item_ids(conn, args.partitions or args.workers * 4)
+    engine.dispose()
+
+    print(f"Replaying ledger over {len(ranges)} item ranges on {args.workers} workers...")
+    drift = []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=reconcile.init_worker) as executor:
+        for rows in executor.map(reconcile.replay_partition, ranges):
+            drift.extend(rows)
+    print(f"✓ Replayed in {time.perf_counter() - started:.1f}s: {len(drift)} items drift from the ledger")
+
+    for row in drift[:20]:
+        print(f"  item {row['item_id']}: stock {row['stock_quantity']} vs ledger {row['ledger_quantity']} ({row['drift']:+d})")
+    if len(drift) > 20:
+        print(f"  ... {len(drift) - 20} more")
+
+    if args.report:
+        with open(args.report, "w", newline="") as handle:
+            writer = csv.DictWriter(handle, fieldnames=["item_id", "stock_quantity", "ledger_quantity", "drift"])
+            writer.writeheader()
+            writer.writerows(drift)
+        print(f"✓ Drift report written to {args.report}")
+
+    if args.fix and drift:
+        corrected, skipped = reconcile.apply_corrections(drift, trust=args.trust, batch_size=args.batch_size)
+        print(f"✓ {corrected} items corrected (trusting {args.trust})")
+        for row in skipped:
+            print(f"  ✗ item {row['item_id']} skipped: {row['reason']}")
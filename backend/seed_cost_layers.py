@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+"""
+Seed opening cost layers for existing stock.
+Items that already hold stock but have never been received through a purchase order
+get one opening layer valued at their Item.unit_price. Safe to run more than once.
+"""
+
+from app.database import SessionLocal
+from app import migrations, valuation
+
+if __name__ == "__main__":
+    print("Seeding opening cost layers...")
+    migrations.require_schema()
+    db = SessionLocal()
+    try:
+        seeded = valuation.seed_opening_layers(db)
+        print(f"✓ {seeded} items seeded (method: {valuation.VALUATION_METHOD})")
+    finally:
+        db.close()
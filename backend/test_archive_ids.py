@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Test script to verify that transaction ids are never reused after the hot ledger is archived.
+Runs against a throwaway SQLite database: archives everything, records one more transaction
+and archives again (which failed with a UNIQUE constraint error when ids were reused).
+"""
+
+import os
+import tempfile
+
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'archive_ids.db')}"
+
+from datetime import datetime, timedelta
+import pytz
+from app.database import SessionLocal
+from app import archive, crud, migrations, models
+
+def record(db, item_id, quantity):
+    transaction = crud.record_transaction(db, item_id=item_id, quantity=quantity, action="Adjustment")
+    db.commit()
+    return transaction.id
+
+def archive_everything(db):
+    return archive.archive_transactions(db, older_than=datetime.now(pytz.timezone('Asia/Kolkata')) + timedelta(days=1))
+
+def test_ids_not_reused():
+    """Archive the whole ledger, record another transaction and archive again"""
+    db = SessionLocal()
+    try:
+        item = models.Item(name="Archive test item", code="ARCHIVE-IDS")
+        db.add(item)
+        db.commit()
+        first_ids = [record(db, item.id, 5), record(db, item.id, -2)]
+        moved = archive_everything(db)
+        next_id = record(db, item.id, 1)
+        if next_id <= max(first_ids):
+            print(f"✗ Transaction id {next_id} reused after archiving ids {first_ids}")
+            return False
+        print(f"✓ Archived {moved} transactions; the next one got id {next_id}")
+
+        try:
+            moved = archive_everything(db)
+        except Exception as e:
+            print(f"✗ Second archive run failed: {e}")
+            return False
+        archived = [row[0] for row in db.query(models.ArchivedTransaction.id).order_by(models.ArchivedTransaction.id)]
+        if archived != first_ids + [next_id]:
+            print(f"✗ Archive holds ids {archived}, expected {first_ids + [next_id]}")
+            return False
+        print(f"✓ Second archive run moved {moved} transaction; archive ids {archived}")
+        return True
+    finally:
+        db.close()
+
+def main():
+    print("Testing transaction ids across archive runs...")
+    print("=" * 60)
+    migrations.upgrade(log=lambda message: None)
+
+    print("\n1. Archiving, recording and archiving again...")
+    success = test_ids_not_reused()
+
+    print("\n" + "=" * 60)
+    if success:
+        print("✓ All tests passed! Archived transaction ids are never reused.")
+    else:
+        print("✗ Some tests failed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Test script to verify Idempotency-Key replay, mismatch and release against a running backend.
+"""
+
+import requests
+import uuid
+
+BASE_URL = "http://localhost:8000"
+
+def create_item():
+    code = f"IDEM-{uuid.uuid4().hex[:8]}"
+    response = requests.post(f"{BASE_URL}/stock/items", json={"name": "Idempotency test item", "code": code, "unit_price": 10.0})
+    response.raise_for_status()
+    return response.json()
+
+def test_replay(item_id):
+    """The same key and body replays the stored response instead of applying it twice"""
+    key = uuid.uuid4().hex
+    first = requests.patch(f"{BASE_URL}/stock/{item_id}", json={"current_quantity": 5}, headers={"Idempotency-Key": key})
+    second = requests.patch(f"{BASE_URL}/stock/{item_id}", json={"current_quantity": 5}, headers={"Idempotency-Key": key})
+    if first.status_code == 200 and second.status_code == 200 and second.headers.get("Idempotent-Replayed") == "true":
+        print("✓ Retry with the same key was replayed")
+        return True
+    print(f"✗ Replay failed: {first.status_code}, {second.status_code}, {second.headers.get('Idempotent-Replayed')}")
+    return False
+
+def test_mismatch(item_id):
+    """Reusing a key with a different body is refused"""
+    key = uuid.uuid4().hex
+    requests.patch(f"{BASE_URL}/stock/{item_id}", json={"current_quantity": 6}, headers={"Idempotency-Key": key})
+    response = requests.patch(f"{BASE_URL}/stock/{item_id}", json={"current_quantity": 7}, headers={"Idempotency-Key": key})
+    if response.status_code == 422:
+        print("✓ Key reused with a different body was rejected")
+        return True
+    print(f"✗ Mismatch not detected: {response.status_code} {response.text}")
+    return False
+
+def test_release_on_conflict(item_id):
+    """A 409 (stock frozen by a stock-take) is not stored: the retry runs once the item is unfrozen"""
+    key = uuid.uuid4().hex
+    stock_take = requests.post(f"{BASE_URL}/stock-takes/", json={"name": "Idempotency test", "item_ids": [item_id]})
+    if stock_take.status_code != 200:
+        print(f"✗ Could not open a stock-take: {stock_take.status_code} {stock_take.text}")
+        return False
+    frozen = requests.patch(f"{BASE_URL}/stock/{item_id}", json={"current_quantity": 9}, headers={"Idempotency-Key": key})
+    requests.post(f"{BASE_URL}/stock-takes/{stock_take.json()['id']}/cancel")
+    retry = requests.patch(f"{BASE_URL}/stock/{item_id}", json={"current_quantity": 9}, headers={"Idempotency-Key": key})
+    if frozen.status_code == 409 and retry.status_code == 200 and retry.json()["current_quantity"] == 9 and "Idempotent-Replayed" not in retry.headers:
+        print("✓ Key was released after a 409; the retry was applied")
+        return True
+    print(f"✗ Release failed: {frozen.status_code}, {retry.status_code} {retry.text}")
+    return False
+
+def main():
+    print("Testing Idempotency-Key handling...")
+    print("=" * 60)
+    try:
+        item = create_item()
+    except requests.exceptions.ConnectionError:
+        print("✗ Could not connect to server. Make sure the backend is running.")
+        return
+    results = [test_replay(item["id"]), test_mismatch(item["id"]), test_release_on_conflict(item["id"])]
+    print("\n" + "=" * 60)
+    if all(results):
+        print("✓ All tests passed! Idempotency-Key handling is working correctly.")
+    else:
+        print("✗ Some tests failed")
+
+if __name__ == "__main__":
+    main()
@@ -33,6 +33,9 @@ call venv\Scripts\activate
 echo Installing Python dependencies...
 pip install -r requirements.txt
 
+echo Applying database migrations...
+python manage.py migrate
+
 echo.
 echo ⚡ Starting backend server in background...
 start "Backend Server" cmd /k "cd backend && call venv\Scripts\activate && uvicorn app.main:app --reload --host 0.0.0.0 --port 8000"
@@ -16,6 +16,9 @@ call venv\Scripts\activate
 echo Installing dependencies...
 pip install -r requirements.txt
 
+echo Applying database migrations...
+python manage.py migrate
+
 echo Starting FastAPI server...
 echo API will be available at: http://localhost:8000
 echo API docs will be available at: http://localhost:8000/docs